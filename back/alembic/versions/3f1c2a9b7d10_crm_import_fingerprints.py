@@ -0,0 +1,75 @@
+"""crm import fingerprints
+
+Revision ID: 3f1c2a9b7d10
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.import_keys import RowKeyer
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9b7d10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table: str) -> set[str]:
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана через create_all уже с новыми колонками
+    existing = _columns("crm_entries")
+    if "file_hash" not in existing:
+        op.add_column("crm_entries", sa.Column("file_hash", sa.String(), nullable=True))
+        op.create_index(op.f("ix_crm_entries_file_hash"), "crm_entries", ["file_hash"], unique=False)
+    if "row_key" not in existing:
+        op.add_column("crm_entries", sa.Column("row_key", sa.String(), nullable=True))
+        op.create_index(op.f("ix_crm_entries_row_key"), "crm_entries", ["row_key"], unique=False)
+    _backfill_row_keys()
+
+
+def _backfill_row_keys(batch_size: int = 5000) -> None:
+    """Ключи для уже импортированных строк, чтобы повторная загрузка их не дублировала."""
+    bind = op.get_bind()
+    entries = sa.table(
+        "crm_entries",
+        sa.column("id", sa.Integer),
+        sa.column("data", sa.JSON),
+        sa.column("filename", sa.String),
+        sa.column("row_key", sa.String),
+    )
+    update = entries.update().where(entries.c.id == sa.bindparam("_id")).values(row_key=sa.bindparam("row_key"))
+    # Нумерация повторов идёт по файлу через все пачки, поэтому ключи те же, что при импорте
+    keyers = {}
+    last_id = 0
+    while True:
+        # Читаем по batch_size строк, чтобы не держать всю таблицу в памяти
+        rows = bind.execute(
+            sa.select(entries.c.id, entries.c.data, entries.c.filename)
+            .where(entries.c.row_key.is_(None), entries.c.filename.isnot(None), entries.c.id > last_id)
+            .order_by(entries.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        pending = []
+        for row in rows:
+            row_key = keyers.setdefault(row.filename, RowKeyer(row.filename))
+            pending.append({"_id": row.id, "row_key": row_key(row.data or {})})
+        bind.execute(update, pending)
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_crm_entries_row_key"), table_name="crm_entries")
+    op.drop_column("crm_entries", "row_key")
+    op.drop_index(op.f("ix_crm_entries_file_hash"), table_name="crm_entries")
+    op.drop_column("crm_entries", "file_hash")
@@ -0,0 +1,92 @@
+"""crm typed columns
+
+Revision ID: 8b2d4e6f1a23
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.crm_fields import extract_typed_fields
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2d4e6f1a23'
+down_revision: Union[str, None] = '3f1c2a9b7d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Колонки этой ревизии (crm_fields.TYPED_COLUMNS со временем дополняется)
+TYPED_COLUMNS = (
+    "payment_date", "year", "month", "amount", "iin",
+    "normalized_fio", "email", "phone", "gender", "language",
+)
+
+COLUMN_TYPES = {
+    "payment_date": sa.DateTime(),
+    "year": sa.Integer(),
+    "month": sa.Integer(),
+    "amount": sa.Float(),
+    "iin": sa.String(),
+    "normalized_fio": sa.String(),
+    "email": sa.String(),
+    "phone": sa.String(),
+    "gender": sa.String(),
+    "language": sa.String(),
+}
+
+
+def _columns(table: str) -> set[str]:
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана через create_all уже с новыми колонками
+    existing = _columns("crm_entries")
+    for name in TYPED_COLUMNS:
+        if name not in existing:
+            op.add_column("crm_entries", sa.Column(name, COLUMN_TYPES[name], nullable=True))
+            op.create_index(op.f(f"ix_crm_entries_{name}"), "crm_entries", [name], unique=False)
+    _backfill_typed_columns()
+
+
+def _backfill_typed_columns(batch_size: int = 5000) -> None:
+    """Заполняет типизированные колонки для уже импортированных строк."""
+    bind = op.get_bind()
+    entries = sa.table(
+        "crm_entries",
+        sa.column("id", sa.Integer),
+        sa.column("data", sa.JSON),
+        *(sa.column(name, COLUMN_TYPES[name]) for name in TYPED_COLUMNS),
+    )
+    update = (
+        entries.update()
+        .where(entries.c.id == sa.bindparam("_id"))
+        .values(**{name: sa.bindparam(name) for name in TYPED_COLUMNS})
+    )
+    last_id = 0
+    while True:
+        # Читаем по batch_size строк, чтобы не держать всю таблицу в памяти
+        rows = bind.execute(
+            sa.select(entries.c.id, entries.c.data)
+            .where(entries.c.id > last_id)
+            .order_by(entries.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        pending = []
+        for row in rows:
+            fields = extract_typed_fields(row.data)
+            pending.append({"_id": row.id, **{name: fields[name] for name in TYPED_COLUMNS}})
+        bind.execute(update, pending)
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    for name in reversed(TYPED_COLUMNS):
+        op.drop_index(op.f(f"ix_crm_entries_{name}"), table_name="crm_entries")
+        op.drop_column("crm_entries", name)
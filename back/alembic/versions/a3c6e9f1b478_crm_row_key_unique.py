@@ -0,0 +1,95 @@
+"""crm row key unique
+
+Revision ID: a3c6e9f1b478
+Revises: f7b1d3e5a902
+Create Date: 2026-10-21 10:00:00.000000
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.import_keys import HASH_PREFIX, scoped_key
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c6e9f1b478'
+down_revision: Union[str, None] = 'f7b1d3e5a902'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX = "ix_crm_entries_row_key"
+# Хэш-ключ без имени файла: "hash:<sha1>" и, возможно, "#<номер повтора>"
+_UNSCOPED = re.compile(r"hash:[0-9a-f]{40}(#\d+)?")
+
+entries = sa.table(
+    "crm_entries",
+    sa.column("id", sa.Integer),
+    sa.column("filename", sa.String),
+    sa.column("row_key", sa.String),
+)
+
+
+def _row_key_index() -> dict | None:
+    for index in sa.inspect(op.get_bind()).get_indexes("crm_entries"):
+        if index["name"] == INDEX:
+            return index
+    return None
+
+
+def upgrade() -> None:
+    index = _row_key_index()
+    # Индекс мог быть создан create_all уже уникальным
+    if index is not None and index["unique"]:
+        return
+    _scope_hash_keys()
+    _drop_duplicate_keys()
+    if index is not None:
+        op.drop_index(INDEX, table_name="crm_entries")
+    op.create_index(INDEX, "crm_entries", ["row_key"], unique=True)
+
+
+def _scope_hash_keys(batch_size: int = 5000) -> None:
+    """Привязывает хэш-ключи к имени файла: одинаковые строки разных файлов больше не совпадают."""
+    bind = op.get_bind()
+    update = entries.update().where(entries.c.id == sa.bindparam("_id")).values(row_key=sa.bindparam("row_key"))
+    last_id = 0
+    while True:
+        # Читаем по batch_size строк, чтобы не держать всю таблицу в памяти
+        rows = bind.execute(
+            sa.select(entries.c.id, entries.c.filename, entries.c.row_key)
+            .where(entries.c.row_key.like(HASH_PREFIX + "%"), entries.c.filename.isnot(None), entries.c.id > last_id)
+            .order_by(entries.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        pending = [
+            {"_id": row.id, "row_key": scoped_key(row.row_key, row.filename)}
+            for row in rows
+            if _UNSCOPED.fullmatch(row.row_key)
+        ]
+        if pending:
+            bind.execute(update, pending)
+        last_id = rows[-1].id
+
+
+def _drop_duplicate_keys() -> None:
+    """Повторы ключа (одновременные импорты) теряют ключ, за ним остаётся самая ранняя строка."""
+    earlier = entries.alias("earlier")
+    op.get_bind().execute(
+        entries.update()
+        .where(
+            entries.c.row_key.isnot(None),
+            sa.exists().where(earlier.c.row_key == entries.c.row_key, earlier.c.id < entries.c.id),
+        )
+        .values(row_key=None)
+    )
+
+
+def downgrade() -> None:
+    # Ключи остаются привязанными к файлам: импорт старой версии их просто не найдёт
+    op.drop_index(INDEX, table_name="crm_entries")
+    op.create_index(INDEX, "crm_entries", ["row_key"], unique=False)
@@ -0,0 +1,82 @@
+"""import batches
+
+Revision ID: a7d4c1e8f652
+Revises: f3c8d2a6b914
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d4c1e8f652'
+down_revision: Union[str, None] = 'f3c8d2a6b914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана через create_all
+    if not sa.inspect(op.get_bind()).has_table("import_batches"):
+        op.create_table(
+            "import_batches",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("filename", sa.String(), nullable=False),
+            sa.Column("source", sa.String(), nullable=True),
+            sa.Column("row_count", sa.Integer(), nullable=False),
+            sa.Column("first_entry_id", sa.Integer(), nullable=False),
+            sa.Column("file_hash", sa.String(), nullable=True),
+            sa.Column("imported_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("filename"),
+        )
+        op.create_index(op.f("ix_import_batches_id"), "import_batches", ["id"], unique=False)
+        op.create_index(op.f("ix_import_batches_first_entry_id"), "import_batches", ["first_entry_id"], unique=False)
+    _backfill_import_batches()
+
+
+def _backfill_import_batches() -> None:
+    """Каталог по уже импортированным строкам (время импорта неизвестно)."""
+    bind = op.get_bind()
+    entries = sa.table(
+        "crm_entries",
+        sa.column("id", sa.Integer),
+        sa.column("filename", sa.String),
+        sa.column("source", sa.String),
+        sa.column("file_hash", sa.String),
+    )
+    batches = sa.table(
+        "import_batches",
+        sa.column("filename", sa.String),
+        sa.column("source", sa.String),
+        sa.column("row_count", sa.Integer),
+        sa.column("first_entry_id", sa.Integer),
+        sa.column("file_hash", sa.String),
+    )
+    bind.execute(batches.delete())
+    stats = (
+        sa.select(
+            entries.c.filename,
+            sa.func.count(entries.c.id).label("row_count"),
+            sa.func.min(entries.c.id).label("first_entry_id"),
+        )
+        .where(entries.c.filename.isnot(None), entries.c.filename != "")
+        .group_by(entries.c.filename)
+        .subquery()
+    )
+    rows = bind.execute(
+        sa.select(stats.c.filename, stats.c.row_count, stats.c.first_entry_id, entries.c.source, entries.c.file_hash)
+        .join(entries, entries.c.id == stats.c.first_entry_id)
+    ).fetchall()
+    batch = [dict(row._mapping) for row in rows]
+    for start in range(0, len(batch), 5000):
+        bind.execute(batches.insert(), batch[start:start + 5000])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_import_batches_first_entry_id"), table_name="import_batches")
+    op.drop_index(op.f("ix_import_batches_id"), table_name="import_batches")
+    op.drop_table("import_batches")
@@ -0,0 +1,57 @@
+"""crm entries batch id
+
+Revision ID: b92e5f3a7c04
+Revises: a7d4c1e8f652
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b92e5f3a7c04'
+down_revision: Union[str, None] = 'a7d4c1e8f652'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FOREIGN_KEY = "fk_crm_entries_batch_id_import_batches"
+
+
+def _columns(table: str) -> set[str]:
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _is_sqlite() -> bool:
+    return op.get_bind().dialect.name == "sqlite"
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана через create_all уже с новой колонкой
+    if "batch_id" not in _columns("crm_entries"):
+        op.add_column("crm_entries", sa.Column("batch_id", sa.Integer(), nullable=True))
+        op.create_index(op.f("ix_crm_entries_batch_id"), "crm_entries", ["batch_id"], unique=False)
+        # SQLite не добавляет ограничения через ALTER TABLE
+        if not _is_sqlite():
+            op.create_foreign_key(FOREIGN_KEY, "crm_entries", "import_batches", ["batch_id"], ["id"])
+    _backfill_batch_ids()
+
+
+def _backfill_batch_ids() -> None:
+    """Партия для уже импортированных строк — по имени файла из import_batches."""
+    entries = sa.table("crm_entries", sa.column("filename", sa.String), sa.column("batch_id", sa.Integer))
+    batches = sa.table("import_batches", sa.column("id", sa.Integer), sa.column("filename", sa.String))
+    op.get_bind().execute(
+        entries.update()
+        .where(entries.c.filename.isnot(None))
+        .values(batch_id=sa.select(batches.c.id).where(batches.c.filename == entries.c.filename).scalar_subquery())
+    )
+
+
+def downgrade() -> None:
+    if not _is_sqlite():
+        op.drop_constraint(FOREIGN_KEY, "crm_entries", type_="foreignkey")
+    op.drop_index(op.f("ix_crm_entries_batch_id"), table_name="crm_entries")
+    op.drop_column("crm_entries", "batch_id")
@@ -0,0 +1,70 @@
+"""crm donor key and source index
+
+Revision ID: c4e7a1d9b350
+Revises: 8b2d4e6f1a23
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.crm_fields import donor_key
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e7a1d9b350'
+down_revision: Union[str, None] = '8b2d4e6f1a23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table: str) -> set[str]:
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _indexes(table: str) -> set[str]:
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана через create_all уже с новыми колонками
+    if "donor_key" not in _columns("crm_entries"):
+        op.add_column("crm_entries", sa.Column("donor_key", sa.String(), nullable=True))
+        op.create_index(op.f("ix_crm_entries_donor_key"), "crm_entries", ["donor_key"], unique=False)
+    if "ix_crm_entries_source_norm" not in _indexes("crm_entries"):
+        op.create_index(
+            "ix_crm_entries_source_norm", "crm_entries", [sa.text("lower(trim(source))")], unique=False
+        )
+    _backfill_donor_keys()
+
+
+def _backfill_donor_keys(batch_size: int = 5000) -> None:
+    """Ключ донора для уже импортированных строк."""
+    bind = op.get_bind()
+    entries = sa.table(
+        "crm_entries",
+        sa.column("id", sa.Integer),
+        sa.column("data", sa.JSON),
+        sa.column("donor_key", sa.String),
+    )
+    update = entries.update().where(entries.c.id == sa.bindparam("_id")).values(donor_key=sa.bindparam("donor_key"))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(entries.c.id, entries.c.data)
+            .where(entries.c.id > last_id)
+            .order_by(entries.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        bind.execute(update, [{"_id": row.id, "donor_key": donor_key(row.data or {})} for row in rows])
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    op.drop_index("ix_crm_entries_source_norm", table_name="crm_entries")
+    op.drop_index(op.f("ix_crm_entries_donor_key"), table_name="crm_entries")
+    op.drop_column("crm_entries", "donor_key")
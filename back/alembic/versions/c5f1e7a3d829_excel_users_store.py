@@ -0,0 +1,84 @@
+"""excel users store
+
+Revision ID: c5f1e7a3d829
+Revises: b92e5f3a7c04
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f1e7a3d829'
+down_revision: Union[str, None] = 'b92e5f3a7c04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NEW_COLUMNS = (
+    ("row_id", sa.Integer()),
+    ("filename", sa.String()),
+    ("gender", sa.String()),
+    ("data", sa.JSON()),
+    ("version", sa.Integer()),
+)
+INDEXED = ("fio", "source", "row_id", "filename", "version")
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def upgrade() -> None:
+    # excel_users создавалась только через create_all (и могла не создаваться вовсе)
+    if not _inspector().has_table("excel_users"):
+        op.create_table(
+            "excel_users",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("email", sa.String(), nullable=True),
+            sa.Column("month", sa.String(), nullable=True),
+            sa.Column("date", sa.String(), nullable=True),
+            sa.Column("fio", sa.String(), nullable=True),
+            sa.Column("summa", sa.Float(), nullable=True),
+            sa.Column("payment_id", sa.String(), nullable=True),
+            sa.Column("phone", sa.String(), nullable=True),
+            sa.Column("language", sa.String(), nullable=True),
+            sa.Column("source", sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_excel_users_id"), "excel_users", ["id"], unique=False)
+        op.create_index(op.f("ix_excel_users_email"), "excel_users", ["email"], unique=False)
+    columns = {column["name"] for column in _inspector().get_columns("excel_users")}
+    for name, column_type in NEW_COLUMNS:
+        if name not in columns:
+            op.add_column("excel_users", sa.Column(name, column_type, nullable=True))
+    op.execute("UPDATE excel_users SET version = 0 WHERE version IS NULL")
+    # Суммы бывают дробными; SQLite хранит их и в INTEGER-колонке
+    if op.get_bind().dialect.name != "sqlite":
+        op.alter_column("excel_users", "summa", type_=sa.Float(), existing_type=sa.Integer())
+        op.alter_column("excel_users", "version", nullable=False, existing_type=sa.Integer())
+    indexes = {index["name"] for index in _inspector().get_indexes("excel_users")}
+    for name in INDEXED:
+        if op.f(f"ix_excel_users_{name}") not in indexes:
+            op.create_index(op.f(f"ix_excel_users_{name}"), "excel_users", [name], unique=False)
+
+    if not _inspector().has_table("excel_store_state"):
+        op.create_table(
+            "excel_store_state",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("epoch", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("excel_store_state")
+    for name in INDEXED:
+        op.drop_index(op.f(f"ix_excel_users_{name}"), table_name="excel_users")
+    for name, _ in reversed(NEW_COLUMNS):
+        op.drop_column("excel_users", name)
+    if op.get_bind().dialect.name != "sqlite":
+        op.alter_column("excel_users", "summa", type_=sa.Integer(), existing_type=sa.Float())
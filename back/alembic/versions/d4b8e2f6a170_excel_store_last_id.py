@@ -0,0 +1,34 @@
+"""excel store last id
+
+Revision ID: d4b8e2f6a170
+Revises: c5f1e7a3d829
+Create Date: 2026-10-18 23:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4b8e2f6a170'
+down_revision: Union[str, None] = 'c5f1e7a3d829'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана create_all уже с колонкой
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("excel_store_state")}
+    if "last_id" not in columns:
+        op.add_column(
+            "excel_store_state",
+            sa.Column("last_id", sa.Integer(), nullable=False, server_default="0"),
+        )
+    # id строк выдавались как len + 1 — продолжаем после наибольшего из сохранённых
+    op.execute("UPDATE excel_store_state SET last_id = COALESCE((SELECT MAX(row_id) FROM excel_users), 0)")
+
+
+def downgrade() -> None:
+    op.drop_column("excel_store_state", "last_id")
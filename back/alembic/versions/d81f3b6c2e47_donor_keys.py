@@ -0,0 +1,78 @@
+"""donor keys index
+
+Revision ID: d81f3b6c2e47
+Revises: c4e7a1d9b350
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.crm_fields import donor_tokens
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81f3b6c2e47'
+down_revision: Union[str, None] = 'c4e7a1d9b350'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана через create_all
+    if not sa.inspect(op.get_bind()).has_table("donor_keys"):
+        op.create_table(
+            "donor_keys",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("entry_id", sa.Integer(), nullable=False),
+            sa.Column("kind", sa.String(), nullable=False),
+            sa.Column("token", sa.String(), nullable=False),
+            sa.ForeignKeyConstraint(["entry_id"], ["crm_entries.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_donor_keys_id"), "donor_keys", ["id"], unique=False)
+        op.create_index(op.f("ix_donor_keys_entry_id"), "donor_keys", ["entry_id"], unique=False)
+        op.create_index(op.f("ix_donor_keys_token"), "donor_keys", ["token"], unique=False)
+        op.create_index("ix_donor_keys_kind_token", "donor_keys", ["kind", "token"], unique=False)
+    _backfill_donor_keys()
+
+
+def _backfill_donor_keys(batch_size: int = 5000) -> None:
+    """Индекс доноров для уже импортированных строк."""
+    bind = op.get_bind()
+    entries = sa.table("crm_entries", sa.column("id", sa.Integer), sa.column("data", sa.JSON))
+    keys = sa.table(
+        "donor_keys",
+        sa.column("entry_id", sa.Integer),
+        sa.column("kind", sa.String),
+        sa.column("token", sa.String),
+    )
+    bind.execute(keys.delete())
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(entries.c.id, entries.c.data)
+            .where(entries.c.id > last_id)
+            .order_by(entries.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        tokens = [
+            {"entry_id": row.id, "kind": kind, "token": token}
+            for row in rows
+            for kind, token in donor_tokens(row.data)
+        ]
+        if tokens:
+            bind.execute(keys.insert(), tokens)
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    op.drop_index("ix_donor_keys_kind_token", table_name="donor_keys")
+    op.drop_index(op.f("ix_donor_keys_token"), table_name="donor_keys")
+    op.drop_index(op.f("ix_donor_keys_entry_id"), table_name="donor_keys")
+    op.drop_index(op.f("ix_donor_keys_id"), table_name="donor_keys")
+    op.drop_table("donor_keys")
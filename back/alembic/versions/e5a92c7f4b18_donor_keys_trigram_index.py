@@ -0,0 +1,44 @@
+"""donor keys trigram index (PostgreSQL)
+
+Revision ID: e5a92c7f4b18
+Revises: d81f3b6c2e47
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a92c7f4b18'
+down_revision: Union[str, None] = 'd81f3b6c2e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _is_postgres() -> bool:
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def upgrade() -> None:
+    # На остальных БД поиск по подстроке идёт через индекс в памяти (app.donor_search)
+    if not _is_postgres():
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_donor_keys_token_trgm",
+        "donor_keys",
+        ["token"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"token": "gin_trgm_ops"},
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    if not _is_postgres():
+        return
+    op.drop_index("ix_donor_keys_token_trgm", table_name="donor_keys", if_exists=True)
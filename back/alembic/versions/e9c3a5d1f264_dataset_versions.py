@@ -0,0 +1,33 @@
+"""dataset versions
+
+Revision ID: e9c3a5d1f264
+Revises: d4b8e2f6a170
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9c3a5d1f264'
+down_revision: Union[str, None] = 'd4b8e2f6a170'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана create_all
+    if not sa.inspect(op.get_bind()).has_table("dataset_versions"):
+        op.create_table(
+            "dataset_versions",
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("name"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("dataset_versions")
@@ -0,0 +1,120 @@
+"""donor summary
+
+Revision ID: f3c8d2a6b914
+Revises: e5a92c7f4b18
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c8d2a6b914'
+down_revision: Union[str, None] = 'e5a92c7f4b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана через create_all
+    if not sa.inspect(op.get_bind()).has_table("donor_summary"):
+        op.create_table(
+            "donor_summary",
+            sa.Column("donor_key", sa.String(), nullable=False),
+            sa.Column("donations", sa.Integer(), nullable=False),
+            sa.Column("total_amount", sa.Float(), nullable=False),
+            sa.Column("amount_count", sa.Integer(), nullable=False),
+            sa.Column("average_amount", sa.Float(), nullable=False),
+            sa.Column("first_date", sa.DateTime(), nullable=True),
+            sa.Column("last_date", sa.DateTime(), nullable=True),
+            sa.Column("first_entry_id", sa.Integer(), nullable=False),
+            sa.Column("donor_type", sa.String(), nullable=False),
+            sa.Column("sources", sa.JSON(), nullable=True),
+            sa.PrimaryKeyConstraint("donor_key"),
+        )
+        op.create_index(op.f("ix_donor_summary_first_entry_id"), "donor_summary", ["first_entry_id"], unique=False)
+        op.create_index(op.f("ix_donor_summary_donor_type"), "donor_summary", ["donor_type"], unique=False)
+    _backfill_donor_summary()
+
+
+def _donor_type(donations: int) -> str:
+    if donations == 1:
+        return "single"
+    if donations <= 4:
+        return "periodic"
+    return "frequent"
+
+
+def _backfill_donor_summary() -> None:
+    """Сводка по уже импортированным строкам."""
+    bind = op.get_bind()
+    entries = sa.table(
+        "crm_entries",
+        sa.column("id", sa.Integer),
+        sa.column("donor_key", sa.String),
+        sa.column("amount", sa.Float),
+        sa.column("payment_date", sa.DateTime),
+        sa.column("source", sa.String),
+    )
+    summary = sa.table(
+        "donor_summary",
+        sa.column("donor_key", sa.String),
+        sa.column("donations", sa.Integer),
+        sa.column("total_amount", sa.Float),
+        sa.column("amount_count", sa.Integer),
+        sa.column("average_amount", sa.Float),
+        sa.column("first_date", sa.DateTime),
+        sa.column("last_date", sa.DateTime),
+        sa.column("first_entry_id", sa.Integer),
+        sa.column("donor_type", sa.String),
+        sa.column("sources", sa.JSON),
+    )
+    bind.execute(summary.delete())
+    has_key = entries.c.donor_key.isnot(None)
+    sources = {}
+    for key, source in bind.execute(
+        sa.select(entries.c.donor_key, entries.c.source)
+        .where(has_key, entries.c.source.isnot(None))
+        .distinct()
+        .order_by(entries.c.source)
+    ):
+        sources.setdefault(key, []).append(source)
+    rows = bind.execute(
+        sa.select(
+            entries.c.donor_key,
+            sa.func.count(entries.c.id).label("donations"),
+            sa.func.sum(entries.c.amount).label("total_amount"),
+            sa.func.count(entries.c.amount).label("amount_count"),
+            sa.func.min(entries.c.payment_date).label("first_date"),
+            sa.func.max(entries.c.payment_date).label("last_date"),
+            sa.func.min(entries.c.id).label("first_entry_id"),
+        )
+        .where(has_key)
+        .group_by(entries.c.donor_key)
+    ).fetchall()
+    batch = [
+        {
+            "donor_key": row.donor_key,
+            "donations": row.donations,
+            "total_amount": row.total_amount or 0,
+            "amount_count": row.amount_count,
+            "average_amount": (row.total_amount or 0) / row.amount_count if row.amount_count else 0,
+            "first_date": row.first_date,
+            "last_date": row.last_date,
+            "first_entry_id": row.first_entry_id,
+            "donor_type": _donor_type(row.donations),
+            "sources": sources.get(row.donor_key, []),
+        }
+        for row in rows
+    ]
+    for start in range(0, len(batch), 5000):
+        bind.execute(summary.insert(), batch[start:start + 5000])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_donor_summary_donor_type"), table_name="donor_summary")
+    op.drop_index(op.f("ix_donor_summary_first_entry_id"), table_name="donor_summary")
+    op.drop_table("donor_summary")
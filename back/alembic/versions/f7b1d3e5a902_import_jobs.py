@@ -0,0 +1,50 @@
+"""import jobs
+
+Revision ID: f7b1d3e5a902
+Revises: e9c3a5d1f264
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7b1d3e5a902'
+down_revision: Union[str, None] = 'e9c3a5d1f264'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана create_all
+    if sa.inspect(op.get_bind()).has_table("import_jobs"):
+        return
+    op.create_table(
+        "import_jobs",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("state", sa.String(), nullable=False),
+        sa.Column("filenames", sa.JSON(), nullable=True),
+        sa.Column("sheets", sa.JSON(), nullable=True),
+        sa.Column("rows_parsed", sa.Integer(), nullable=False),
+        sa.Column("rows_written", sa.Integer(), nullable=False),
+        sa.Column("counts", sa.JSON(), nullable=True),
+        sa.Column("result", sa.JSON(), nullable=True),
+        sa.Column("errors", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.Float(), nullable=False),
+        sa.Column("started_at", sa.Float(), nullable=True),
+        sa.Column("finished_at", sa.Float(), nullable=True),
+        sa.Column("updated_at", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_import_jobs_state"), "import_jobs", ["state"], unique=False)
+    op.create_index(op.f("ix_import_jobs_created_at"), "import_jobs", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_import_jobs_created_at"), table_name="import_jobs")
+    op.drop_index(op.f("ix_import_jobs_state"), table_name="import_jobs")
+    op.drop_table("import_jobs")
@@ -1,55 +1,121 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
-from fastapi.responses import StreamingResponse
-import pandas as pd
-import io
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from sqlalchemy import Text, and_, case, cast, false, func, literal_column, or_, select, true
 from sqlalchemy.orm import Session
 from .database import SessionLocal, get_db
-from .models import CRMEntry
+from .models import CRMEntry, DonorSummary
+from . import donor_index, donor_search, response_cache
+from .donor_summary import DONOR_TYPES, type_conditions
+from .crm_listing import MAX_PAGE_SIZE, SORT_PATTERN, STREAM_BATCH_ROWS, STREAM_PATTERN, list_entries, stream_query
+from .export_formats import FORMAT_PATTERN, collect_schema, export_response, merge_schema
+from .fast_json import FastJSONResponse
+from .crm_fields import DATE_FIELDS, MONTH_NAMES, extract_fio_iin, month_number, normalize
 from datetime import datetime
-from dateutil.parser import parse as parse_date
+from .date_parsing import parse_date
 from collections import defaultdict
 import re
 import calendar
 
 router = APIRouter()
 
-@router.get("/crm", tags=["CRM"])
-def get_crm(db: Session = Depends(get_db)):
-    month_names = [
-        'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
-        'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'
-    ]
-    entries = db.query(CRMEntry).all()
-    result = []
-    for entry in entries:
-        data = entry.data.copy()
-        date_str = data.get('Дата') or data.get('Дата платежа') or data.get('Дата и время')
-        if date_str:
-            try:
-                if '.' in date_str or '/' in date_str:
-                    date_obj = parse_date(date_str, dayfirst=True)
-                else:
-                    date_obj = parse_date(date_str)
-                data['month'] = month_names[date_obj.month - 1]
-            except Exception:
-                pass
-        # Добавляем источник
-        data['source'] = entry.source if hasattr(entry, 'source') else None
-        # Очищаем числовые значения от inf, -inf, NaN
-        cleaned_data = {}
-        for key, value in data.items():
-            if isinstance(value, (int, float)):
-                if value == value and -1e308 <= value <= 1e308:  # Проверяем на inf, -inf, NaN
-                    cleaned_data[key] = value
-                else:
-                    cleaned_data[key] = None
-            else:
-                cleaned_data[key] = value
-        result.append(cleaned_data)
-    return result
-
-@router.get("/crm/filter", tags=["CRM"])
+def entry_payload(entry: CRMEntry) -> dict:
+    """Строка CRM для ответа: data + месяц по дате платежа + источник.
+
+    inf/NaN не чистятся: FastJSONResponse и выгрузки пишут их как пустые значения.
+    """
+    data = entry.data.copy()
+    # Дата разобрана при импорте (crm_fields)
+    if entry.payment_date is not None:
+        data['month'] = MONTH_NAMES[entry.payment_date.month - 1]
+    # Добавляем источник
+    data['source'] = entry.source if hasattr(entry, 'source') else None
+    return data
+
+# Классы донаторов по числу платежей в выборке
+def _in_lowered(column, values: list[str]):
+    """column IN (values) без учёта регистра/пробелов; пустое значение совпадает с NULL."""
+    accepted = {v.strip().lower() for v in values}
+    condition = column.in_(accepted - {""})
+    if "" in accepted:
+        condition = or_(condition, column.is_(None), column == "")
+    return condition
+
+def crm_filter_query(
+    db: Session,
+    year: int | None = None,
+    month: str | None = None,
+    amount_from: float | None = None,
+    amount_to: float | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    source: list[str] | None = None,
+    type: list[str] | None = None,
+    gender: list[str] | None = None,
+    language: list[str] | None = None,
+):
+    """Запрос CRMEntry с фильтрами /crm/filter, собранными в один WHERE.
+
+    Строки без даты проходят фильтры по году и периоду, строки без суммы
+    не проходят фильтр по сумме. Тип донатора без других фильтров берётся
+    из сводки donor_summary (JOIN по donor_key); вместе с другими фильтрами
+    он зависит от отобранных строк и считается подзапросом с GROUP BY donor_key.
+    """
+    conditions = []
+    if month:
+        month_no = month_number(month)
+        conditions.append(CRMEntry.month == month_no if month_no else false())
+    if year:
+        conditions.append(or_(CRMEntry.payment_date.is_(None), CRMEntry.year == year))
+    if date_from and date_to:
+        dt_from = parse_date(date_from)
+        dt_to = parse_date(date_to)
+        if dt_from and dt_to:
+            in_range = CRMEntry.payment_date.between(dt_from, dt_to)
+        else:
+            # Непонятный период — остаются только строки без даты
+            in_range = false()
+        conditions.append(or_(CRMEntry.payment_date.is_(None), in_range))
+    if amount_from is not None:
+        conditions.append(CRMEntry.amount >= amount_from)
+    if amount_to is not None:
+        conditions.append(CRMEntry.amount <= amount_to)
+    if source:
+        conditions.append(_in_lowered(func.lower(func.trim(CRMEntry.source)), source))
+    if gender:
+        conditions.append(_in_lowered(CRMEntry.gender, gender))
+    if language:
+        conditions.append(_in_lowered(CRMEntry.language, language))
+
+    query = db.query(CRMEntry).filter(*conditions)
+    accepted = {t.strip().lower() for t in type or []} & set(DONOR_TYPES)
+    if not accepted:
+        return query.order_by(CRMEntry.id)
+
+    wanted = [t for t in DONOR_TYPES if t in accepted]
+    if not conditions:
+        # Строки донора идут подряд, доноры — в порядке первого платежа
+        return (
+            query.join(DonorSummary, DonorSummary.donor_key == CRMEntry.donor_key)
+            .filter(DonorSummary.donor_type.in_(wanted))
+            .order_by(DonorSummary.first_entry_id, CRMEntry.id)
+        )
+
+    # Группировка и фильтрация по типу донатора среди отфильтрованных строк
+    having = type_conditions(func.count(CRMEntry.id))
+    donors = (
+        select(CRMEntry.donor_key, func.min(CRMEntry.id).label("first_id"))
+        .where(*conditions, CRMEntry.donor_key.isnot(None))
+        .group_by(CRMEntry.donor_key)
+        .having(or_(*(having[t] for t in wanted)))
+        .subquery()
+    )
+    return (
+        query.join(donors, donors.c.donor_key == CRMEntry.donor_key)
+        .order_by(donors.c.first_id, CRMEntry.id)
+    )
+
+@router.get("/crm/filter", tags=["CRM"], response_class=FastJSONResponse)
 def filter_crm(
+    response: Response,
     year: int | None = Query(None),
     month: str | None = Query(None),
     amount_from: float | None = Query(None, description="Минимальная сумма (Сумма)"),
@@ -60,243 +126,146 @@ def filter_crm(
     type: list[str] | None = Query(None, description="Тип(ы) донатора: single/periodic/frequent"),
     gender: list[str] | None = Query(None, description="Гендер(ы): мужчина/женщина/неизвестно"),
     language: list[str] | None = Query(None, description="Язык(и): казахский/русский/английский/другой"),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Размер страницы (курсор следующей — в X-Next-Cursor)"),
+    after: str | None = Query(None, description="Курсор из X-Next-Cursor предыдущей страницы"),
+    sort: str | None = Query(None, pattern=SORT_PATTERN, description="id, payment_date, amount, source; '-' — по убыванию"),
+    stream: str | None = Query(None, pattern=STREAM_PATTERN, description="ndjson или array — отдавать потоком"),
+    format: str | None = Query(None, pattern=FORMAT_PATTERN, description="Отдать файлом: xlsx, csv, parquet, arrow"),
     db: Session = Depends(get_db)
 ):
-    month_names = [
-        'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
-        'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'
-    ]
-    entries = db.query(CRMEntry).all()
-    result = []
-    for entry in entries:
-        data = entry.data.copy()
-        date_str = data.get('Дата') or data.get('Дата платежа') or data.get('Дата и время')
-        date_obj = None
-        if date_str:
-            try:
-                if '.' in date_str or '/' in date_str:
-                    date_obj = parse_date(date_str, dayfirst=True)
-                else:
-                    date_obj = parse_date(date_str)
-                data['month'] = month_names[date_obj.month - 1]
-            except Exception:
-                pass
-        # Добавляем источник
-        data['source'] = entry.source if hasattr(entry, 'source') else None
-        # Фильтрация по месяцу
-        if month:
-            month_query = month.strip().lower()
-            if data.get('month', '').strip().lower() != month_query:
-                continue
-        # Фильтрация по году
-        if year and date_obj:
-            if date_obj.year != year:
-                continue
-        # Фильтрация по дате
-        if date_from and date_to and date_obj:
-            try:
-                dt_from = parse_date(date_from, dayfirst=True)
-                dt_to = parse_date(date_to, dayfirst=True)
-                if not (dt_from <= date_obj <= dt_to):
-                    continue
-            except Exception:
-                continue
-        # Фильтрация по сумме
-        amount = None
-        for sum_field in ["Сумма", "Сумма операции", "Кредит", "Дебет"]:
-            if data.get(sum_field) is not None:
-                try:
-                    amount = float(data[sum_field])
-                    # Проверяем на inf, -inf, NaN
-                    if not (amount == amount and -1e308 <= amount <= 1e308):
-                        amount = None
-                    break
-                except Exception:
-                    pass
-        if amount_from is not None and (amount is None or amount < amount_from):
-            continue
-        if amount_to is not None and (amount is None or amount > amount_to):
-            continue
-        # Фильтрация по источнику
-        if source:
-            src_val = (data.get("source") or entry.source or "").strip().lower()
-            if src_val not in {s.strip().lower() for s in source}:
-                continue
-        # Фильтрация по полу
-        if gender:
-            g_val = (data.get("gender") or data.get("пол") or "").strip().lower()
-            if g_val not in {g.strip().lower() for g in gender}:
-                continue
-        # Фильтрация по языку
-        if language:
-            l_val = (data.get("language") or data.get("язык") or "").strip().lower()
-            if l_val not in {lang.strip().lower() for lang in language}:
-                continue
-        # Очищаем числовые значения от inf, -inf, NaN
-        cleaned_data = {}
-        for key, value in data.items():
-            if isinstance(value, (int, float)):
-                if value == value and -1e308 <= value <= 1e308:  # Проверяем на inf, -inf, NaN
-                    cleaned_data[key] = value
-                else:
-                    cleaned_data[key] = None
-            else:
-                cleaned_data[key] = value
-        result.append(cleaned_data)
-    # Группировка и фильтрация по типу донатора
-    if type:
-        accepted = {t.strip().lower() for t in type}
-        valid = {"single", "periodic", "frequent"}
-        accepted = accepted & valid
-        if accepted:
-            counter = defaultdict(list)
-            for row in result:
-                key_grp = row.get("ИИН") or row.get("ФИО") or row.get("E-mail & phone number") or row.get("Номер телефон ")
-                if key_grp:
-                    counter[key_grp].append(row)
-
-            temp_res = []
-            for rows in counter.values():
-                cnt = len(rows)
-                clazz = (
-                    "single" if cnt == 1 else
-                    "periodic" if 2 <= cnt <= 4 else
-                    "frequent"
-                )
-                if clazz in accepted:
-                    temp_res.extend(rows)
-            result = temp_res
-    return result
-
-def normalize(value: str | None) -> str | None:
-    """Приводит строку к нижнему регистру, убирает лишние пробелы/переводы строк."""
-    if not value or not isinstance(value, str):
+    # Фильтрует БД: из базы приходят только подходящие строки
+    def build_query(session):
+        return crm_filter_query(
+            session, year=year, month=month, amount_from=amount_from, amount_to=amount_to,
+            date_from=date_from, date_to=date_to, source=source, type=type,
+            gender=gender, language=language,
+        )
+    if format:
+        if limit is not None or after is not None:
+            raise HTTPException(status_code=400, detail="format нельзя совмещать с limit/after")
+        return export_response(
+            format, _payload_schema(build_query(db)), stream_query(build_query, entry_payload, sort), "crm_filtered"
+        )
+    if stream:
+        return list_entries(db, response, build_query, entry_payload, limit=limit, after=after, sort=sort, stream=stream)
+    # Повторные запросы дашбордов отдаются из кэша до следующего изменения CRM
+    params = dict(
+        year=year, month=month, amount_from=amount_from, amount_to=amount_to, date_from=date_from,
+        date_to=date_to, source=source, type=type, gender=gender, language=language,
+        limit=limit, after=after, sort=sort,
+    )
+    return response_cache.cached_json(
+        response_cache.CRM, "crm_filter", params,
+        lambda page_response: list_entries(db, page_response, build_query, entry_payload, limit=limit, after=after, sort=sort),
+    )
+
+@router.get("/crm/donor_search", tags=["CRM"])
+def donor_search_endpoint(
+    q: str = Query(..., min_length=1, description="Часть ФИО, ИИН, e-mail, телефона или отправителя"),
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """Кандидаты для /crm/donator_profile: значения, содержащие запрос или
+    похожие на него (по триграммам), с оценкой похожести и числом записей."""
+    norm_key = normalize(q)
+    if not norm_key:
+        return []
+    return donor_search.search(db, norm_key, limit)
+
+def _raw_date(data: dict) -> str | None:
+    """Исходная строка даты платежа (первое непустое поле даты)."""
+    for date_field in DATE_FIELDS:
+        if data.get(date_field):
+            return str(data[date_field])
+    return None
+
+def _donation_stats(entries: list[CRMEntry]) -> dict:
+    """Статистика профиля по самим записям."""
+    amounts = [entry.amount for entry in entries if entry.amount is not None]
+    # Первая/последняя дата — по разобранной дате, в ответе исходная строка
+    dated = sorted(
+        (entry.payment_date, _raw_date(entry.data))
+        for entry in entries if entry.payment_date is not None
+    )
+    dates = [raw for raw in (_raw_date(entry.data) for entry in entries) if raw]
+    return {
+        "total_count": len(entries),
+        "total_amount": sum(amounts) if amounts else 0,
+        "average_amount": sum(amounts)/len(amounts) if amounts else 0,
+        "first_donation": dated[0][1] if dated else (min(dates) if dates else None),
+        "last_donation": dated[-1][1] if dated else (max(dates) if dates else None)
+    }
+
+def _summary_stats(db: Session, entries: list[CRMEntry]) -> dict | None:
+    """Статистика профиля из donor_summary, если найденные записи — ровно все
+    записи одного donor_key; иначе None."""
+    donor_keys = {entry.donor_key for entry in entries}
+    if len(donor_keys) != 1 or None in donor_keys:
         return None
-    return re.sub(r"\s+", " ", value).strip().lower()
-
-
-def extract_fio_iin(sender_str: str | None):
-    """Возвращает (fio, iin) из составной строки отправителя."""
-    fio = None
-    iin = None
-    if sender_str:
-        # Первая строка до перевода строки обычно содержит ФИО
-        fio = sender_str.split('\n')[0].strip()
-        match = re.search(r'(?:ИИН|БИН): ?(\d{10,12})', sender_str, re.IGNORECASE)
-        if match:
-            iin = match.group(1)
-    return fio, iin
-
-@router.get("/crm/donator_profile", tags=["CRM"])
+    summary = db.get(DonorSummary, donor_keys.pop())
+    if summary is None or summary.donations != len(entries):
+        return None
+    if summary.first_date is None:
+        dates = [raw for raw in (_raw_date(entry.data) for entry in entries) if raw]
+        first, last = (min(dates), max(dates)) if dates else (None, None)
+    else:
+        # В ответе исходная строка даты: при равных датах — как sorted() в _donation_stats
+        first = min(_raw_date(e.data) for e in entries if e.payment_date == summary.first_date)
+        last = max(_raw_date(e.data) for e in entries if e.payment_date == summary.last_date)
+    return {
+        "total_count": summary.donations,
+        "total_amount": summary.total_amount,
+        "average_amount": summary.average_amount,
+        "first_donation": first,
+        "last_donation": last,
+    }
+
+@router.get("/crm/donator_profile", tags=["CRM"], response_class=FastJSONResponse)
 def donator_profile(key: str = Query(...), db: Session = Depends(get_db)):
     """Ищет донора по произвольному ключу (ФИО, ИИН, email, телефон, либо любая
     подстрока в поле "Отправитель ...").
 
     Алгоритм поиска:
     1. Нормализуем key (нижний регистр, trim).  
-    2. Проходим все записи, для каждой собираем возможные значения (ИИН, ФИО,
-       email/телефон, а также извлекаем fio/iin из поля отправителя).  
-    3. Сравниваем нормализованные строки; совпадение при exact == или если одна
-       строка является подстрокой другой.  
-    4. Если среди найденных записей обнаружен ИИН – расширяем выборку всеми
-       записями с тем же ИИН.
+    2. По индексу donor_keys находим записи, у которых одно из значений (ИИН,
+       ФИО, email/телефон, fio/iin/строка из поля отправителя) совпадает с
+       ключом или одна строка является подстрокой другой.  
+    3. Если среди найденных записей обнаружен ИИН – расширяем выборку всеми
+       записями с тем же ИИН (тоже по индексу).
     """
-    entries = db.query(CRMEntry).all()
     norm_key = normalize(key)
+    if not norm_key:
+        return {"error": "Donator not found"}
 
-    donations: list[dict] = []
-    found_iin: str | None = None
-
-    for entry in entries:
-        data = entry.data
-
-        candidates: list[str | None] = [
-            data.get("ИИН"),
-            data.get("ФИО"),
-            data.get("E-mail & phone number"),
-            data.get("Номер телефон "),
-        ]
-
-        # Добавляем данные из поля Отправитель
-        sender_raw = data.get("Отправитель (Наименование, БИК, ИИК, БИН/ИИН)")
-        fio_from_sender, iin_from_sender = extract_fio_iin(sender_raw)
-        candidates.extend([fio_from_sender, iin_from_sender, sender_raw])
-
-        matched = False
-        for cand in candidates:
-            norm_cand = normalize(str(cand)) if cand is not None else None
-            if norm_cand and (
-                norm_cand == norm_key or
-                norm_key in norm_cand or
-                norm_cand in norm_key
-            ):
-                matched = True
-                break
-
-        if matched:
-            donations.append(data)
-            if data.get("ИИН"):
-                found_iin = str(data.get("ИИН"))
-            elif iin_from_sender:
-                found_iin = iin_from_sender
+    matched_ids = donor_index.matching_entry_ids(db, norm_key)
+    # ИИН из поля "ИИН" или из отправителя последней найденной записи, извлечён при импорте
+    found_iin = (
+        db.query(CRMEntry.iin)
+        .filter(CRMEntry.id.in_(matched_ids), CRMEntry.iin.isnot(None))
+        .order_by(CRMEntry.id.desc())
+        .limit(1)
+        .scalar()
+    )
 
     # Если нашли ИИН — собираем все записи с тем же ИИН для полноты
     if found_iin:
-        donations = [
-            d.data for d in entries
-            if str(d.data.get("ИИН", "")) == found_iin or
-               extract_fio_iin(d.data.get("Отправитель (Наименование, БИК, ИИК, БИН/ИИН)"))[1] == found_iin
-        ]
-    if not donations:
+        matched_ids = donor_index.entry_ids_by_iin(found_iin)
+    matched_entries = db.query(CRMEntry).filter(CRMEntry.id.in_(matched_ids)).order_by(CRMEntry.id).all()
+    if not matched_entries:
         return {"error": "Donator not found"}
+    donations = [entry.data for entry in matched_entries]
     donator_info = {
         "ИИН": donations[0].get("ИИН"),
         "ФИО": donations[0].get("ФИО"),
         "E-mail & phone number": donations[0].get("E-mail & phone number")
     }
-    amounts = []
-    dates = []
-    for d in donations:
-        for sum_field in ["Сумма", "Сумма операции", "Кредит", "Дебет"]:
-            if d.get(sum_field) is not None:
-                try:
-                    amount = float(d[sum_field])
-                    # Проверяем на inf, -inf, NaN
-                    if amount == amount and -1e308 <= amount <= 1e308:
-                        amounts.append(amount)
-                    break
-                except Exception:
-                    pass
-        for date_field in ["Дата", "Дата платежа", "Дата и время"]:
-            if d.get(date_field):
-                dates.append(str(d[date_field]))
-                break
-    stats = {
-        "total_count": len(donations),
-        "total_amount": sum(amounts) if amounts else 0,
-        "average_amount": sum(amounts)/len(amounts) if amounts else 0,
-        "first_donation": min(dates) if dates else None,
-        "last_donation": max(dates) if dates else None
-    }
-    # Очищаем числовые значения в donations от inf, -inf, NaN
-    cleaned_donations = []
-    for d in donations:
-        cleaned_donation = {}
-        for key, value in d.items():
-            if isinstance(value, (int, float)):
-                if value == value and -1e308 <= value <= 1e308:  # Проверяем на inf, -inf, NaN
-                    cleaned_donation[key] = value
-                else:
-                    cleaned_donation[key] = None
-            else:
-                cleaned_donation[key] = value
-        cleaned_donations.append(cleaned_donation)
-    
-    return {
+    stats = _summary_stats(db, matched_entries) or _donation_stats(matched_entries)
+    # inf/NaN в donations FastJSONResponse отдаёт как null
+    return FastJSONResponse({
         "donator_info": donator_info,
-        "donations": cleaned_donations,
+        "donations": donations,
         "stats": stats
-    }
+    })
 
 # ========================= Экспорт CRM в Excel =========================
 
@@ -312,39 +281,117 @@ def export_crm_excel(
     type: list[str] = Query(None),
     gender: list[str] = Query(None),
     language: list[str] = Query(None),
+    format: str = Query("xlsx", pattern=FORMAT_PATTERN, description="xlsx, csv, parquet или arrow"),
     db: Session = Depends(get_db)
 ):
-    """Формирует Excel-файл с теми же фильтрами, что и /crm/filter."""
-
-    # Получаем данные тем же способом, что /crm/filter
-    rows = filter_crm(
-        year=year,
-        month=month,
-        amount_from=amount_from,
-        amount_to=amount_to,
-        date_from=date_from,
-        date_to=date_to,
-        source=source,
-        type=type,
-        gender=gender,
-        language=language,
-        db=db,
-    )
+    """Формирует файл (по умолчанию Excel) с теми же фильтрами, что и /crm/filter.
 
-    if not rows:
+    Файл пишется потоком: строки читаются из БД пачками и сразу уходят в ответ.
+    """
+
+    # Те же фильтры, что и /crm/filter, выполняются в БД
+    def build_query(session):
+        return crm_filter_query(
+            session, year=year, month=month, amount_from=amount_from, amount_to=amount_to,
+            date_from=date_from, date_to=date_to, source=source, type=type,
+            gender=gender, language=language,
+        )
+    # Колонки нужны до первой строки — их ключи и типы считает БД
+    schema = _payload_schema(build_query(db))
+
+    if not schema:
         raise HTTPException(status_code=404, detail="Нет данных под выбранные фильтры")
 
-    df = pd.DataFrame(rows)
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
-    buffer.seek(0)
+    return export_response(format, schema, stream_query(build_query, entry_payload), "crm_filtered")
+
+# Тип значения json_each (SQLite) -> тип колонки выгрузки (export_formats)
+_SQLITE_JSON_KINDS = {
+    "integer": "int", "real": "float", "true": "bool", "false": "bool",
+    "text": "string", "array": "string", "object": "string",
+}
+# Тип json_typeof (PostgreSQL); number делится на int и float по виду числа
+_POSTGRES_JSON_KINDS = {"boolean": "bool", "string": "string", "array": "string", "object": "string"}
 
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=crm_filtered.xlsx"},
+
+def _data_kinds(query) -> list | None:
+    """Ключи data отобранных строк с типами значений: (ключ, тип JSON, первая строка, номер ключа в ней).
+
+    Считается одной агрегацией в БД, строки в приложение не читаются.
+    None — на этой БД JSON-функций нет.
+    """
+    dialect = query.session.get_bind().dialect.name
+    ids = query.with_entities(CRMEntry.id).order_by(None)
+    if dialect == "sqlite":
+        item = func.json_each(CRMEntry.data).table_valued("key", "type", "id")
+        value_type, ordinal = item.c.type, item.c.id
+    elif dialect == "postgresql":
+        item = func.json_each(CRMEntry.data).table_valued("key", "value", with_ordinality="ordinal").render_derived()
+        # Без параметров: выражение в SELECT и GROUP BY должно совпадать текстом
+        value_type = case(
+            (
+                and_(
+                    func.json_typeof(item.c.value) == literal_column("'number'"),
+                    cast(item.c.value, Text).op("~")(literal_column("'^-?[0-9]+$'")),
+                ),
+                literal_column("'integer'"),
+            ),
+            else_=func.json_typeof(item.c.value),
+        )
+        ordinal = item.c.ordinal
+    else:
+        return None
+    kinds = (
+        select(item.c.key, value_type, func.min(CRMEntry.id), func.min(ordinal))
+        .select_from(CRMEntry)
+        .join(item, true())
+        .where(CRMEntry.id.in_(ids))
+        .group_by(item.c.key, value_type)
     )
+    return query.session.execute(kinds).all()
+
+
+def _json_kind(dialect: str, value_type: str) -> str | None:
+    if dialect == "postgresql":
+        return {"integer": "int", "number": "float"}.get(value_type) or _POSTGRES_JSON_KINDS.get(value_type)
+    return _SQLITE_JSON_KINDS.get(value_type)
+
+
+def _payload_schema(query) -> dict:
+    """Колонки entry_payload и их типы для выгрузки, до чтения самих строк.
+
+    Ключи и типы data считает БД (_data_kinds); колонки идут в порядке
+    первой строки по id, где встретился ключ, затем month и source. На БД
+    без JSON-функций — проходом по строкам, как раньше.
+    """
+    totals = query.with_entities(
+        func.count(CRMEntry.id), func.count(CRMEntry.payment_date), func.count(CRMEntry.source),
+    ).order_by(None).one()
+    rows, dated, with_source = totals
+    if not rows:
+        return {}
+    data_kinds = _data_kinds(query)
+    if data_kinds is None:
+        return _scanned_schema(query)
+    dialect = query.session.get_bind().dialect.name
+    data_kinds.sort(key=lambda item: (item[2], item[3]))
+    schema = merge_schema((key, _json_kind(dialect, value_type)) for key, value_type, _, _ in data_kinds)
+    # month по дате платежа заменяет одноимённый ключ data, source — всегда из колонки
+    if dated:
+        schema["month"] = merge_schema([("month", schema.get("month")), ("month", "string")])["month"]
+    schema["source"] = "string" if with_source else None
+    return schema
+
+
+def _scanned_schema(query) -> dict:
+    """Колонки entry_payload и их типы по всем строкам запроса, без сборки самих строк."""
+    def payloads():
+        rows = query.with_entities(CRMEntry.data, CRMEntry.payment_date, CRMEntry.source)
+        for data, payment_date, source in rows.yield_per(STREAM_BATCH_ROWS):
+            yield data
+            if payment_date is not None:
+                yield {"month": MONTH_NAMES[payment_date.month - 1]}
+            yield {"source": source}
+    return collect_schema(payloads())
 
 # (эндпоинт /crm/combined_users_excel удалён по требованию)
 
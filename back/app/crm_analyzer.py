@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from .database import get_db, SessionLocal
 from .models import CRMEntry
+from .date_parsing import parse_dates
+from .fast_json import FastJSONResponse
 from .ai.ai import client, DEPLOY
 from datetime import datetime
 from typing import Dict, List, Any
@@ -104,7 +106,9 @@ def aggregate_trends(data: List[Dict]) -> Dict[str, Any]:
     print(f"DEBUG: Все найденные колонки с датами: {date_columns}")
     
     # Создаем объединенную колонку с датами из всех найденных колонок
-    if date_columns:
+    if len(date_columns) == 1 and pd.api.types.is_datetime64_any_dtype(df[date_columns[0]]):
+        date_column = date_columns[0]
+    elif date_columns:
         print(f"DEBUG: Создаем объединенную колонку дат из: {date_columns}")
         df['combined_date'] = None
         
@@ -151,28 +155,9 @@ def aggregate_trends(data: List[Dict]) -> Dict[str, Any]:
             # Пытаемся преобразовать дату
             print(f"DEBUG: Примеры дат до преобразования: {df[date_column].head(10).tolist()}")
             
-            # Специальная обработка для дат в формате ISO
-            def parse_date(date_str):
-                if pd.isna(date_str) or date_str == '':
-                    return pd.NaT
-                try:
-                    # Пробуем стандартный парсинг
-                    return pd.to_datetime(date_str)
-                except:
-                    try:
-                        # Пробуем парсинг с dayfirst=True для формата DD.MM.YYYY
-                        return pd.to_datetime(date_str, dayfirst=True)
-                    except:
-                        try:
-                            # Пробуем парсинг ISO формата
-                            if 'T' in str(date_str):
-                                return pd.to_datetime(date_str, format='%Y-%m-%dT%H:%M:%S')
-                            else:
-                                return pd.NaT
-                        except:
-                            return pd.NaT
-            
-            df[date_column] = df[date_column].apply(parse_date)
+            # Даты разбираются по уникальным значениям (date_parsing); уже
+            # разобранные даты (типизированные колонки CRM) остаются как есть
+            df[date_column] = parse_dates(df[date_column])
             print(f"DEBUG: Преобразованные даты: {df[date_column].head(5).tolist()}")
             
             # Проверяем, сколько дат успешно преобразовано
@@ -374,6 +359,11 @@ def analyze_crm_only(db: Session = Depends(get_db)):
     try:
         crm_entries = db.query(CRMEntry).all()
         raw_data = [entry.data for entry in crm_entries]
+        # Сумма и дата уже разобраны при импорте — агрегируем по типизированным колонкам
+        typed_data = [
+            {"amount": entry.amount, "payment_date": entry.payment_date, "source": entry.source}
+            for entry in crm_entries
+        ]
         
         print(f"DEBUG: Найдено {len(raw_data)} записей в CRM")
         
@@ -381,6 +371,7 @@ def analyze_crm_only(db: Session = Depends(get_db)):
         if not raw_data:
             print("DEBUG: Создаем тестовые данные для CRM 2018-2024")
             raw_data = create_test_data_crm()
+            typed_data = None
         
         if raw_data:
             print(f"DEBUG: Пример первой записи: {raw_data[0]}")
@@ -389,7 +380,7 @@ def analyze_crm_only(db: Session = Depends(get_db)):
         print(f"DEBUG: После анонимизации осталось {len(anonymized_data)} записей")
         
         anonymized_data = convert_datetimes(anonymized_data)
-        aggregated_data = aggregate_trends(anonymized_data)
+        aggregated_data = aggregate_trends(typed_data or anonymized_data)
         aggregated_data = convert_datetimes(aggregated_data)
         
         print(f"DEBUG: Агрегированные данные: {aggregated_data}")
@@ -425,7 +416,8 @@ def analyze_excel_2025_only():
     """Анализирует только данные 2025 года (Excel 2025, память), обезличивает и отправляет в AI."""
     try:
         try:
-            from .merge_excel import all_users_data
+            from .merge_excel import current_rows
+            all_users_data = current_rows()
             raw_data = all_users_data.copy()
         except ImportError:
             return {"error": "Модуль Excel 2025 не найден"}
@@ -479,7 +471,8 @@ def analyze_excel_2025_only():
 def test_excel_2025_sample():
     """Тестовый эндпоинт для проверки данных Excel 2025"""
     try:
-        from .merge_excel import all_users_data
+        from .merge_excel import current_rows
+        all_users_data = current_rows()
         if not all_users_data:
             return {"error": "Нет данных в Excel 2025", "total": 0}
         
@@ -534,18 +527,19 @@ def test_crm_database_sample(db: Session = Depends(get_db)):
     except Exception as e:
         return {"error": str(e)}
 
-@router.get("/debug/crm_data", tags=["Debug"])
+@router.get("/debug/crm_data", tags=["Debug"], response_class=FastJSONResponse)
 def debug_crm_data(db: Session = Depends(get_db)):
     """Отладочный эндпоинт для проверки данных в CRM"""
     try:
-        crm_entries = db.query(CRMEntry).all()
-        raw_data = [entry.data for entry in crm_entries]
+        # Для образца не нужна вся таблица: count + первые 3 строки
+        total_entries = db.query(CRMEntry).count()
+        raw_data = [entry.data for entry in db.query(CRMEntry).order_by(CRMEntry.id).limit(3)]
         
-        return {
-            "total_entries": len(raw_data),
-            "sample_data": raw_data[:3] if raw_data else [],
+        return FastJSONResponse({
+            "total_entries": total_entries,
+            "sample_data": raw_data,
             "columns_in_sample": list(raw_data[0].keys()) if raw_data else []
-        }
+        })
     except Exception as e:
         return {"error": str(e)}
 
@@ -553,7 +547,8 @@ def debug_crm_data(db: Session = Depends(get_db)):
 def debug_excel_2025_data():
     """Отладочный эндпоинт для проверки данных Excel 2025"""
     try:
-        from .merge_excel import all_users_data
+        from .merge_excel import current_rows
+        all_users_data = current_rows()
         return {
             "total_entries": len(all_users_data),
             "sample_data": all_users_data[:3] if all_users_data else [],
@@ -638,7 +633,8 @@ def compare_periods():
         
         # Получаем данные CRM 2025
         try:
-            from .merge_excel import all_users_data
+            from .merge_excel import current_rows
+            all_users_data = current_rows()
             excel_raw_data = all_users_data.copy()
         except ImportError:
             excel_raw_data = []
@@ -0,0 +1,243 @@
+"""Пакетная вставка CRMEntry при импорте Excel.
+
+Строки идут потоком фиксированными пачками: на PostgreSQL через COPY,
+на остальных БД (SQLite) через executemany. ORM-объекты не создаются,
+поэтому память не растёт вместе с размером загрузки.
+
+Импорт идемпотентен: для каждой пачки одним запросом ищутся уже
+сохранённые строки с теми же row_key (см. import_keys), а уникальный
+индекс по row_key не даёт записать строку дважды и при одновременных
+импортах. Новые строки вставляются, изменившиеся обновляются
+(mode="upsert"), одинаковые пропускаются. Каждая строка привязывается к партии своего файла
+(batch_id, см. import_batches). Индекс доноров (donor_index), сводка по донорам
+(donor_summary) и каталог файлов (import_batches) обновляются в той же
+транзакции.
+"""
+import csv
+import io
+import json
+import logging
+import os
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from sqlalchemy import bindparam, delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from . import donor_index, donor_summary, import_batches
+from .crm_fields import TYPED_COLUMNS
+from .models import CRMEntry, DonorKey, DonorSummary, ImportBatch
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = int(os.getenv("CRM_BULK_BATCH_SIZE", "5000"))
+# Сколько ключей передавать в один IN (...) — ограничение SQLite на число параметров
+KEY_LOOKUP_CHUNK = 500
+
+# Колонки crm_entries, которые заполняются при импорте
+COPY_COLUMNS = ("data", "source", "filename", "file_hash", "row_key", "batch_id") + TYPED_COLUMNS
+
+IMPORT_MODES = ("upsert", "skip")
+
+_table = CRMEntry.__table__
+
+
+def iter_batches(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    """Режет поток строк на списки длиной size (последний может быть короче)."""
+    it = iter(rows)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _copy_value(value):
+    return value if value is not None else r"\N"
+
+
+def _copy_batch(cursor, batch: list[dict]):
+    """COPY одной пачки в crm_entries (PostgreSQL, psycopg2)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for entry in batch:
+        writer.writerow(
+            [json.dumps(entry["data"], ensure_ascii=False)]
+            + [_copy_value(entry.get(column)) for column in COPY_COLUMNS[1:]]
+        )
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {CRMEntry.__tablename__} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer,
+    )
+
+
+def _batch_writer(db: Session):
+    """Функция вставки пачки: COPY на PostgreSQL/psycopg2, иначе executemany."""
+    connection = db.connection()
+    if connection.dialect.name == "postgresql":
+        # COPY доступен только через курсор psycopg2
+        cursor = connection.connection.cursor()
+        if hasattr(cursor, "copy_expert"):
+            return lambda batch: _copy_batch(cursor, batch)
+
+    def execute_many(batch):
+        connection.execute(insert(_table), [
+            {column: entry.get(column) for column in COPY_COLUMNS} for entry in batch
+        ])
+    return execute_many
+
+
+def _existing_by_key(db: Session, keys: list[str]) -> dict:
+    """Уже сохранённые строки по row_key (запросы по KEY_LOOKUP_CHUNK ключей)."""
+    found = {}
+    columns = (_table.c.id, _table.c.row_key, _table.c.data, _table.c.source, _table.c.filename, _table.c.file_hash,
+               _table.c.donor_key, _table.c.batch_id)
+    for start in range(0, len(keys), KEY_LOOKUP_CHUNK):
+        chunk = keys[start:start + KEY_LOOKUP_CHUNK]
+        for row in db.execute(select(*columns).where(_table.c.row_key.in_(chunk))):
+            found[row.row_key] = row
+    return found
+
+
+def _ids_by_key(db: Session, keys: list[str]) -> dict[str, int]:
+    """id строк по row_key (только что вставленных пачкой, без чтения data)."""
+    ids = {}
+    for start in range(0, len(keys), KEY_LOOKUP_CHUNK):
+        chunk = keys[start:start + KEY_LOOKUP_CHUNK]
+        for row in db.execute(select(_table.c.id, _table.c.row_key).where(_table.c.row_key.in_(chunk))):
+            ids[row.row_key] = row.id
+    return ids
+
+
+def import_entries(
+    db: Session,
+    entries: Iterable[dict],
+    mode: str = "upsert",
+    batch_size: int = BULK_BATCH_SIZE,
+    on_batch: Callable[[int, dict], None] | None = None,
+) -> dict:
+    """Идемпотентный импорт записей с row_key. Возвращает счётчики
+    {'inserted', 'updated', 'skipped'}.
+
+    mode="upsert" обновляет строки, у которых изменилось содержимое,
+    mode="skip" никогда не трогает уже сохранённые строки.
+    Коммит не делается.
+    """
+    write = _batch_writer(db)
+    update = (
+        _table.update()
+        .where(_table.c.id == bindparam("_id"))
+        .values(
+            data=bindparam("data"),
+            source=bindparam("source"),
+            filename=bindparam("filename"),
+            file_hash=bindparam("file_hash"),
+            batch_id=bindparam("batch_id"),
+            **{column: bindparam(column) for column in TYPED_COLUMNS},
+        )
+    )
+    retag = (
+        _table.update()
+        .where(_table.c.id == bindparam("_id"))
+        .values(file_hash=bindparam("file_hash"))
+    )
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    # Партии файлов этой загрузки (с хэшем версии) и партии, из которых ушли обновлённые строки
+    file_batches: dict[str, int] = {}
+    imported_batches: dict[int, str | None] = {}
+    left_batches = set()
+    for batch_no, batch in enumerate(iter_batches(entries, batch_size), start=1):
+        new_files = {entry["filename"] for entry in batch} - file_batches.keys()
+        if new_files:
+            file_batches.update(import_batches.batch_ids(db, new_files))
+        existing = _existing_by_key(db, list({entry["row_key"] for entry in batch}))
+        new_rows: dict[str, dict] = {}
+        changed = []
+        retagged = []
+        # Ключи доноров, чью сводку нужно пересчитать после пачки
+        touched = set()
+        for entry in batch:
+            key = entry["row_key"]
+            current = existing.get(key)
+            entry["batch_id"] = file_batches.get(entry["filename"])
+            imported_batches[entry["batch_id"]] = entry.get("file_hash")
+            if current is None:
+                if key in new_rows:
+                    # Тот же ключ встретился дважды в пачке (например, платёж в двух файлах):
+                    # upsert берёт последнюю строку, skip оставляет первую
+                    if mode == "skip":
+                        counts["skipped"] += 1
+                        continue
+                    counts["updated"] += 1
+                new_rows[key] = entry
+                touched.add(entry.get("donor_key"))
+            elif mode == "skip" or (
+                current.data == entry["data"]
+                and current.source == entry["source"]
+                and current.filename == entry["filename"]
+            ):
+                counts["skipped"] += 1
+                if current.file_hash != entry.get("file_hash"):
+                    # Строка есть и в новой версии файла — помечаем её хэшем этой версии
+                    retagged.append({"_id": current.id, "file_hash": entry.get("file_hash")})
+            else:
+                touched.update((current.donor_key, entry.get("donor_key")))
+                left_batches.add(current.batch_id)
+                changed.append({
+                    "_id": current.id,
+                    "data": entry["data"],
+                    "source": entry["source"],
+                    "filename": entry["filename"],
+                    "file_hash": entry.get("file_hash"),
+                    "batch_id": entry["batch_id"],
+                    **{column: entry.get(column) for column in TYPED_COLUMNS},
+                })
+        if new_rows:
+            write(list(new_rows.values()))
+            counts["inserted"] += len(new_rows)
+            # id новых строк известны только после вставки
+            inserted = _ids_by_key(db, list(new_rows))
+            donor_index.index_entries(db, ((inserted[key], entry["data"]) for key, entry in new_rows.items()))
+        if changed:
+            db.execute(update, changed)
+            counts["updated"] += len(changed)
+            donor_index.unindex_entries(db, (row["_id"] for row in changed))
+            donor_index.index_entries(db, ((row["_id"], row["data"]) for row in changed))
+        if retagged:
+            db.execute(retag, retagged)
+        donor_summary.refresh(db, touched)
+        logger.info("Импорт CRM: пачка %s, %s", batch_no, counts)
+        if on_batch:
+            on_batch(batch_no, dict(counts))
+    # Каталог пересчитывается один раз на загрузку: файлов мало, а строк в них много
+    import_batches.refresh(db, left_batches, imported_batches)
+    return counts
+
+
+def truncate_entries(db: Session) -> int:
+    """Удаляет все строки CRM вместе с индексом и сводкой доноров и каталогом партий.
+
+    На PostgreSQL — TRUNCATE (без построчного удаления и раздувания
+    таблиц), на остальных БД — DELETE без условий. Возвращает число
+    удалённых строк. Коммит не делается.
+    """
+    deleted = db.query(func.count(CRMEntry.id)).scalar() or 0
+    if db.get_bind().dialect.name == "postgresql":
+        tables = (DonorKey, DonorSummary, CRMEntry, ImportBatch)
+        db.execute(text(f"TRUNCATE {', '.join(model.__tablename__ for model in tables)}"))
+    else:
+        donor_index.unindex_where(db)
+        donor_summary.clear(db)
+        db.execute(delete(_table))
+        import_batches.clear(db)
+    return deleted
+
+
+def imported_file_rows(db: Session, file_hash: str, source: str, filename: str) -> int:
+    """Сколько строк уже сохранено из этого же файла с тем же источником и именем."""
+    return db.query(func.count(CRMEntry.id)).filter(
+        CRMEntry.file_hash == file_hash,
+        CRMEntry.source == source,
+        CRMEntry.filename == filename,
+    ).scalar() or 0
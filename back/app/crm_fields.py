@@ -0,0 +1,202 @@
+"""Типизированные поля CRMEntry, извлекаемые из data один раз при импорте.
+
+Правила повторяют то, что раньше делали эндпоинты crm.py на каждом запросе:
+дата — первое непустое из "Дата" / "Дата платежа" / "Дата и время"
+(разбор date_parsing.parse_date), сумма — первое из "Сумма" /
+"Сумма операции" / "Кредит" / "Дебет", которое приводится к числу, ИИН и
+ФИО — из одноимённых полей или из поля отправителя.
+
+Модуль не зависит от БД, поэтому его используют и импорт, и миграции.
+"""
+import math
+import re
+
+from .date_parsing import parse_date
+
+MONTH_NAMES = [
+    'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+    'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'
+]
+_MONTH_NUMBERS = {name.lower(): number for number, name in enumerate(MONTH_NAMES, start=1)}
+
+DATE_FIELDS = ("Дата", "Дата платежа", "Дата и время")
+AMOUNT_FIELDS = ("Сумма", "Сумма операции", "Кредит", "Дебет")
+SENDER_FIELD = "Отправитель (Наименование, БИК, ИИК, БИН/ИИН)"
+CONTACT_FIELD = "E-mail & phone number"
+EMAIL_FIELDS = (CONTACT_FIELD, "E-mail", "Электронная почта", "email")
+PHONE_FIELDS = ("Номер телефон ", "Номер телефона", "телефон", "Телефон", CONTACT_FIELD)
+
+# Колонки CRMEntry, которые заполняет extract_typed_fields
+TYPED_COLUMNS = (
+    "payment_date", "year", "month", "amount", "iin",
+    "normalized_fio", "email", "phone", "gender", "language", "donor_key",
+)
+
+# Поля, по первому непустому из которых строки группируются в донора (тип донатора)
+DONOR_KEY_FIELDS = ("ИИН", "ФИО", CONTACT_FIELD, "Номер телефон ")
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_RE = re.compile(r"\+?\d[\d\s()\-]{5,}\d")
+_SENDER_IIN_RE = re.compile(r'(?:ИИН|БИН): ?(\d{10,12})', re.IGNORECASE)
+
+
+def normalize(value: str | None) -> str | None:
+    """Приводит строку к нижнему регистру, убирает лишние пробелы/переводы строк."""
+    if not value or not isinstance(value, str):
+        return None
+    return re.sub(r"\s+", " ", value).strip().lower()
+
+
+def extract_fio_iin(sender_str: str | None):
+    """Возвращает (fio, iin) из составной строки отправителя."""
+    fio = None
+    iin = None
+    if sender_str and isinstance(sender_str, str):
+        # Первая строка до перевода строки обычно содержит ФИО
+        fio = sender_str.split('\n')[0].strip()
+        match = _SENDER_IIN_RE.search(sender_str)
+        if match:
+            iin = match.group(1)
+    return fio, iin
+
+
+def parse_payment_date(data: dict):
+    """Дата платежа из первого непустого поля даты или None."""
+    date_str = next((data.get(field) for field in DATE_FIELDS if data.get(field)), None)
+    if not isinstance(date_str, str):
+        return None
+    # В БД храним локальное время без часового пояса
+    return parse_date(date_str)
+
+
+def parse_amount(data: dict) -> float | None:
+    """Сумма из первого поля суммы, которое приводится к числу; inf/NaN — None."""
+    for field in AMOUNT_FIELDS:
+        value = data.get(field)
+        if value is None:
+            continue
+        try:
+            amount = float(value)
+        except (TypeError, ValueError):
+            continue
+        return amount if math.isfinite(amount) else None
+    return None
+
+
+def month_number(value) -> int | None:
+    """Номер месяца по русскому названию ("Январь" -> 1)."""
+    if not isinstance(value, str):
+        return None
+    return _MONTH_NUMBERS.get(value.strip().lower())
+
+
+def _iin(data: dict, sender_iin: str | None) -> str | None:
+    value = data.get("ИИН")
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip() if value is not None else ""
+    return text or sender_iin
+
+
+def _email(data: dict) -> str | None:
+    for field in EMAIL_FIELDS:
+        value = data.get(field)
+        if isinstance(value, str):
+            match = _EMAIL_RE.search(value)
+            if match:
+                return match.group(0).lower()
+    return None
+
+
+def _phone(data: dict) -> str | None:
+    """Телефон только цифрами (без +, пробелов и скобок)."""
+    for field in PHONE_FIELDS:
+        value = data.get(field)
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if isinstance(value, int):
+            value = str(value)
+        if isinstance(value, str):
+            # Цифры из e-mail в общем поле контакта за телефон не считаем
+            match = _PHONE_RE.search(_EMAIL_RE.sub(" ", value))
+            if match:
+                return re.sub(r"\D", "", match.group(0))
+    return None
+
+
+def donor_key(data: dict) -> str | None:
+    """Ключ группировки донора: первое непустое из DONOR_KEY_FIELDS как есть.
+
+    Строки не нормализуются, чтобы группы совпадали с прежней группировкой
+    в /crm/filter; числа (ИИН из Excel) приводятся к целому виду.
+    """
+    for field in DONOR_KEY_FIELDS:
+        value = data.get(field)
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                continue
+            if value.is_integer():
+                value = int(value)
+        if value:
+            return str(value)
+    return None
+
+
+def donor_tokens(data: dict | None) -> set[tuple[str, str]]:
+    """Токены донора для индекса donor_keys: пары (вид, нормализованное значение).
+
+    "candidate" — ровно те строки, с которыми /crm/donator_profile сравнивает
+    ключ поиска (ИИН, ФИО, контакты, отправитель и извлечённые из него ФИО/ИИН);
+    "iin", "fio", "email", "phone" — нормализованные значения для точного поиска.
+    """
+    data = data or {}
+    sender_raw = data.get(SENDER_FIELD)
+    fio_from_sender, iin_from_sender = extract_fio_iin(sender_raw)
+    tokens = set()
+    for cand in (
+        data.get("ИИН"), data.get("ФИО"), data.get(CONTACT_FIELD), data.get("Номер телефон "),
+        fio_from_sender, iin_from_sender, sender_raw,
+    ):
+        token = normalize(str(cand)) if cand is not None else None
+        if token:
+            tokens.add(("candidate", token))
+    for iin in (_iin(data, None), iin_from_sender):
+        if iin:
+            tokens.add(("iin", iin))
+    fio = data.get("ФИО")
+    for kind, value in (
+        ("fio", normalize(fio) or normalize(fio_from_sender)),
+        ("email", _email(data)),
+        ("phone", _phone(data)),
+    ):
+        if value:
+            tokens.add((kind, value))
+    return tokens
+
+
+def _lower(value) -> str | None:
+    if not isinstance(value, str):
+        return None
+    return value.strip().lower() or None
+
+
+def extract_typed_fields(data: dict | None) -> dict:
+    """Значения типизированных колонок CRMEntry для строки data."""
+    data = data or {}
+    payment_date = parse_payment_date(data)
+    fio_from_sender, iin_from_sender = extract_fio_iin(data.get(SENDER_FIELD))
+    fio = data.get("ФИО")
+    return {
+        "payment_date": payment_date,
+        "year": payment_date.year if payment_date else None,
+        # Без даты месяц берётся из названия листа, записанного при импорте
+        "month": payment_date.month if payment_date else month_number(data.get("month")),
+        "amount": parse_amount(data),
+        "iin": _iin(data, iin_from_sender),
+        "normalized_fio": normalize(fio) or normalize(fio_from_sender) or None,
+        "email": _email(data),
+        "phone": _phone(data),
+        "gender": _lower(data.get("gender") or data.get("пол")),
+        "language": _lower(data.get("language") or data.get("язык")),
+        "donor_key": donor_key(data),
+    }
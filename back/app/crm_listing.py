@@ -0,0 +1,170 @@
+"""Постраничная выдача и потоковые ответы для списков CRM.
+
+limit + after — keyset-пагинация: страница отбирается условием по ключу
+сортировки и id последней строки предыдущей страницы, без OFFSET, поэтому
+стоимость страницы не зависит от её номера. Курсор следующей страницы
+возвращается в заголовке X-Next-Cursor (тело ответа остаётся массивом).
+
+stream=ndjson|array отдаёт строки по мере чтения из БД (yield_per),
+не собирая весь ответ в памяти.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Callable, Iterable, Iterator
+
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query, Session
+
+from .database import SessionLocal
+from .fast_json import dumps
+from .models import CRMEntry
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 10000
+# Сколько строк читать из БД и отдавать клиенту за один кусок
+STREAM_BATCH_ROWS = 1000
+
+SORT_COLUMNS = {
+    "id": CRMEntry.id,
+    "payment_date": CRMEntry.payment_date,
+    "amount": CRMEntry.amount,
+    "source": CRMEntry.source,
+}
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "array": "application/json",
+}
+SORT_PATTERN = "^-?(" + "|".join(SORT_COLUMNS) + ")$"
+STREAM_PATTERN = "^(" + "|".join(STREAM_FORMATS) + ")$"
+
+
+def _parse_sort(sort: str | None):
+    sort = sort or "id"
+    name = sort.lstrip("-")
+    if name not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort: {sort}")
+    return sort, SORT_COLUMNS[name], sort.startswith("-")
+
+
+def _sort_value(entry: CRMEntry, column):
+    value = getattr(entry, column.key)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_cursor(sort: str, entry: CRMEntry) -> str:
+    _, column, _ = _parse_sort(sort)
+    payload = json.dumps({"s": sort, "v": _sort_value(entry, column), "id": entry.id}, ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort: str):
+    """(значение ключа сортировки, id) из курсора; 400, если курсор от другой сортировки."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        value, last_id = payload["v"], int(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if payload.get("s") != sort:
+        raise HTTPException(status_code=400, detail="Cursor was issued for another sort")
+    if value is not None and SORT_COLUMNS[sort.lstrip("-")] is CRMEntry.payment_date:
+        value = datetime.fromisoformat(value)
+    return value, last_id
+
+
+def apply_keyset(query: Query, sort: str | None, after: str | None) -> Query:
+    """Сортирует запрос по sort (+ id) и отрезает строки до курсора after.
+
+    NULL в ключе сортировки всегда идут в конце, в обоих направлениях.
+    """
+    sort, column, desc = _parse_sort(sort)
+    id_column = CRMEntry.id
+    if column is id_column:
+        order = [id_column.desc() if desc else id_column]
+    else:
+        order = [column.is_(None), column.desc() if desc else column, id_column.desc() if desc else id_column]
+    query = query.order_by(None).order_by(*order)
+    if not after:
+        return query
+
+    value, last_id = decode_cursor(after, sort)
+    after_id = id_column < last_id if desc else id_column > last_id
+    if column is id_column:
+        return query.filter(after_id)
+    if value is None:
+        return query.filter(column.is_(None), after_id)
+    after_value = column < value if desc else column > value
+    return query.filter(or_(after_value, and_(column == value, after_id), column.is_(None)))
+
+
+def _stream_body(rows: Iterable[dict], stream: str) -> Iterator[bytes]:
+    """Тело ответа кусками по STREAM_BATCH_ROWS строк (NaN/Inf -> null, см. fast_json)."""
+    chunk = []
+    first = True
+    if stream == "array":
+        yield b"["
+    for row in rows:
+        if stream == "ndjson":
+            chunk.append(dumps(row) + b"\n")
+        else:
+            chunk.append(dumps(row) if first else b"," + dumps(row))
+        first = False
+        if len(chunk) >= STREAM_BATCH_ROWS:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+    if stream == "array":
+        yield b"]"
+
+
+def stream_query(build_query: Callable[[Session], Query], payload, sort: str | None = None) -> Iterator[dict]:
+    """Строки запроса по мере чтения из БД, в своей сессии (для потоковых ответов)."""
+    # Сессия зависимости get_db закрывается до отправки тела — открываем свою
+    db = SessionLocal()
+    try:
+        query = build_query(db)
+        if sort:
+            query = apply_keyset(query, sort, None)
+        for entry in query.yield_per(STREAM_BATCH_ROWS):
+            yield payload(entry)
+    finally:
+        db.close()
+
+
+def list_entries(
+    db: Session,
+    response: Response,
+    build_query: Callable[[Session], Query],
+    payload: Callable[[CRMEntry], dict],
+    limit: int | None = None,
+    after: str | None = None,
+    sort: str | None = None,
+    stream: str | None = None,
+):
+    """Общая выдача списка CRM: целиком, страницей (limit/after/sort) или потоком."""
+    if limit is None and after is None:
+        if stream:
+            return StreamingResponse(
+                _stream_body(stream_query(build_query, payload, sort), stream),
+                media_type=STREAM_FORMATS[stream],
+            )
+        query = build_query(db)
+        if sort:
+            query = apply_keyset(query, sort, None)
+        return [payload(entry) for entry in query]
+
+    limit = min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+    # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+    entries = apply_keyset(build_query(db), sort, after).limit(limit + 1).all()
+    headers = {}
+    if len(entries) > limit:
+        entries = entries[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(sort or "id", entries[-1])
+    rows = [payload(entry) for entry in entries]
+    if stream:
+        return StreamingResponse(_stream_body(rows, stream), media_type=STREAM_FORMATS[stream], headers=headers)
+    response.headers.update(headers)
+    return rows
@@ -0,0 +1,119 @@
+"""Разбор дат из выписок и параметров запросов.
+
+В данных встречается несколько форматов (DD.MM.YYYY, DD/MM/YYYY, ISO с
+временем и без), а значения сильно повторяются. Поэтому формат
+угадывается регулярным выражением и дата собирается без dateutil, а
+результат по исходной строке кэшируется (LRU). Всё непохожее на
+известные форматы разбирает dateutil, с тем же кэшем.
+
+parse_date — основной разбор: с точкой или слэшем день идёт первым,
+остальное (ISO) — как есть. parse_dotted_date — строгий разбор Excel 2025:
+только DD.MM.YYYY, DD/MM/YYYY и дата ISO без времени. parse_dates —
+то же для колонки pandas: каждое уникальное значение разбирается один раз.
+
+Возвращается datetime без часового пояса (локальное время выписки) или None.
+"""
+import math
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Callable
+
+import pandas as pd
+from dateutil.parser import parse as dateutil_parse
+
+CACHE_SIZE = 65536
+EMPTY_STRINGS = {"", "nan", "nat", "none"}
+
+# День первым: 05.03.2024, 5/3/2024, 05.03.2024 10:11[:12]
+_DAY_FIRST = re.compile(
+    r"(?P<day>\d{1,2})(?P<sep>[./])(?P<month>\d{1,2})(?P=sep)(?P<year>\d{4})"
+    r"(?:[ T](?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?)?"
+)
+# ISO: 2024-03-05, 2024-03-05T10:00:00[.ffffff][+06:00]
+_ISO = re.compile(r"\d{4}-\d{2}-\d{2}(?:[ T].*)?")
+
+
+def _naive(value: datetime) -> datetime:
+    return value.replace(tzinfo=None)
+
+
+def _day_first(match) -> datetime:
+    parts = match.groupdict()
+    return datetime(
+        int(parts["year"]), int(parts["month"]), int(parts["day"]),
+        int(parts["hour"] or 0), int(parts["minute"] or 0), int(parts["second"] or 0),
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_string(text: str) -> datetime | None:
+    try:
+        match = _DAY_FIRST.fullmatch(text)
+        if match:
+            return _day_first(match)
+        if _ISO.fullmatch(text):
+            return _naive(datetime.fromisoformat(text))
+    except ValueError:
+        # 05.13.2024 и подобное dateutil разбирает с перестановкой дня и месяца
+        pass
+    try:
+        if "." in text or "/" in text:
+            return _naive(dateutil_parse(text, dayfirst=True))
+        return _naive(dateutil_parse(text))
+    except (ValueError, OverflowError):
+        return None
+
+
+def _as_text(value) -> str | None:
+    """Строка для разбора или None для пустых значений (None, NaN, 'nan', '')."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    text = str(value).strip()
+    return None if text.lower() in EMPTY_STRINGS else text
+
+
+def parse_date(value) -> datetime | None:
+    """Дата из строки любого поддерживаемого формата; datetime/date возвращаются как есть."""
+    if isinstance(value, datetime):
+        return None if value != value else _naive(value)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    text = _as_text(value)
+    return _parse_string(text) if text else None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_dotted_string(text: str) -> datetime | None:
+    for separator, date_format in ((".", "%d.%m.%Y"), ("/", "%d/%m/%Y")):
+        if separator in text and len(text.split(separator)) == 3:
+            try:
+                return datetime.strptime(text, date_format)
+            except ValueError:
+                pass
+    if "-" in text and len(text.split("-")) == 3:
+        try:
+            return datetime.fromisoformat(text.split("T")[0])
+        except ValueError:
+            pass
+    return None
+
+
+def parse_dotted_date(value) -> datetime | None:
+    """Строгий разбор дат Excel 2025: DD.MM.YYYY, DD/MM/YYYY или YYYY-MM-DD (время отбрасывается)."""
+    if not value:
+        return None
+    return _parse_dotted_string(str(value).strip())
+
+
+def parse_dates(values: pd.Series, parser: Callable[[object], datetime | None] = parse_date) -> pd.Series:
+    """Колонка datetime64 из колонки значений; нераспознанные — NaT."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    uniques = pd.unique(values[values.notna()])
+    parsed = {value: parser(value) for value in uniques}
+    return pd.to_datetime(values.map(parsed), errors="coerce")
+
+
+def cache_info() -> dict:
+    return {"parse_date": _parse_string.cache_info()._asdict(), "parse_dotted_date": _parse_dotted_string.cache_info()._asdict()}
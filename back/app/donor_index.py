@@ -0,0 +1,113 @@
+"""Индекс доноров donor_keys для /crm/donator_profile.
+
+Для каждой строки CRM хранятся токены crm_fields.donor_tokens: строки,
+с которыми профиль сравнивает ключ поиска, и нормализованные ИИН, ФИО,
+e-mail и телефон. Индекс обновляется при импорте, ручном добавлении и
+удалении строк, поэтому поиск донора и добор записей по ИИН идут по
+индексу donor_keys.token, а не перебором всей crm_entries.
+"""
+import logging
+from typing import Iterable
+
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from . import donor_search
+from .crm_fields import donor_tokens
+from .models import CRMEntry, DonorKey
+
+logger = logging.getLogger(__name__)
+
+# Сколько id передавать в один IN (...) при удалении
+ID_CHUNK = 500
+# Для ключей не длиннее этого "кандидат — подстрока ключа" ищется по индексу
+# через перечисление всех подстрок ключа
+MAX_SUBSTRING_KEY = 64
+
+_table = DonorKey.__table__
+
+
+def index_entries(db: Session, entries: Iterable[tuple[int, dict]]) -> int:
+    """Добавляет токены строк (id, data) в индекс. Коммит не делается."""
+    rows = [
+        {"entry_id": entry_id, "kind": kind, "token": token}
+        for entry_id, data in entries
+        for kind, token in donor_tokens(data)
+    ]
+    if rows:
+        db.execute(insert(_table), rows)
+    return len(rows)
+
+
+def unindex_entries(db: Session, entry_ids: Iterable[int]):
+    """Удаляет токены строк с указанными id."""
+    entry_ids = list(entry_ids)
+    for start in range(0, len(entry_ids), ID_CHUNK):
+        db.execute(delete(_table).where(_table.c.entry_id.in_(entry_ids[start:start + ID_CHUNK])))
+
+
+def unindex_where(db: Session, *conditions):
+    """Удаляет токены строк CRM, подходящих под условия (перед их удалением)."""
+    if not conditions:
+        db.execute(delete(_table))
+        return
+    db.execute(delete(_table).where(_table.c.entry_id.in_(select(CRMEntry.id).where(*conditions))))
+
+
+def rebuild(db: Session, batch_size: int = 5000) -> int:
+    """Пересобирает индекс по всей crm_entries. Коммит не делается."""
+    db.execute(delete(_table))
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(CRMEntry.id, CRMEntry.data)
+            .where(CRMEntry.id > last_id)
+            .order_by(CRMEntry.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        total += index_entries(db, ((row.id, row.data) for row in rows))
+        last_id = rows[-1].id
+    logger.info("Индекс доноров пересобран: %s токенов", total)
+    return total
+
+
+def _substrings(key: str) -> set[str]:
+    return {key[start:end] for start in range(len(key)) for end in range(start + 1, len(key) + 1)}
+
+
+def match_condition(db: Session, norm_key: str):
+    """Условие на donor_keys для ключа поиска профиля.
+
+    Совпадение, как и раньше: точное, ключ — подстрока кандидата или
+    кандидат — подстрока ключа; плюс точное совпадение ИИН/ФИО/e-mail/телефона.
+    """
+    candidate = DonorKey.kind == "candidate"
+    if len(norm_key) <= MAX_SUBSTRING_KEY:
+        token_in_key = DonorKey.token.in_(_substrings(norm_key))
+    else:
+        position = func.strpos if db.get_bind().dialect.name == "postgresql" else func.instr
+        token_in_key = position(norm_key, DonorKey.token) > 0
+    # Ключ — подстрока кандидата: по триграммному индексу (donor_search),
+    # на PostgreSQL — LIKE по GIN-индексу pg_trgm
+    containing = donor_search.tokens_containing(db, norm_key)
+    if containing is None:
+        key_in_token = DonorKey.token.contains(norm_key, autoescape=True)
+    else:
+        key_in_token = DonorKey.token.in_(containing)
+    return or_(
+        DonorKey.token == norm_key,
+        and_(candidate, or_(token_in_key, key_in_token)),
+    )
+
+
+def matching_entry_ids(db: Session, norm_key: str):
+    """Подзапрос id строк CRM, подходящих под ключ поиска."""
+    return select(DonorKey.entry_id).where(match_condition(db, norm_key))
+
+
+def entry_ids_by_iin(iin: str):
+    """Подзапрос id строк CRM с данным ИИН (в поле "ИИН" или в отправителе)."""
+    return select(DonorKey.entry_id).where(DonorKey.kind == "iin", DonorKey.token == iin)
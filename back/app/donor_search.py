@@ -0,0 +1,212 @@
+"""Поиск доноров по подстроке: триграммный инвертированный индекс.
+
+Индексируются токены donor_keys вида "candidate" — нормализованные ФИО,
+строки отправителя, ИИН и контакты, с которыми сравнивает
+/crm/donator_profile. Для каждой триграммы хранится множество токенов, где
+она встречается, поэтому "ключ — подстрока токена" проверяется только на
+токенах, содержащих все триграммы ключа.
+
+Индекс живёт в памяти процесса и догоняет donor_keys инкрементально:
+перед поиском сверяются max(id) и count(*) токенов, новые строки
+добавляются, удалённые строки CRM убираются. На PostgreSQL вместо него
+используется GIN-индекс pg_trgm по donor_keys.token.
+"""
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from sqlalchemy import distinct, func, literal, or_, select
+from sqlalchemy.orm import Session
+
+from .models import DonorKey
+
+logger = logging.getLogger(__name__)
+
+GRAM = 3
+# Порог похожести для нечёткого поиска (как pg_trgm.similarity_threshold)
+SIMILARITY_THRESHOLD = 0.3
+# Больше токенов в IN (...) не передаём — дешевле LIKE по колонке
+MAX_TOKENS_IN_QUERY = 5000
+INDEXED_KIND = "candidate"
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def similarity(left: str, right: str) -> float:
+    """Доля общих триграмм (Жаккар); для строк короче 3 символов — точное совпадение."""
+    left_grams, right_grams = trigrams(left), trigrams(right)
+    if not left_grams or not right_grams:
+        return 1.0 if left == right else 0.0
+    shared = len(left_grams & right_grams)
+    return shared / (len(left_grams) + len(right_grams) - shared)
+
+
+class TrigramIndex:
+    """Триграммный индекс токенов donor_keys -> id строк CRM."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self.token_entries: dict[str, set[int]] = {}
+        self.entry_tokens: dict[int, set[str]] = defaultdict(set)
+        self.grams: dict[str, set[str]] = defaultdict(set)
+        self.max_key_id = 0
+        self.size = 0
+
+    def _add(self, entry_id: int, token: str):
+        if token in self.entry_tokens[entry_id]:
+            return
+        self.entry_tokens[entry_id].add(token)
+        self.size += 1
+        entries = self.token_entries.get(token)
+        if entries is None:
+            entries = self.token_entries[token] = set()
+            for gram in trigrams(token):
+                self.grams[gram].add(token)
+        entries.add(entry_id)
+
+    def _remove_entry(self, entry_id: int):
+        for token in self.entry_tokens.pop(entry_id, ()):
+            self.size -= 1
+            entries = self.token_entries[token]
+            entries.discard(entry_id)
+            if not entries:
+                del self.token_entries[token]
+                for gram in trigrams(token):
+                    tokens = self.grams[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.grams[gram]
+
+    def _load(self, db: Session, after_id: int):
+        rows = db.execute(
+            select(DonorKey.id, DonorKey.entry_id, DonorKey.token)
+            .where(DonorKey.kind == INDEXED_KIND, DonorKey.id > after_id)
+            .order_by(DonorKey.id)
+        ).all()
+        # При повторном импорте строки её токены удаляются и пишутся заново целиком
+        for entry_id in {row.entry_id for row in rows}:
+            self._remove_entry(entry_id)
+        for row in rows:
+            self._add(row.entry_id, row.token)
+            self.max_key_id = row.id
+        return len(rows)
+
+    def sync(self, db: Session):
+        """Догоняет donor_keys: новые токены добавляет, токены удалённых строк убирает."""
+        with self._lock:
+            max_id, count = db.execute(
+                select(func.max(DonorKey.id), func.count(DonorKey.id)).where(DonorKey.kind == INDEXED_KIND)
+            ).one()
+            max_id, count = max_id or 0, count or 0
+            if max_id == self.max_key_id and count == self.size:
+                return
+            if max_id < self.max_key_id:
+                # Таблицу очищали и id пошли заново
+                self._clear()
+            added = self._load(db, self.max_key_id)
+            if self.size != count:
+                alive = set(db.execute(
+                    select(distinct(DonorKey.entry_id)).where(DonorKey.kind == INDEXED_KIND)
+                ).scalars())
+                for entry_id in set(self.entry_tokens) - alive:
+                    self._remove_entry(entry_id)
+            if self.size != count:
+                logger.info("Индекс поиска доноров расходится с donor_keys, пересборка")
+                self._clear()
+                added = self._load(db, 0)
+            logger.info("Индекс поиска доноров: +%s токенов, всего %s", added, self.size)
+
+    def containing(self, key: str) -> set[str]:
+        """Токены, в которых key встречается как подстрока."""
+        with self._lock:
+            grams = trigrams(key)
+            if not grams:
+                return {token for token in self.token_entries if key in token}
+            postings = sorted((self.grams.get(gram, set()) for gram in grams), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            return {token for token in candidates if key in token}
+
+    def contained_in(self, key: str) -> set[str]:
+        """Токены, которые сами являются подстрокой key."""
+        with self._lock:
+            found = {
+                key[start:end]
+                for start in range(len(key))
+                for end in range(start + 1, min(start + GRAM, len(key) + 1))
+                if key[start:end] in self.token_entries
+            }
+            for gram in trigrams(key):
+                found.update(token for token in self.grams.get(gram, ()) if token in key)
+            return found
+
+    def search(self, key: str, limit: int) -> list[dict]:
+        """Похожие на key токены, по убыванию похожести; подстроки — в любом случае."""
+        with self._lock:
+            matches = self.containing(key) | self.contained_in(key)
+            shared = Counter()
+            for gram in trigrams(key):
+                shared.update(self.grams.get(gram, ()))
+            key_grams = len(trigrams(key))
+            scored = {token: similarity(key, token) for token in matches}
+            for token, common in shared.items():
+                if token in scored:
+                    continue
+                score = common / (key_grams + len(trigrams(token)) - common)
+                if score >= SIMILARITY_THRESHOLD:
+                    scored[token] = score
+            ranked = sorted(scored.items(), key=lambda item: (item[0] not in matches, -item[1], item[0]))
+            return [
+                {
+                    "value": token,
+                    "similarity": round(score, 3),
+                    "substring": token in matches,
+                    "entries": len(self.token_entries.get(token, ())),
+                }
+                for token, score in ranked[:limit]
+            ]
+
+
+_index = TrigramIndex()
+
+
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def tokens_containing(db: Session, key: str) -> set[str] | None:
+    """Токены, содержащие key, по индексу в памяти; None — искать в БД (LIKE/pg_trgm)."""
+    if _is_postgres(db):
+        return None
+    _index.sync(db)
+    tokens = _index.containing(key)
+    return tokens if len(tokens) <= MAX_TOKENS_IN_QUERY else None
+
+
+def search(db: Session, key: str, limit: int = 20) -> list[dict]:
+    """Кандидаты для поиска донора по части ФИО/ИИН/контакта с оценкой похожести."""
+    if _is_postgres(db):
+        return _search_pg_trgm(db, key, limit)
+    _index.sync(db)
+    return _index.search(key, limit)
+
+
+def _search_pg_trgm(db: Session, key: str, limit: int) -> list[dict]:
+    score = func.similarity(DonorKey.token, key)
+    substring = or_(DonorKey.token.contains(key, autoescape=True), func.strpos(literal(key), DonorKey.token) > 0)
+    rows = db.execute(
+        select(DonorKey.token, score.label("score"), substring.label("substring"),
+               func.count(distinct(DonorKey.entry_id)).label("entries"))
+        .where(DonorKey.kind == INDEXED_KIND, or_(DonorKey.token.op("%")(key), substring))
+        .group_by(DonorKey.token)
+        .order_by(substring.desc(), score.desc(), DonorKey.token)
+        .limit(limit)
+    ).all()
+    return [
+        {"value": row.token, "similarity": round(row.score, 3), "substring": row.substring, "entries": row.entries}
+        for row in rows
+    ]
@@ -0,0 +1,114 @@
+"""Сводка по донорам donor_summary.
+
+Для каждого donor_key (первое непустое из ИИН, ФИО, контакта, телефона —
+тот же ключ, по которому /crm/filter считает тип донатора) хранятся число
+платежей, сумма и средняя сумма, первая/последняя дата, тип донатора и
+источники. Сводка пересчитывается только для затронутых ключей при
+импорте, ручном добавлении и удалении строк, поэтому фильтр по типу —
+индексированный JOIN, а не GROUP BY по всей crm_entries.
+"""
+import logging
+from typing import Iterable
+
+from sqlalchemy import delete, distinct, func, insert, select
+from sqlalchemy.orm import Session
+
+from .models import CRMEntry, DonorSummary
+
+logger = logging.getLogger(__name__)
+
+DONOR_TYPES = ("single", "periodic", "frequent")
+# Сколько ключей пересчитывать одним запросом
+KEY_CHUNK = 500
+
+_table = DonorSummary.__table__
+
+
+def donor_type(donations: int) -> str:
+    """Тип донатора по числу платежей: 1 — single, 2–4 — periodic, 5+ — frequent."""
+    if donations == 1:
+        return "single"
+    if donations <= 4:
+        return "periodic"
+    return "frequent"
+
+
+def type_conditions(count) -> dict:
+    """Те же границы типов для агрегата count в HAVING."""
+    return {
+        "single": count == 1,
+        "periodic": count.between(2, 4),
+        "frequent": count >= 5,
+    }
+
+
+def _summaries(db: Session, condition) -> list[dict]:
+    stats = db.execute(
+        select(
+            CRMEntry.donor_key,
+            func.count(CRMEntry.id).label("donations"),
+            func.sum(CRMEntry.amount).label("total_amount"),
+            func.count(CRMEntry.amount).label("amount_count"),
+            func.min(CRMEntry.payment_date).label("first_date"),
+            func.max(CRMEntry.payment_date).label("last_date"),
+            func.min(CRMEntry.id).label("first_entry_id"),
+        )
+        .where(condition)
+        .group_by(CRMEntry.donor_key)
+    ).all()
+    sources: dict[str, list[str]] = {}
+    for key, source in db.execute(
+        select(CRMEntry.donor_key, CRMEntry.source)
+        .where(condition, CRMEntry.source.isnot(None))
+        .distinct()
+        .order_by(CRMEntry.source)
+    ):
+        sources.setdefault(key, []).append(source)
+    return [
+        {
+            "donor_key": row.donor_key,
+            "donations": row.donations,
+            "total_amount": row.total_amount or 0,
+            "amount_count": row.amount_count,
+            "average_amount": (row.total_amount or 0) / row.amount_count if row.amount_count else 0,
+            "first_date": row.first_date,
+            "last_date": row.last_date,
+            "first_entry_id": row.first_entry_id,
+            "donor_type": donor_type(row.donations),
+            "sources": sources.get(row.donor_key, []),
+        }
+        for row in stats
+    ]
+
+
+def refresh(db: Session, donor_keys: Iterable[str | None]) -> int:
+    """Пересчитывает сводку для указанных ключей (ключи без строк удаляются). Коммит не делается."""
+    keys = sorted({key for key in donor_keys if key})
+    for start in range(0, len(keys), KEY_CHUNK):
+        chunk = keys[start:start + KEY_CHUNK]
+        db.execute(delete(_table).where(_table.c.donor_key.in_(chunk)))
+        rows = _summaries(db, CRMEntry.donor_key.in_(chunk))
+        if rows:
+            db.execute(insert(_table), rows)
+    return len(keys)
+
+
+def keys_where(db: Session, *conditions) -> set[str]:
+    """donor_key строк CRM, подходящих под условия (собрать до их удаления)."""
+    return set(db.execute(
+        select(distinct(CRMEntry.donor_key)).where(*conditions, CRMEntry.donor_key.isnot(None))
+    ).scalars())
+
+
+def clear(db: Session):
+    db.execute(delete(_table))
+
+
+def rebuild(db: Session) -> int:
+    """Пересобирает сводку по всей crm_entries. Коммит не делается."""
+    clear(db)
+    rows = _summaries(db, CRMEntry.donor_key.isnot(None))
+    if rows:
+        db.execute(insert(_table), rows)
+    logger.info("Сводка доноров пересобрана: %s доноров", len(rows))
+    return len(rows)
@@ -0,0 +1,275 @@
+"""Строки Excel 2025 в БД (excel_users) для нескольких воркеров uvicorn.
+
+Режим EXCEL_STORE_BACKEND=db. Источник истины — таблица excel_users:
+строка целиком лежит в data, ключевые поля (ФИО, E-mail, источник, файл,
+id строки) — в индексированных колонках. У каждого воркера остаётся своё
+ExcelStore — кэш для чтения, по нему считаются фильтры.
+
+Строка excel_store_state хранит версию набора (растёт при каждом
+изменении) и эпоху (растёт при удалении строк). Перед каждым запросом
+воркер сверяет свою версию с ней: новые и изменённые строки (version
+больше известной) дочитываются по индексу, после удаления кэш
+перечитывается целиком. Там же last_id — последний выданный id строки:
+после удаления строк он не уменьшается и у воркера, заново прочитавшего
+кэш.
+
+Изменения идут через writing(): первым оператором транзакции версия
+поднимается UPDATE-ом, строка версии блокируется до коммита, поэтому
+записи всех воркеров выполняются по очереди, а id строк в excel_users
+растут в порядке коммитов. Кэш догоняет БД под этой же блокировкой, и
+изменение применяется к актуальным данным; ExcelStore передаёт его в
+record() (как журналу), и оно пишется в той же транзакции.
+
+Воркер применяет изменения к черновику версии ExcelStore (copy()); текущую
+версию в это время читают запросы (см. merge_excel._new_version).
+"""
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .excel_store import ExcelStore
+from .models import ExcelStoreState, ExcelUser
+
+logger = logging.getLogger(__name__)
+
+EXCEL_STORE_BACKEND = os.getenv("EXCEL_STORE_BACKEND", "memory")
+# Строк на один INSERT ... RETURNING / DELETE и на одно чтение при загрузке кэша
+WRITE_CHUNK = 5000
+READ_CHUNK = 50_000
+
+_users = ExcelUser.__table__
+_state = ExcelStoreState.__table__
+STATE_ID = 1
+# Строки без data записаны не этим режимом (таблица была заведена раньше) — в набор не входят
+_stored = _users.c.data.isnot(None)
+
+# Поле строки -> строковая колонка excel_users
+TEXT_COLUMNS = {
+    "E-mail": "email",
+    "month": "month",
+    "Дата": "date",
+    "ФИО": "fio",
+    "телефон": "phone",
+    "язык": "language",
+    "источник": "source",
+    "filename": "filename",
+    "gender": "gender",
+}
+
+
+def _text(value) -> str | None:
+    if value is None or value == "":
+        return None
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    return str(value)
+
+
+def _amount(value) -> float | None:
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return None
+    return amount if math.isfinite(amount) else None
+
+
+def row_columns(row: dict) -> dict:
+    """Колонки excel_users для строки: data целиком и поля для индексов."""
+    values = {column: _text(row.get(field)) for field, column in TEXT_COLUMNS.items()}
+    row_id = row.get("id")
+    values["row_id"] = row_id if isinstance(row_id, int) and not isinstance(row_id, bool) else None
+    values["summa"] = _amount(row.get("Сумма"))
+    values["data"] = row
+    return values
+
+
+class ExcelDatabase:
+    """Синхронизация ExcelStore воркера с excel_users; журнал изменений store."""
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self.version: int | None = None
+        self.epoch: int | None = None
+        # id строк excel_users по позициям store (по возрастанию)
+        self.pks = np.empty(0, dtype=np.int64)
+        self._lock = threading.RLock()
+        self._db: Session | None = None
+        self._write_version = 0
+        self._write_epoch = 0
+        self._dirty = False
+
+    # ---------- версия ----------
+
+    def _read_state(self, db: Session) -> tuple[int, int, int]:
+        """(версия, эпоха, last_id)."""
+        state = db.execute(
+            select(_state.c.version, _state.c.epoch, _state.c.last_id).where(_state.c.id == STATE_ID)
+        ).first()
+        if state is not None:
+            return tuple(state)
+        try:
+            db.execute(insert(_state).values(id=STATE_ID, version=0, epoch=0, last_id=0))
+            db.commit()
+        except IntegrityError:
+            # Строку одновременно создал другой воркер
+            db.rollback()
+        return self._read_state(db)
+
+    # ---------- чтение ----------
+
+    def attach(self, store: ExcelStore) -> dict:
+        """Загружает кэш из БД и подключается к store журналом."""
+        started = time.perf_counter()
+        with self._lock, self._session_factory() as db:
+            self._catch_up(db, store, *self._read_state(db))
+        store.journal = self
+        stats = {"version": self.version, "rows": len(store), "seconds": round(time.perf_counter() - started, 3)}
+        logger.info("Кэш Excel 2025 загружен из БД: %s", stats)
+        return stats
+
+    def stale(self) -> bool:
+        """Отстал ли кэш от БД (проверка без блокировки, перед sync())."""
+        with self._session_factory() as db:
+            return self._read_state(db)[:2] != (self.version, self.epoch)
+
+    def sync(self, store: ExcelStore) -> bool:
+        """Догоняет кэш до версии в БД; True, если данные изменились."""
+        with self._lock, self._session_factory() as db:
+            state = self._read_state(db)
+            if state[:2] == (self.version, self.epoch):
+                return False
+            self._catch_up(db, store, *state)
+            return True
+
+    def _catch_up(self, db: Session, store: ExcelStore, version: int, epoch: int, last_id: int):
+        journal, store.journal = store.journal, None
+        try:
+            if epoch != self.epoch:
+                self._reload(db, store)
+            else:
+                self._apply_changes(db, store)
+        finally:
+            store.journal = journal
+        store.last_id = max(store.last_id, last_id)
+        self.version, self.epoch = version, epoch
+
+    def _reload(self, db: Session, store: ExcelStore):
+        store.clear()
+        pks = []
+        result = db.execute(
+            select(_users.c.id, _users.c.data).where(_stored).order_by(_users.c.id)
+            .execution_options(yield_per=READ_CHUNK)
+        )
+        for chunk in result.partitions():
+            pks.extend(pk for pk, _ in chunk)
+            store.append([data for _, data in chunk])
+        self.pks = np.array(pks, dtype=np.int64)
+
+    def _apply_changes(self, db: Session, store: ExcelStore):
+        """Строки с версией новее кэша: известные обновляются, новые добавляются в конец."""
+        changed = db.execute(
+            select(_users.c.id, _users.c.data).where(_stored, _users.c.version > self.version).order_by(_users.c.id)
+        ).all()
+        appended_pks, appended = [], []
+        for pk, data in changed:
+            position = int(np.searchsorted(self.pks, pk))
+            if position < len(self.pks) and self.pks[position] == pk:
+                store.update(position, data)
+            else:
+                appended_pks.append(pk)
+                appended.append(data)
+        if appended:
+            store.append(appended)
+            self.pks = np.concatenate([self.pks, np.array(appended_pks, dtype=np.int64)])
+
+    # ---------- запись ----------
+
+    @contextmanager
+    def writing(self, store: ExcelStore):
+        """Транзакция изменения: store актуален и меняется только внутри неё."""
+        with self._lock, self._session_factory() as db:
+            # Первый оператор блокирует строку версии до коммита (строку создал attach())
+            version, epoch, last_id = db.execute(
+                update(_state).where(_state.c.id == STATE_ID)
+                .values(version=_state.c.version + 1)
+                .returning(_state.c.version, _state.c.epoch, _state.c.last_id)
+            ).one()
+            if (version - 1, epoch) != (self.version, self.epoch):
+                self._catch_up(db, store, version - 1, epoch, last_id)
+            store.last_id = max(store.last_id, last_id)
+            self._db, self._write_version, self._write_epoch, self._dirty = db, version, epoch, False
+            try:
+                yield
+                if store.last_id > last_id:
+                    db.execute(update(_state).where(_state.c.id == STATE_ID).values(last_id=store.last_id))
+                db.commit()
+            except BaseException:
+                db.rollback()
+                if self._dirty:
+                    # Кэш уже изменён, а БД — нет: при следующем запросе перечитать целиком
+                    self.version = self.epoch = None
+                raise
+            else:
+                self.version, self.epoch = self._write_version, self._write_epoch
+            finally:
+                self._db = None
+
+    def record(self, store: ExcelStore, op: str, *args):
+        """Пишет применённое к store изменение в excel_users (в транзакции writing())."""
+        db = self._db
+        if db is None:
+            raise RuntimeError("Хранилище Excel 2025 в режиме БД меняется только внутри writing()")
+        self._dirty = True
+        if op == "append":
+            self._insert(db, args[0])
+        elif op == "update":
+            position = args[0]
+            db.execute(
+                update(_users).where(_users.c.id == int(self.pks[position]))
+                .values(**row_columns(store.row(position)), version=self._write_version)
+            )
+        elif op == "keep":
+            mask = args[0]
+            self._delete(db, self.pks[~mask])
+            self.pks = self.pks[mask]
+        elif op == "clear":
+            if db.get_bind().dialect.name == "postgresql":
+                db.execute(text(f"TRUNCATE {ExcelUser.__tablename__}"))
+            else:
+                db.execute(delete(_users))
+            self.pks = np.empty(0, dtype=np.int64)
+        if op in ("keep", "clear"):
+            # Удаление не дочитать по версии — остальные воркеры перечитают кэш
+            self._write_epoch += 1
+            db.execute(update(_state).where(_state.c.id == STATE_ID).values(epoch=self._write_epoch))
+
+    def _insert(self, db: Session, rows: list[dict]):
+        statement = insert(_users).returning(_users.c.id, sort_by_parameter_order=True)
+        pks = [self.pks]
+        for start in range(0, len(rows), WRITE_CHUNK):
+            params = [
+                {**row_columns(row), "version": self._write_version}
+                for row in rows[start:start + WRITE_CHUNK]
+            ]
+            pks.append(np.array(db.execute(statement, params).scalars().all(), dtype=np.int64))
+        self.pks = np.concatenate(pks)
+
+    def _delete(self, db: Session, pks: np.ndarray):
+        for start in range(0, len(pks), WRITE_CHUNK):
+            chunk = pks[start:start + WRITE_CHUNK].tolist()
+            db.execute(delete(_users).where(_users.c.id.in_(chunk)))
+
+
+def attach(store: ExcelStore) -> ExcelDatabase:
+    database = ExcelDatabase()
+    database.attach(store)
+    return database
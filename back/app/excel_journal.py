@@ -0,0 +1,193 @@
+"""Сохранение хранилища Excel 2025 на диск: снимок + журнал изменений.
+
+В каталоге EXCEL_STORE_DIR лежат поколения N:
+    snapshot-N.npy  — коды колонок снимка (отображаются в память при старте);
+    snapshot-N.pkl  — словари значений и формы строк; появляется последним,
+                      поэтому снимок без него считается недописанным;
+    log-N.pkl       — изменения после снимка N, по записи pickle на изменение.
+
+При старте берётся последний целый снимок и поверх него проигрывается его
+журнал; оборванная при сбое последняя запись отбрасывается. Когда журнал
+вырастает больше EXCEL_LOG_COMPACT_BYTES, после сброса и после крупной
+загрузки пишется снимок следующего поколения, а старые файлы удаляются.
+
+EXCEL_STORE_DIR="" выключает сохранение: данные живут только в памяти процесса.
+"""
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+
+import numpy as np
+
+from .excel_store import ExcelStore
+
+logger = logging.getLogger(__name__)
+
+EXCEL_STORE_DIR = os.getenv("EXCEL_STORE_DIR", "data/excel_2025")
+EXCEL_LOG_COMPACT_BYTES = int(os.getenv("EXCEL_LOG_COMPACT_BYTES", str(256 * 1024 * 1024)))
+# Загрузка не меньше 1/APPEND_SNAPSHOT_RATIO хранилища сохраняется снимком, а не журналом
+APPEND_SNAPSHOT_RATIO = 8
+# fsync после каждой записи журнала: без него при сбое питания можно потерять последние изменения
+EXCEL_LOG_FSYNC = os.getenv("EXCEL_LOG_FSYNC", "1") == "1"
+
+_GENERATION = re.compile(r"^(?:snapshot|log)-(\d+)\.(?:npy|pkl)$")
+
+
+class ExcelJournal:
+    """Журнал изменений ExcelStore и снимки поколений в каталоге directory."""
+
+    def __init__(self, directory: str, compact_bytes: int = EXCEL_LOG_COMPACT_BYTES, fsync: bool = EXCEL_LOG_FSYNC):
+        self.directory = directory
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self.generation = 0
+        self._log = None
+        self._lock = threading.Lock()
+
+    def _path(self, kind: str, generation: int) -> str:
+        extension = "npy" if kind == "codes" else "pkl"
+        name = "log" if kind == "log" else "snapshot"
+        return os.path.join(self.directory, f"{name}-{generation}.{extension}")
+
+    def _generations(self) -> list[int]:
+        found = set()
+        for name in os.listdir(self.directory):
+            match = _GENERATION.match(name)
+            if match:
+                found.add(int(match.group(1)))
+        return sorted(found)
+
+    # ---------- старт ----------
+
+    def restore(self, store: ExcelStore) -> dict:
+        """Загружает последний снимок, проигрывает журнал и подключается к store."""
+        started = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        snapshots = [g for g in self._generations() if os.path.exists(self._path("meta", g))]
+        self.generation = snapshots[-1] if snapshots else 0
+        store.journal = None
+        if snapshots:
+            store.read_snapshot(self._path("codes", self.generation), self._path("meta", self.generation))
+        else:
+            store.clear()
+        replayed = self._replay(store)
+        self._remove_other_generations()
+        self._log = open(self._path("log", self.generation), "ab")
+        store.journal = self
+        stats = {
+            "generation": self.generation,
+            "rows": len(store),
+            "replayed": replayed,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        logger.info("Хранилище Excel 2025 восстановлено: %s", stats)
+        return stats
+
+    def _replay(self, store: ExcelStore) -> int:
+        path = self._path("log", self.generation)
+        if not os.path.exists(path):
+            return 0
+        replayed = 0
+        with open(path, "rb+") as f:
+            while True:
+                offset = f.tell()
+                try:
+                    op, args = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    # Запись оборвалась при сбое — всё после неё не применялось
+                    logger.warning("Журнал %s обрезан по смещению %s (недописанная запись)", path, offset)
+                    f.truncate(offset)
+                    break
+                _apply(store, op, args)
+                replayed += 1
+        return replayed
+
+    def _remove_other_generations(self):
+        for generation in self._generations():
+            if generation == self.generation:
+                continue
+            for kind in ("codes", "meta", "log"):
+                try:
+                    os.remove(self._path(kind, generation))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # Файл снимка может быть ещё отображён в память (Windows)
+                    logger.warning("Не удалось удалить %s: %s", self._path(kind, generation), e)
+
+    # ---------- запись ----------
+
+    def record(self, store: ExcelStore, op: str, *args):
+        """Пишет применённое изменение в журнал; при необходимости пишет снимок."""
+        if op == "keep":
+            # Маска строк хранится по биту на строку
+            mask = args[0]
+            args = (np.packbits(mask), len(mask))
+        with self._lock:
+            if op == "clear":
+                # После сброса журнал не нужен — снимок пустого хранилища
+                self._compact(store)
+                return
+            if op == "append" and len(args[0]) * APPEND_SNAPSHOT_RATIO >= len(store):
+                # Строка в снимке пишется в разы быстрее, чем в pickle журнала:
+                # крупную загрузку выгоднее сразу сохранить снимком
+                self._compact(store)
+                return
+            pickle.dump((op, args), self._log, protocol=pickle.HIGHEST_PROTOCOL)
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            if self._log.tell() >= self.compact_bytes:
+                self._compact(store)
+
+    def compact(self, store: ExcelStore):
+        with self._lock:
+            self._compact(store)
+
+    def _compact(self, store: ExcelStore):
+        started = time.perf_counter()
+        generation = self.generation + 1
+        store.write_snapshot(self._path("codes", generation), self._path("meta", generation))
+        # Снимок записан: дальше пишем журнал нового поколения
+        self._log.close()
+        self.generation = generation
+        self._log = open(self._path("log", generation), "ab")
+        self._remove_other_generations()
+        logger.info(
+            "Снимок Excel 2025 поколения %s: %s строк за %.2f с",
+            generation, len(store), time.perf_counter() - started,
+        )
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+def _apply(store: ExcelStore, op: str, args: tuple):
+    if op == "append":
+        store.append(*args)
+    elif op == "update":
+        store.update(*args)
+    elif op == "keep":
+        packed, size = args
+        store.keep(np.unpackbits(packed, count=size).astype(bool))
+    elif op == "clear":
+        store.clear()
+    else:
+        raise ValueError(f"Неизвестная запись журнала: {op}")
+
+
+def open_journal(store: ExcelStore, directory: str = EXCEL_STORE_DIR) -> ExcelJournal | None:
+    """Восстанавливает store с диска и подключает журнал (None, если сохранение выключено)."""
+    if not directory:
+        return None
+    journal = ExcelJournal(directory)
+    journal.restore(store)
+    return journal
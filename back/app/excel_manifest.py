@@ -0,0 +1,97 @@
+"""Быстрое получение имён листов без чтения данных листов.
+
+.xlsx: из zip читается только манифест книги (xl/workbook.xml).
+.xls: xlrd в режиме on_demand разбирает только глобальный поток BIFF
+(записи BOUNDSHEET), сами листы не загружаются.
+Результат кэшируется по SHA-256 содержимого файла.
+"""
+import hashlib
+import os
+import posixpath
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import BinaryIO
+from xml.etree import ElementTree
+
+import xlrd
+
+SHEET_NAMES_CACHE_SIZE = int(os.getenv("SHEET_NAMES_CACHE_SIZE", "256"))
+HASH_CHUNK_BYTES = 1024 * 1024
+
+_XLSX_MAGIC = b"PK\x03\x04"
+_XLS_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_OFFICE_DOCUMENT_REL = "/officeDocument"
+
+_cache: "OrderedDict[str, tuple[str, ...]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def content_hash(fileobj: BinaryIO) -> str:
+    """SHA-256 содержимого файла; позиция в файле возвращается в начало."""
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_BYTES), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _workbook_part(archive: zipfile.ZipFile) -> str:
+    """Путь к workbook.xml: обычно xl/workbook.xml, иначе ищем по _rels/.rels."""
+    if "xl/workbook.xml" in archive.namelist():
+        return "xl/workbook.xml"
+    rels = ElementTree.fromstring(archive.read("_rels/.rels"))
+    for rel in rels:
+        if rel.get("Type", "").endswith(_OFFICE_DOCUMENT_REL):
+            return posixpath.normpath(rel.get("Target").lstrip("/"))
+    raise ValueError("В файле не найден манифест книги")
+
+
+def _xlsx_sheet_names(fileobj: BinaryIO) -> list[str]:
+    with zipfile.ZipFile(fileobj) as archive:
+        with archive.open(_workbook_part(archive)) as manifest:
+            return [
+                element.get("name")
+                for _, element in ElementTree.iterparse(manifest)
+                if _local(element.tag) == "sheet"
+            ]
+
+
+def _xls_sheet_names(fileobj: BinaryIO) -> list[str]:
+    workbook = xlrd.open_workbook(file_contents=fileobj.read(), on_demand=True)
+    try:
+        return workbook.sheet_names()
+    finally:
+        workbook.release_resources()
+
+
+def workbook_sheet_names(fileobj: BinaryIO) -> list[str]:
+    """Имена листов книги в порядке следования, без загрузки данных листов."""
+    fileobj.seek(0)
+    magic = fileobj.read(8)
+    fileobj.seek(0)
+    if magic.startswith(_XLSX_MAGIC):
+        return _xlsx_sheet_names(fileobj)
+    if magic == _XLS_MAGIC:
+        return _xls_sheet_names(fileobj)
+    raise ValueError("Excel file format cannot be determined")
+
+
+def cached_sheet_names(fileobj: BinaryIO) -> list[str]:
+    """workbook_sheet_names с кэшем по хэшу содержимого (LRU на SHEET_NAMES_CACHE_SIZE файлов)."""
+    key = content_hash(fileobj)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return list(_cache[key])
+    names = workbook_sheet_names(fileobj)
+    with _cache_lock:
+        _cache[key] = tuple(names)
+        while len(_cache) > SHEET_NAMES_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return names
@@ -0,0 +1,114 @@
+"""Колоночная нормализация листов Excel перед сохранением.
+
+Общий этап для /upload_excel и /upload_excel_2025: колонки месяца, даты и
+источника определяются один раз на лист, даты разбираются одним вызовом на
+всю колонку, а NaN/Inf/Timestamp очищаются масками, а не построчно.
+"""
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from .date_parsing import parse_dates
+
+logger = logging.getLogger(__name__)
+
+MONTH_NAMES = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+               'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
+
+# Колонки, которые удаляются из строки (месяц определяем сами)
+MONTH_COLUMNS = {'month', 'месяц'}
+# Колонки, из которых берём месяц, если лист не назван месяцем
+DATE_COLUMNS = {'дата', 'дата и время', 'date', 'datetime'}
+
+# Целевая скорость нормализации (строк/сек), см. benchmarks/bench_normalize.py
+TARGET_ROWS_PER_SEC = 100_000
+
+
+def resolve_date_column(columns):
+    """Первая колонка с датой (как в старом построчном поиске) или None."""
+    for col in columns:
+        if str(col).strip().lower() in DATE_COLUMNS:
+            return col
+    return None
+
+
+def parse_months(values: pd.Series) -> pd.Series:
+    """Номер месяца (1-12) для каждой ячейки колонки дат, NaN если дата не распознана.
+
+    Даты разбирает date_parsing.parse_dates (тот же разбор, что у фильтров
+    и аналитики); каждое уникальное значение — один раз.
+    """
+    return parse_dates(values).dt.month
+
+
+def _sanitize_scalar(value):
+    """Очистка одного значения в object-колонке (аналог convert_timestamps)."""
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, float):
+        return value if np.isfinite(value) else None
+    if hasattr(value, 'isoformat') and callable(value.isoformat):
+        return value.isoformat()
+    return value
+
+
+def sanitize_column(values: pd.Series) -> pd.Series:
+    """Приводит колонку к JSON-совместимым значениям: даты -> ISO, NaN/Inf -> None."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # Форматируем только уникальные моменты времени и раскладываем по кодам
+        codes, uniques = pd.factorize(values)
+        iso = np.array([ts.isoformat() for ts in uniques] + [None], dtype=object)
+        return pd.Series(iso[codes], index=values.index)
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+        return values.astype(object).where(values.notna(), None)
+    if pd.api.types.is_float_dtype(values):
+        finite = np.isfinite(values.to_numpy(dtype=float, na_value=np.nan))
+        return values.astype(object).where(finite, None)
+    if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        return values.astype(object).where(values.notna(), None)
+    return values.astype(object).map(_sanitize_scalar)
+
+
+def normalize_sheet(df: pd.DataFrame, sheet_name, extra: dict | None = None, date_column=None) -> list[dict]:
+    """Нормализует лист целиком и возвращает записи для сохранения.
+
+    - удаляет колонки 'month'/'месяц';
+    - month = имя листа, если это месяц, иначе месяц из колонки даты;
+    - строки без месяца отбрасываются;
+    - extra добавляются как константные колонки (источник, filename).
+
+    date_column можно передать заранее, если лист читается частями.
+    """
+    started = time.perf_counter()
+    total = len(df)
+    frame = df.drop(columns=[c for c in df.columns if str(c).strip().lower() in MONTH_COLUMNS])
+
+    if sheet_name in MONTH_NAMES:
+        month = pd.Series(sheet_name, index=frame.index, dtype=object)
+    else:
+        if date_column is None:
+            date_column = resolve_date_column(frame.columns)
+        if date_column is None or date_column not in frame.columns:
+            return []
+        month_num = parse_months(frame[date_column])
+        known = month_num.between(1, 12)
+        frame = frame[known]
+        month_idx = month_num[known].astype(int).to_numpy() - 1
+        month = pd.Series(np.array(MONTH_NAMES, dtype=object)[month_idx], index=frame.index)
+
+    if frame.empty:
+        return []
+
+    columns = {col: sanitize_column(frame[col]) for col in frame.columns}
+    columns['month'] = month
+    for key, value in (extra or {}).items():
+        columns[key] = pd.Series(value, index=frame.index, dtype=object)
+    # Собираем записи из списков колонок: быстрее, чем DataFrame.to_dict
+    keys = list(columns)
+    records = [dict(zip(keys, values)) for values in zip(*(columns[k].tolist() for k in keys))]
+    elapsed = time.perf_counter() - started
+    if elapsed > 0:
+        logger.info("Лист %s: %s из %s строк, %.0f строк/сек", sheet_name, len(records), total, total / elapsed)
+    return records
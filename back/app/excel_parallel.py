@@ -0,0 +1,181 @@
+"""Разбор Excel-файлов в пуле процессов, вне event loop.
+
+Каждый лист каждого файла разбирается отдельной задачей на своём ядре.
+Воркер читает лист кусками, нормализует их и складывает записи во
+временный pickle-файл по кускам, поэтому в родительский процесс
+передаётся только путь, а память остаётся ограниченной одним куском.
+Результаты возвращаются в порядке (файл, лист) независимо от того,
+какая задача закончилась первой.
+
+EXCEL_PARSE_WORKERS задаёт число процессов; 0 — разбирать в потоке
+без отдельных процессов. Если процесс пула упал (OOM, kill), пул
+пересоздаётся, а листы, попавшие под сбой, разбираются заново один раз.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+from .excel_normalize import normalize_sheet
+from .excel_reader import iter_sheet_chunks, remove_spooled, sheet_names
+
+logger = logging.getLogger(__name__)
+
+EXCEL_PARSE_WORKERS = int(os.getenv("EXCEL_PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+# Попыток разбора листа, если пул сломался во время разбора
+PARSE_ATTEMPTS = 2
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+class ExcelParseError(Exception):
+    """Ошибка разбора файла; filename — файл, в котором она произошла."""
+
+    def __init__(self, filename: str, error: BaseException):
+        super().__init__(str(error))
+        self.filename = filename
+
+
+@dataclass
+class ParsedSheet:
+    """Результат разбора одного листа: записи лежат в spool_path кусками."""
+    file_index: int
+    filename: str
+    sheet_name: str
+    spool_path: str
+    rows: int
+
+
+def get_parse_executor() -> Executor:
+    """Общий пул для разбора файлов (создаётся при первом обращении)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if EXCEL_PARSE_WORKERS > 0:
+                # spawn, а не fork: форк процесса uvicorn с потоками небезопасен
+                _executor = ProcessPoolExecutor(
+                    max_workers=EXCEL_PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                _executor = ThreadPoolExecutor(max_workers=1)
+        return _executor
+
+
+def discard_parse_executor(broken: Executor):
+    """Убирает сломанный пул; следующий get_parse_executor() создаст новый.
+
+    Пул сравнивается по объекту: если его уже заменили (сбой увидели
+    несколько задач сразу), новый пул не трогается.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_sheet_to_spool(path: str, sheet_name: str, extra: dict | None = None) -> tuple[str, int]:
+    """Задача воркера: нормализует лист и пишет записи кусками во временный файл."""
+    rows = 0
+    spool = tempfile.NamedTemporaryFile(delete=False, prefix="parsed_", suffix=".pkl")
+    try:
+        for _, df, date_column in iter_sheet_chunks(path, only_sheet=sheet_name):
+            records = normalize_sheet(df, sheet_name, extra=extra, date_column=date_column)
+            if records:
+                pickle.dump(records, spool, protocol=pickle.HIGHEST_PROTOCOL)
+                rows += len(records)
+    except Exception:
+        spool.close()
+        os.remove(spool.name)
+        raise
+    spool.close()
+    return spool.name, rows
+
+
+def iter_spooled_records(parsed: ParsedSheet) -> Iterator[dict]:
+    """Читает записи листа из временного файла по кускам и удаляет файл."""
+    try:
+        with open(parsed.spool_path, "rb") as f:
+            while True:
+                try:
+                    records = pickle.load(f)
+                except EOFError:
+                    return
+                yield from records
+    finally:
+        remove_spooled([parsed.spool_path])
+
+
+async def parse_workbooks(
+    uploads: list[tuple[str, str]],
+    extra_by_file: list[dict] | None = None,
+    on_sheet: Callable[[str, str, int], None] | None = None,
+) -> list[ParsedSheet]:
+    """Разбирает все листы всех файлов параллельно.
+
+    uploads — список (имя файла, путь к временному файлу). Возвращает листы
+    в детерминированном порядке: по порядку файлов, затем листов в файле.
+    on_sheet(имя файла, лист, строк) вызывается по мере готовности листов.
+    Ошибка в любом листе пробрасывается, временные файлы остальных удаляются.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def parse(path, filename, sheet_name, extra):
+        for attempt in range(1, PARSE_ATTEMPTS + 1):
+            executor = get_parse_executor()
+            try:
+                result = await loop.run_in_executor(executor, parse_sheet_to_spool, path, sheet_name, extra)
+                break
+            except BrokenExecutor:
+                # Упал процесс пула: пул больше не принимает задач
+                discard_parse_executor(executor)
+                if attempt == PARSE_ATTEMPTS:
+                    raise
+                logger.warning("Пул разбора Excel сломан, лист %s / %s разбирается заново", filename, sheet_name)
+        if on_sheet:
+            on_sheet(filename, sheet_name, result[1])
+        return result
+
+    names = await list_sheet_names(uploads)
+    tasks = []
+    for file_index, ((filename, path), sheets) in enumerate(zip(uploads, names)):
+        extra = extra_by_file[file_index] if extra_by_file else None
+        for sheet_name in sheets:
+            meta = (file_index, filename, sheet_name)
+            tasks.append((meta, parse(path, filename, sheet_name, extra)))
+
+    results = await asyncio.gather(*(coro for _, coro in tasks), return_exceptions=True)
+    parsed = []
+    error = None
+    for ((file_index, filename, sheet_name), _), result in zip(tasks, results):
+        if isinstance(result, BaseException):
+            logger.error("Ошибка разбора %s / %s: %s", filename, sheet_name, result)
+            error = error or ExcelParseError(filename, result)
+            continue
+        spool_path, rows = result
+        parsed.append(ParsedSheet(file_index, filename, sheet_name, spool_path, rows))
+    if error is not None:
+        remove_spooled(sheet.spool_path for sheet in parsed)
+        raise error
+    return parsed
+
+
+async def list_sheet_names(uploads: list[tuple[str, str]]) -> list[list[str]]:
+    """Имена листов каждого файла (читается только манифест книги, в потоке)."""
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(None, sheet_names, path) for _, path in uploads
+    ), return_exceptions=True)
+    for (filename, _), result in zip(uploads, results):
+        if isinstance(result, BaseException):
+            raise ExcelParseError(filename, result)
+    return results
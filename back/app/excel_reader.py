@@ -0,0 +1,173 @@
+"""Потоковое чтение загруженных Excel-файлов.
+
+Загрузка сначала сбрасывается во временный файл, затем листы читаются
+кусками по EXCEL_CHUNK_ROWS строк (openpyxl read-only для .xlsx), так что
+в памяти одновременно находится только один кусок листа.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Iterator
+
+import pandas as pd
+from fastapi import UploadFile
+from openpyxl import load_workbook
+
+from .excel_manifest import workbook_sheet_names
+from .excel_normalize import resolve_date_column
+
+EXCEL_CHUNK_ROWS = int(os.getenv("EXCEL_CHUNK_ROWS", "10000"))
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+_XLSX_MAGIC = b"PK\x03\x04"
+
+
+async def spool_upload_hashed(file: UploadFile) -> tuple[str, str]:
+    """Копирует загрузку во временный файл по 1 МБ; возвращает (путь, SHA-256 содержимого)."""
+    suffix = os.path.splitext(file.filename or "")[1]
+    tmp = tempfile.NamedTemporaryFile(delete=False, prefix="upload_", suffix=suffix)
+    digest = hashlib.sha256()
+    try:
+        while True:
+            chunk = await file.read(SPOOL_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            tmp.write(chunk)
+    except Exception:
+        tmp.close()
+        os.remove(tmp.name)
+        raise
+    tmp.close()
+    return tmp.name, digest.hexdigest()
+
+
+async def spool_upload(file: UploadFile) -> str:
+    """Копирует загрузку во временный файл и возвращает путь к нему."""
+    path, _ = await spool_upload_hashed(file)
+    return path
+
+
+def remove_spooled(paths):
+    """Удаляет временные файлы загрузок, игнорируя уже удалённые."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def is_xlsx(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(4) == _XLSX_MAGIC
+
+
+def _column_names(header) -> list:
+    """Имена колонок как у pd.read_excel: пустые -> 'Unnamed: i', дубли -> 'X.1'."""
+    names = []
+    seen = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or value == "" else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _trim(row: tuple) -> list:
+    """Убирает пустые ячейки в конце строки (openpyxl отдаёт строку на всю ширину листа)."""
+    values = list(row)
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+
+def sheet_names(path: str) -> list[str]:
+    """Имена листов файла в порядке следования (только манифест книги)."""
+    with open(path, "rb") as f:
+        return workbook_sheet_names(f)
+
+
+def _data_width(sheet, header_width: int) -> int:
+    """Число колонок с данными на листе (самая длинная строка без пустых ячеек в конце).
+
+    Отдельный проход по листу нужен, только если размер листа (<dimension>)
+    неизвестен или шире заголовка; обычно ширина — это ширина заголовка.
+    """
+    if sheet.max_column is not None and sheet.max_row is not None and sheet.max_row > 1:
+        if sheet.max_column <= header_width:
+            return header_width
+    return max((len(_trim(row)) for row in sheet.iter_rows(values_only=True)), default=header_width)
+
+
+def _iter_xlsx_chunks(path: str, chunk_rows: int, only_sheet: str | None) -> Iterator[tuple[str, pd.DataFrame]]:
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = [workbook[only_sheet]] if only_sheet is not None else workbook.worksheets
+        for sheet in sheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = None
+            for row in rows:
+                header = _trim(row)
+                if header:
+                    break
+            if not header:
+                continue
+            # Колонки правее заголовка ('Unnamed: i', как у pd.read_excel) должны быть во всех
+            # кусках листа, а не только после первой строки с ними
+            width = _data_width(sheet, len(header))
+            columns = _column_names(header + [None] * (width - len(header)))
+            chunk = []
+            for row in rows:
+                values = _trim(row)
+                if not values:
+                    continue
+                if len(values) > len(columns):
+                    # Размер листа в файле оказался неверным
+                    columns = _column_names(header + [None] * (len(values) - len(header)))
+                chunk.append(values)
+                if len(chunk) >= chunk_rows:
+                    yield sheet.title, _frame(chunk, columns)
+                    chunk = []
+            if chunk:
+                yield sheet.title, _frame(chunk, columns)
+    finally:
+        workbook.close()
+
+
+def _frame(chunk: list[list], columns: list) -> pd.DataFrame:
+    width = len(columns)
+    return pd.DataFrame([values + [None] * (width - len(values)) for values in chunk], columns=columns)
+
+
+def _iter_xls_chunks(path: str, chunk_rows: int, only_sheet: str | None) -> Iterator[tuple[str, pd.DataFrame]]:
+    # Старый формат .xls ограничен 65536 строками на лист, поэтому читаем лист целиком
+    excel = pd.ExcelFile(path)
+    for sheet_name in ([only_sheet] if only_sheet is not None else excel.sheet_names):
+        df = pd.read_excel(excel, sheet_name=sheet_name)
+        for start in range(0, len(df), chunk_rows):
+            yield sheet_name, df.iloc[start:start + chunk_rows]
+
+
+def iter_sheet_chunks(
+    path: str,
+    chunk_rows: int = EXCEL_CHUNK_ROWS,
+    only_sheet: str | None = None,
+) -> Iterator[tuple[str, pd.DataFrame, object]]:
+    """Отдаёт (имя листа, кусок листа, колонка даты) для всех листов файла
+    или только для листа only_sheet.
+
+    Колонка даты определяется один раз по заголовку листа.
+    """
+    read_chunks = _iter_xlsx_chunks if is_xlsx(path) else _iter_xls_chunks
+    chunks = read_chunks(path, chunk_rows, only_sheet)
+    current_sheet = None
+    date_column = None
+    for sheet_name, df in chunks:
+        if sheet_name != current_sheet:
+            current_sheet = sheet_name
+            date_column = resolve_date_column(df.columns)
+        yield sheet_name, df, date_column
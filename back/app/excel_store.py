@@ -0,0 +1,671 @@
+"""Колоночное хранилище строк Excel 2025.
+
+Строки хранятся не списком словарей, а по полям: у каждого поля массив
+кодов int32 (код на строку) и словарь уникальных значений, поэтому
+повторяющиеся значения (источник, файл, месяц, дата, ФИО) хранятся один
+раз. Код -1 — поля в строке нет. Набор и порядок полей строки хранится
+кодом "формы" (кортеж полей), так что строка собирается обратно в тот же
+словарь с теми же типами значений.
+
+Фильтры считаются по кодам: условие вычисляется один раз на каждое
+встретившееся значение, а на строки раскладывается маской NumPy. rows()
+собирает словари только для выбранных строк; RowsView даёт то же
+хранилище как последовательность словарей (тонкое представление строк).
+
+key_groups() — группы строк по ключу донора или файла с числом строк и
+первой строкой группы; как и индекс позиций, строится при первом
+обращении и дальше поддерживается записью, а не пересчитывается.
+
+positions() находит строки с заданным значением поля без прохода по
+строкам: значение -> код даёт словарь значений колонки, код -> позиции —
+PositionIndex поля. Индекс строится при первом поиске по полю и дальше
+поддерживается добавлением, изменением строк и сбросом; после удаления
+строк (позиции сдвигаются) строится заново.
+
+Опубликованная версия хранилища не меняется: писатель меняет copy() —
+черновик, который делит с ней массивы кодов и копирует массив только при
+первой записи в уже занятые строки (update); добавление пишет за
+пределами size версии, которые её читатели не видят. Так запрос, взявший
+версию, видит одни и те же строки до конца, сколько бы записей ни шло.
+
+last_id — наибольший встречавшийся целый id строки; он не уменьшается ни
+при удалении строк, ни при сбросе, поэтому новые id не повторяются.
+
+write_snapshot/read_snapshot сохраняют состояние на диск: коды — матрицей
+.npy, которая при чтении отображается в память (copy-on-write), словари
+значений и формы — pickle. Журнал изменений — см. excel_journal.
+"""
+import os
+import pickle
+from collections.abc import Sequence
+from typing import Any, Callable, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+ABSENT = -1
+# Начальная ёмкость массивов; дальше ёмкость растёт вдвое
+INITIAL_CAPACITY = 1024
+# По сколько строк собирать словари при переборе RowsView
+ITER_CHUNK = 10_000
+# Изменений поверх PositionIndex, после которых он строится заново:
+# не меньше INDEX_PENDING_MIN и 1/INDEX_PENDING_RATIO строк
+INDEX_PENDING_MIN = 4096
+INDEX_PENDING_RATIO = 32
+# Поле с id строки (для last_id)
+ID_FIELD = "id"
+# Позиция первой строки у группы без строк
+NO_ROW = np.iinfo(np.int64).max
+
+
+def _grow(codes: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.full(capacity, ABSENT, dtype=np.int32)
+    grown[:len(codes)] = codes
+    return grown
+
+
+class Column:
+    """Поле со словарным кодированием: коды строк и уникальные значения."""
+
+    def __init__(self, capacity: int):
+        self.codes = np.full(capacity, ABSENT, dtype=np.int32)
+        self.values: list = []
+        # Значений этой версии колонки: список values общий с черновиком
+        # следующей версии и может быть длиннее (дописанное черновиком не видно)
+        self.count = 0
+        # Словарь кодов на каждый тип: 1, 1.0 и True — разные значения.
+        # После чтения снимка строится при первой записи
+        self._lookup: dict[type, dict] | None = {}
+        self._objects: np.ndarray | None = None
+        # Коды общие с опубликованной версией: перед записью в них — копия
+        self.shared = False
+
+    @classmethod
+    def restored(cls, codes: np.ndarray, values: list) -> "Column":
+        column = cls(0)
+        column.codes = codes
+        column.values = values
+        column.count = len(values)
+        column._lookup = None
+        return column
+
+    def copy(self) -> "Column":
+        """Колонка черновика: коды общие до первой записи, значения только дописываются.
+
+        Черновик дописывает values и словари кодов по типам, опубликованная
+        версия видит только первые count значений: коды из find() не меньше
+        count отбрасываются. Словарь типов копируется — новый тип добавляется
+        только в словарь черновика.
+        """
+        column = Column.__new__(Column)
+        column.__dict__.update(self.__dict__)
+        if self._lookup is not None:
+            column._lookup = dict(self._lookup)
+        column.shared = True
+        return column
+
+    def writable(self) -> np.ndarray:
+        if self.shared:
+            self.codes = self.codes.copy()
+            self.shared = False
+        return self.codes
+
+    def _build_lookup(self):
+        self._lookup = {}
+        for code, value in enumerate(self.values[:self.count]):
+            try:
+                self._lookup.setdefault(value.__class__, {}).setdefault(value, code)
+            except TypeError:
+                pass
+
+    def find(self, value) -> list[int]:
+        """Коды значений, равных value (как ключи dict: 1, 1.0 и True равны)."""
+        if self._lookup is None:
+            self._build_lookup()
+        count = self.count
+        try:
+            found = [lookup.get(value) for lookup in list(self._lookup.values())]
+        except TypeError:
+            return []
+        return [code for code in found if code is not None and code < count]
+
+    def encode(self, value) -> int:
+        if self._lookup is None:
+            self._build_lookup()
+        lookup = self._lookup.get(value.__class__)
+        if lookup is None:
+            lookup = self._lookup[value.__class__] = {}
+        try:
+            code = lookup.get(value)
+        except TypeError:
+            # Нехэшируемые значения (списки) хранятся без дедупликации
+            lookup = code = None
+        if code is None:
+            code = self.count
+            self.values.append(value)
+            self.count += 1
+            if lookup is not None:
+                lookup[value] = code
+        return code
+
+    def encode_many(self, values: list) -> np.ndarray:
+        if pd.api.types.infer_dtype(values, skipna=True) != "string":
+            return np.fromiter((self.encode(value) for value in values), dtype=np.int32, count=len(values))
+        # Строковая колонка: уникальные значения находит pandas, в словарь идут только они
+        codes, uniques = pd.factorize(np.array(values, dtype=object))
+        lut = np.array([self.encode(value) for value in uniques] + [ABSENT], dtype=np.int32)
+        encoded = lut[codes]
+        for position in np.flatnonzero(codes == -1):
+            # None/NaN factorize не кодирует
+            encoded[position] = self.encode(values[position])
+        return encoded
+
+    def objects(self) -> np.ndarray:
+        """Словарь значений как object-массив (для сборки строк по кодам)."""
+        objects = self._objects
+        if objects is None or len(objects) != self.count:
+            objects = self._objects = np.fromiter(self.values, dtype=object, count=self.count)
+        return objects
+
+
+class PositionIndex:
+    """Позиции строк по коду значения одного поля.
+
+    Основа — позиции, отсортированные по коду (order), и начало каждого кода
+    в order (starts). Изменения после построения копятся поверх неё: moved —
+    позиции, чей код поменялся, added — код -> позиции, получившие его позже.
+    """
+
+    def __init__(self, codes: np.ndarray, count: int):
+        # Код -1 (поля нет) сдвигается в слот 0
+        slots = codes.astype(np.int64) + 1
+        self.order = np.argsort(slots, kind="stable").astype(np.int32)
+        self.starts = np.zeros(count + 2, dtype=np.int64)
+        np.cumsum(np.bincount(slots, minlength=count + 1), out=self.starts[1:])
+        self.moved: set[int] = set()
+        self.added: dict[int, list[int]] = {}
+        self.pending = 0
+
+    def copy(self) -> "PositionIndex":
+        index = PositionIndex.__new__(PositionIndex)
+        index.order, index.starts, index.pending = self.order, self.starts, self.pending
+        index.moved = set(self.moved)
+        index.added = {code: list(positions) for code, positions in self.added.items()}
+        return index
+
+    def positions(self, code: int) -> np.ndarray:
+        slot = code + 1
+        base = self.order[self.starts[slot]:self.starts[slot + 1]] if slot + 1 < len(self.starts) else self.order[:0]
+        added = self.added.get(code)
+        if not added and not self.moved:
+            return base.astype(np.intp)
+        found = [position for position in base.tolist() if position not in self.moved]
+        return np.array(sorted(found + (added or [])), dtype=np.intp)
+
+    def extend(self, start: int, codes: np.ndarray):
+        """Позиции start, start+1, ... добавленных строк с кодами codes."""
+        for position, code in enumerate(codes.tolist(), start):
+            if code != ABSENT:
+                self.added.setdefault(code, []).append(position)
+        self.pending += len(codes)
+
+    def move(self, position: int, old: int, new: int):
+        if old == new:
+            return
+        added = self.added.get(old)
+        if added and position in added:
+            added.remove(position)
+        self.moved.add(position)
+        if new != ABSENT:
+            self.added.setdefault(new, []).append(position)
+        self.pending += 1
+
+
+class KeyGroups:
+    """Группы строк по ключу row.get(f1) or row.get(f2) or ...; пустые ключи — группа -1.
+
+    Номер группы постоянен, пока агрегат жив: новый ключ получает следующий
+    номер. По группе хранятся число строк (counts) и позиция первой строки
+    (first); порядок групп по первому появлению — order(). Добавление
+    разбирает значения только новых строк, изменение — одной строки,
+    удаление пересчитывает счётчики по номерам групп. Массивы заменяются,
+    а не меняются на месте, поэтому версия, с которой агрегат скопирован,
+    изменений черновика не видит.
+    """
+
+    def __init__(self, fields: tuple):
+        self.fields = fields
+        self.ids = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.first = np.empty(0, dtype=np.int64)
+        self._keys: dict = {}
+        self._keys_shared = False
+
+    def copy(self) -> "KeyGroups":
+        groups = KeyGroups.__new__(KeyGroups)
+        groups.__dict__.update(self.__dict__)
+        groups._keys_shared = True
+        return groups
+
+    def _writable_keys(self) -> dict:
+        if self._keys_shared:
+            self._keys = dict(self._keys)
+            self._keys_shared = False
+        return self._keys
+
+    def _grown(self) -> tuple[np.ndarray, np.ndarray]:
+        """Копии counts и first на все известные ключи."""
+        total = len(self._keys)
+        counts = np.zeros(total, dtype=np.int64)
+        counts[:len(self.counts)] = self.counts
+        first = np.full(total, NO_ROW, dtype=np.int64)
+        first[:len(self.first)] = self.first
+        return counts, first
+
+    def extend(self, store: "ExcelStore", start: int, count: int):
+        """Добавляет строки start..start+count-1 хранилища."""
+        keys = self._writable_keys()
+        positions = np.arange(start, start + count)
+        ids = np.full(count, -1, dtype=np.int64)
+        undecided = np.arange(count)
+        for field in self.fields:
+            found = store.value_map(
+                field, positions[undecided], lambda value: keys.setdefault(value, len(keys)) if value else -1,
+                dtype=np.int64,
+            )
+            ids[undecided] = found
+            undecided = undecided[found < 0]
+            if not len(undecided):
+                break
+        counts, first = self._grown()
+        valid = np.flatnonzero(ids >= 0)
+        counts += np.bincount(ids[valid], minlength=len(counts))
+        # Новые строки позже всех прежних: первая строка меняется только у пустых групп
+        found, index = np.unique(ids[valid], return_index=True)
+        first[found] = np.minimum(first[found], start + valid[index])
+        self.ids = np.concatenate([self.ids, ids])
+        self.counts, self.first = counts, first
+
+    def move(self, position: int, row: dict):
+        """Переносит строку position (её значения после изменения — row) в группу её ключа."""
+        key = None
+        for field in self.fields:
+            key = key or row.get(field)
+        new = self._writable_keys().setdefault(key, len(self._keys)) if key else -1
+        old = int(self.ids[position])
+        if old == new:
+            return
+        ids = self.ids.copy()
+        ids[position] = new
+        counts, first = self._grown()
+        if old >= 0:
+            counts[old] -= 1
+            if not counts[old]:
+                first[old] = NO_ROW
+            elif first[old] == position:
+                first[old] = np.flatnonzero(ids == old)[0]
+        if new >= 0:
+            counts[new] += 1
+            first[new] = min(first[new], position)
+        self.ids, self.counts, self.first = ids, counts, first
+
+    def keep(self, mask: np.ndarray):
+        """Оставляет строки, отмеченные маской; ключи не разбираются."""
+        ids = self.ids[mask]
+        valid = np.flatnonzero(ids >= 0)
+        counts = np.bincount(ids[valid], minlength=len(self._keys))
+        first = np.full(len(self._keys), NO_ROW, dtype=np.int64)
+        found, index = np.unique(ids[valid], return_index=True)
+        first[found] = valid[index]
+        self.ids, self.counts, self.first = ids, counts, first
+
+    def order(self) -> np.ndarray:
+        """Номера непустых групп по первому появлению."""
+        live = np.flatnonzero(self.counts > 0)
+        return live[np.argsort(self.first[live], kind="stable")]
+
+
+class ExcelStore:
+    """Строки Excel 2025 по колонкам; позиции строк — 0..len-1 в порядке добавления.
+
+    Если подключён journal (excel_journal.ExcelJournal), каждое изменение
+    после применения записывается в него.
+    """
+
+    def __init__(self):
+        self.journal = None
+        self.last_id = 0
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self._capacity = 0
+        self._shape = np.empty(0, dtype=np.int32)
+        self._shape_shared = False
+        self._shapes: list[tuple] = []
+        self._shape_lookup: dict[tuple, int] = {}
+        self.columns: dict[Any, Column] = {}
+        self._indexes: dict[Any, PositionIndex] = {}
+        self._groups: dict[tuple, KeyGroups] = {}
+        # Сколько значений колонки id учтено в last_id
+        self._ids_tracked = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _changed(self, op: str, *args):
+        if self.journal is not None:
+            self.journal.record(self, op, *args)
+
+    def copy(self) -> "ExcelStore":
+        """Черновик следующей версии; эта версия при его изменении остаётся прежней."""
+        draft = ExcelStore.__new__(ExcelStore)
+        draft.__dict__.update(self.__dict__)
+        draft._shape_shared = True
+        draft._shapes = list(self._shapes)
+        draft._shape_lookup = dict(self._shape_lookup)
+        draft.columns = {field: column.copy() for field, column in self.columns.items()}
+        # Индексы и группы читатели достраивают на лету: словари копируются списком
+        draft._indexes = {field: index.copy() for field, index in list(self._indexes.items())}
+        draft._groups = {fields: groups.copy() for fields, groups in list(self._groups.items())}
+        return draft
+
+    def _writable_shape(self) -> np.ndarray:
+        if self._shape_shared:
+            self._shape = self._shape.copy()
+            self._shape_shared = False
+        return self._shape
+
+    def _reserve(self, size: int):
+        if size <= self._capacity:
+            return
+        capacity = max(INITIAL_CAPACITY, self._capacity * 2, size)
+        self._shape = _grow(self._shape, capacity)
+        self._shape_shared = False
+        for column in self.columns.values():
+            column.codes = _grow(column.codes, capacity)
+            column.shared = False
+        self._capacity = capacity
+
+    def _column(self, field) -> Column:
+        column = self.columns.get(field)
+        if column is None:
+            column = self.columns[field] = Column(self._capacity)
+        return column
+
+    def _shape_code(self, fields: tuple) -> int:
+        code = self._shape_lookup.get(fields)
+        if code is None:
+            code = self._shape_lookup[fields] = len(self._shapes)
+            self._shapes.append(fields)
+        return code
+
+    def _track_ids(self):
+        """Учитывает в last_id новые значения колонки id (словарь значений только растёт)."""
+        column = self.columns.get(ID_FIELD)
+        if column is None:
+            return
+        ids = [
+            value for value in column.values[self._ids_tracked:column.count]
+            if isinstance(value, int) and not isinstance(value, bool)
+        ]
+        self._ids_tracked = column.count
+        if ids:
+            self.last_id = max(self.last_id, max(ids))
+
+    def _index_stale(self, index: PositionIndex) -> bool:
+        return index.pending > max(INDEX_PENDING_MIN, self.size // INDEX_PENDING_RATIO)
+
+    # ---------- запись ----------
+
+    def clear(self):
+        """Удаляет все строки; last_id сохраняется."""
+        self._reset()
+        self._changed("clear")
+
+    def append(self, rows: list[dict]):
+        """Добавляет строки в конец; строки одной формы кодируются по колонкам.
+
+        Строки после size версии никто не читает, поэтому в общие с ней
+        массивы они пишутся без копирования.
+        """
+        if not rows:
+            return
+        start, count = self.size, len(rows)
+        self._reserve(start + count)
+        shapes = np.fromiter((self._shape_code(tuple(row)) for row in rows), dtype=np.int32, count=count)
+        self._shape[start:start + count] = shapes
+        for code in np.unique(shapes):
+            positions = np.flatnonzero(shapes == code)
+            group = rows if len(positions) == count else [rows[i] for i in positions]
+            for field in self._shapes[code]:
+                column = self._column(field)
+                column.codes[start + positions] = column.encode_many([row[field] for row in group])
+        self.size += count
+        for field, index in list(self._indexes.items()):
+            index.extend(start, self.columns[field].codes[start:start + count])
+            if self._index_stale(index):
+                del self._indexes[field]
+        for groups in self._groups.values():
+            groups.extend(self, start, count)
+        self._track_ids()
+        self._changed("append", rows)
+
+    def update(self, position: int, updates: dict):
+        """dict.update для строки: новые поля добавляются в конец строки."""
+        fields = self._shapes[self._shape[position]]
+        added = tuple(field for field in updates if field not in fields)
+        if added:
+            self._writable_shape()[position] = self._shape_code(fields + added)
+        for field, value in updates.items():
+            column = self._column(field)
+            codes = column.writable()
+            old, codes[position] = codes[position], column.encode(value)
+            index = self._indexes.get(field)
+            if index is not None:
+                index.move(int(position), int(old), int(column.codes[position]))
+                if self._index_stale(index):
+                    del self._indexes[field]
+        moved = [groups for fields, groups in self._groups.items() if not updates.keys().isdisjoint(fields)]
+        if moved:
+            row = self.row(position)
+            for groups in moved:
+                groups.move(int(position), row)
+        self._track_ids()
+        self._changed("update", int(position), updates)
+
+    def keep(self, mask: np.ndarray) -> int:
+        """Оставляет строки, отмеченные маской (длины len), возвращает число удалённых.
+
+        Словари значений не сжимаются: значения удалённых строк остаются до clear().
+        """
+        kept = int(np.count_nonzero(mask))
+        deleted = self.size - kept
+        if deleted:
+            self._shape = self._shape[:self.size][mask]
+            self._shape_shared = False
+            for column in self.columns.values():
+                column.codes = column.codes[:self.size][mask]
+                column.shared = False
+            self.size = self._capacity = kept
+            self._indexes.clear()
+            for groups in self._groups.values():
+                groups.keep(mask)
+            self._changed("keep", mask)
+        return deleted
+
+    # ---------- снимок ----------
+
+    def write_snapshot(self, codes_path: str, meta_path: str):
+        """Пишет снимок: сначала коды, затем (атомарной заменой) метаданные.
+
+        Снимок считается записанным, когда появился meta_path.
+        """
+        fields = list(self.columns)
+        codes = np.lib.format.open_memmap(codes_path, mode="w+", dtype=np.int32, shape=(len(fields) + 1, self.size))
+        codes[0] = self._shape[:self.size]
+        for index, field in enumerate(fields, start=1):
+            codes[index] = self.columns[field].codes[:self.size]
+        codes.flush()
+        del codes
+        meta = {
+            "size": self.size,
+            "fields": fields,
+            "values": [self.columns[field].values[:self.columns[field].count] for field in fields],
+            "shapes": self._shapes,
+            "last_id": self.last_id,
+        }
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, meta_path)
+
+    def read_snapshot(self, codes_path: str, meta_path: str):
+        """Заменяет содержимое снимком; коды отображаются в память, не читаясь целиком.
+
+        Отображение copy-on-write: изменённые страницы копируются в память
+        процесса, файл снимка не меняется. Журнал не пишется.
+        """
+        with open(meta_path, "rb") as f:
+            meta = pickle.load(f)
+        size = meta["size"]
+        # Пустой массив отобразить нельзя
+        codes = np.load(codes_path, mmap_mode="c" if size else None)
+        self._reset()
+        self.size = self._capacity = size
+        self._shapes = meta["shapes"]
+        self._shape_lookup = {fields: code for code, fields in enumerate(self._shapes)}
+        self._shape = codes[0]
+        for index, (field, values) in enumerate(zip(meta["fields"], meta["values"]), start=1):
+            self.columns[field] = Column.restored(codes[index], values)
+        # В снимках без last_id — по значениям колонки id
+        self.last_id = max(self.last_id, meta.get("last_id", 0))
+        self._track_ids()
+
+    # ---------- чтение ----------
+
+    def codes(self, field, positions: np.ndarray | None = None) -> np.ndarray:
+        """Коды поля для строк positions (всех строк, если None); -1 — поля нет."""
+        count = self.size if positions is None else len(positions)
+        column = self.columns.get(field)
+        if column is None:
+            return np.full(count, ABSENT, dtype=np.int32)
+        codes = column.codes[:self.size]
+        return codes if positions is None else codes[positions]
+
+    def positions(self, field, value) -> np.ndarray:
+        """Позиции строк с row.get(field) == value по возрастанию, без прохода по строкам."""
+        column = self.columns.get(field)
+        codes = column.find(value) if column is not None else []
+        if not codes:
+            return np.empty(0, dtype=np.intp)
+        index = self._indexes.get(field)
+        if index is None:
+            index = self._indexes[field] = PositionIndex(column.codes[:self.size], column.count)
+        found = [index.positions(code) for code in codes]
+        return found[0] if len(found) == 1 else np.sort(np.concatenate(found))
+
+    def value_map(self, field, positions: np.ndarray | None, func: Callable, default=None, dtype=object) -> np.ndarray:
+        """func(row.get(field, default)) для строк positions; func вызывается один раз на значение."""
+        column = self.columns.get(field)
+        values, count = (column.values, column.count) if column else ([], 0)
+        codes = self.codes(field, positions)
+        # Последний слот таблицы — он же индекс -1 — строки без поля
+        used = np.zeros(count + 1, dtype=bool)
+        used[codes] = True
+        table = np.zeros(count + 1, dtype=dtype)
+        for code in np.flatnonzero(used):
+            table[code] = func(values[code] if code < count else default)
+        return table[codes]
+
+    def mask(self, field, positions: np.ndarray | None, predicate: Callable[[Any], bool], default=None) -> np.ndarray:
+        """Маска predicate(row.get(field, default)) по строкам positions."""
+        return self.value_map(field, positions, predicate, default, dtype=bool)
+
+    def key_groups(self, fields: tuple) -> KeyGroups:
+        """Группы всех строк по ключу fields; строятся при первом обращении, дальше их ведёт запись."""
+        groups = self._groups.get(fields)
+        if groups is None:
+            groups = KeyGroups(fields)
+            groups.extend(self, 0, self.size)
+            self._groups[fields] = groups
+        return groups
+
+    def group_ids(self, positions: np.ndarray, fields: tuple) -> np.ndarray:
+        """Номер группы строки по ключу row.get(f1) or row.get(f2) or ...; -1 — ключ пуст.
+
+        Ключи сравниваются как ключи dict, группы пронумерованы по первому
+        появлению среди positions. Для всех строк — см. key_groups.
+        """
+        groups = np.full(len(positions), -1, dtype=np.int64)
+        undecided = np.arange(len(positions))
+        keys: dict = {}
+        for field in fields:
+            ids = self.value_map(
+                field, positions[undecided], lambda value: keys.setdefault(value, len(keys)) if value else -1,
+                dtype=np.int64,
+            )
+            groups[undecided] = ids
+            undecided = undecided[ids < 0]
+            if not len(undecided):
+                break
+        valid = groups >= 0
+        if valid.any():
+            # Перенумерация по первому появлению
+            _, first, inverse = np.unique(groups[valid], return_index=True, return_inverse=True)
+            rank = np.empty(len(first), dtype=np.int64)
+            rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+            groups[valid] = rank[inverse]
+        return groups
+
+    def rows(self, positions: Iterable[int] | np.ndarray | None = None) -> list[dict]:
+        """Словари строк в порядке positions (всех строк, если None)."""
+        positions = np.arange(self.size) if positions is None else np.asarray(positions, dtype=np.intp)
+        result: list = [None] * len(positions)
+        shapes = self._shape[positions]
+        for code in np.unique(shapes):
+            slots = np.flatnonzero(shapes == code)
+            fields = self._shapes[code]
+            if not fields:
+                for slot in slots.tolist():
+                    result[slot] = {}
+                continue
+            at = positions[slots]
+            columns = [self.columns[field].objects()[self.columns[field].codes[at]].tolist() for field in fields]
+            for slot, values in zip(slots.tolist(), zip(*columns)):
+                result[slot] = dict(zip(fields, values))
+        return result
+
+    def row(self, position: int) -> dict:
+        return self.rows([position])[0]
+
+
+class RowsView(Sequence):
+    """Строки хранилища как последовательность словарей (только чтение).
+
+    Словари собираются при обращении, их изменение хранилище не меняет.
+    """
+
+    def __init__(self, store: ExcelStore):
+        self._store = store
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._store.rows(np.arange(len(self))[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return self._store.row(index)
+
+    def __iter__(self) -> Iterator[dict]:
+        for start in range(0, len(self), ITER_CHUNK):
+            yield from self._store.rows(np.arange(start, min(start + ITER_CHUNK, len(self))))
+
+    def copy(self) -> list[dict]:
+        return self._store.rows()
@@ -0,0 +1,239 @@
+"""Форматы выгрузки отфильтрованных данных: xlsx, csv, parquet, arrow.
+
+Все форматы пишутся потоком по итератору строк (dict). Для parquet и
+arrow нужна схема заранее, поэтому вызывающий код сначала собирает её
+отдельным проходом (collect_schema) или по типам, посчитанным в БД
+(merge_schema): тип колонки выводится по всем значениям, разнотипные
+колонки выгружаются строками.
+
+parquet и arrow требуют pyarrow (есть в requirements.txt); если его всё же
+нет в окружении, эти форматы отвечают 400.
+"""
+import csv
+import io
+import math
+import numbers
+from datetime import date, datetime
+from typing import Iterable, Iterator
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from .xlsx_stream import XLSX_MEDIA_TYPE, stream_xlsx
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+EXPORT_FORMATS = {
+    "xlsx": XLSX_MEDIA_TYPE,
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+FORMAT_PATTERN = "^(" + "|".join(EXPORT_FORMATS) + ")$"
+# Форматы, которым нужен pyarrow
+ARROW_FORMATS = ("parquet", "arrow")
+
+CSV_FLUSH_ROWS = 1000
+ARROW_BATCH_ROWS = 10000
+PARQUET_ROW_GROUP_ROWS = 65536
+PARQUET_COMPRESSION = "zstd"
+
+
+def _kind(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, numbers.Integral):
+        return "int"
+    if isinstance(value, numbers.Real):
+        return None if math.isnan(value) else "float"
+    if isinstance(value, datetime):
+        return None if value != value else "timestamp"
+    if isinstance(value, date):
+        return "date"
+    return "string"
+
+
+def _merge_kinds(current: str | None, kind: str | None) -> str | None:
+    if current is None or current == kind:
+        return kind
+    if kind is None:
+        return current
+    if {current, kind} == {"int", "float"}:
+        return "float"
+    return "string"
+
+
+def collect_schema(rows: Iterable[dict]) -> dict[str, str | None]:
+    """Колонки (в порядке первого появления, как у pandas.DataFrame(rows)) и их тип.
+
+    None — в колонке только пустые значения.
+    """
+    schema: dict[str, str | None] = {}
+    for row in rows:
+        for key, value in row.items():
+            schema[key] = _merge_kinds(schema.get(key), _kind(value))
+    return schema
+
+
+def merge_schema(kinds: Iterable[tuple[str, str | None]]) -> dict[str, str | None]:
+    """Схема по парам (колонка, тип), когда типы значений уже известны (например, посчитаны в БД).
+
+    Колонки — в порядке первого появления пары, типы одной колонки сводятся как в collect_schema.
+    """
+    schema: dict[str, str | None] = {}
+    for key, kind in kinds:
+        schema[key] = _merge_kinds(schema.get(key), kind)
+    return schema
+
+
+def _empty(value) -> bool:
+    # NaN/±Inf пишутся пустыми, как null в JSON-ответах
+    return value is None or (isinstance(value, float) and not math.isfinite(value)) or (
+        isinstance(value, datetime) and value != value
+    )
+
+
+# ---------- csv ----------
+
+def _csv_value(value):
+    if _empty(value):
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+def _stream_csv(columns: list[str], rows: Iterable[dict]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(row.get(column)) for column in columns])
+        if count % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+# ---------- parquet / arrow ----------
+
+def _arrow_type(kind: str | None):
+    return {
+        "bool": pa.bool_(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "timestamp": pa.timestamp("us"),
+        "date": pa.date32(),
+    }.get(kind, pa.string())
+
+
+def _arrow_value(value, kind: str | None):
+    if _empty(value):
+        return None
+    if kind == "string" or kind is None:
+        return str(value)
+    if kind == "float":
+        return float(value)
+    if kind == "int":
+        return int(value)
+    if kind == "timestamp":
+        return value.replace(tzinfo=None)
+    return value
+
+
+def arrow_schema(schema: dict[str, str | None]):
+    return pa.schema([(str(column), _arrow_type(kind)) for column, kind in schema.items()])
+
+
+def _record_batches(schema: dict[str, str | None], rows: Iterable[dict], size: int):
+    target = arrow_schema(schema)
+    columns = list(schema.items())
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield _to_batch(target, columns, chunk)
+            chunk = []
+    if chunk:
+        yield _to_batch(target, columns, chunk)
+
+
+def _to_batch(target, columns, rows: list[dict]):
+    arrays = [
+        pa.array([_arrow_value(row.get(column), kind) for row in rows], type=target.field(i).type)
+        for i, (column, kind) in enumerate(columns)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=target)
+
+
+class _Sink(io.RawIOBase):
+    """Файл только на запись для pyarrow: байты забираются drain() по мере записи."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _stream_arrow(schema: dict[str, str | None], rows: Iterable[dict]) -> Iterator[bytes]:
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, arrow_schema(schema)) as writer:
+        for batch in _record_batches(schema, rows, ARROW_BATCH_ROWS):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _stream_parquet(schema: dict[str, str | None], rows: Iterable[dict]) -> Iterator[bytes]:
+    import pyarrow.parquet as pq
+
+    sink = _Sink()
+    with pq.ParquetWriter(sink, arrow_schema(schema), compression=PARQUET_COMPRESSION) as writer:
+        for batch in _record_batches(schema, rows, PARQUET_ROW_GROUP_ROWS):
+            writer.write_batch(batch, row_group_size=PARQUET_ROW_GROUP_ROWS)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_response(format: str, schema: dict[str, str | None], rows: Iterable[dict], filename: str) -> StreamingResponse:
+    """Потоковый ответ со строками rows в формате format; filename — имя без расширения."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    if format in ARROW_FORMATS and pa is None:
+        raise HTTPException(status_code=400, detail=f"Формат {format} недоступен: не установлен pyarrow")
+    columns = list(schema)
+    if format == "xlsx":
+        body = stream_xlsx(columns, rows)
+    elif format == "csv":
+        body = _stream_csv(columns, rows)
+    elif format == "arrow":
+        body = _stream_arrow(schema, rows)
+    else:
+        body = _stream_parquet(schema, rows)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}.{format}"},
+    )
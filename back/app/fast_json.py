@@ -0,0 +1,68 @@
+"""Быстрая сериализация JSON для больших списков.
+
+FastJSONResponse пишет тело через orjson: datetime, numpy и прочие типы
+кодируются без прохода jsonable_encoder, а NaN и ±Inf становятся null —
+ручная очистка значений перед ответом не нужна. Без orjson используется
+jsonable_encoder + json с той же заменой NaN/Inf на null.
+"""
+import json
+import math
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+
+def _default(value):
+    # Подклассы datetime (pd.Timestamp) orjson сам не кодирует
+    if isinstance(value, (datetime, date)):
+        return None if value != value else value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return jsonable_encoder(value)
+
+
+def _finite(value):
+    """Рекурсивно заменяет NaN/±Inf на None (для json без orjson)."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_finite(item) for item in value]
+    return value
+
+
+def _stdlib_dumps(content: Any) -> bytes:
+    return json.dumps(
+        _finite(jsonable_encoder(content)), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON в байтах; NaN/±Inf -> null."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Например, целые больше 64 бит — их кодирует только json
+            pass
+    return _stdlib_dumps(content)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse с сериализацией через dumps (orjson)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
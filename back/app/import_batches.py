@@ -0,0 +1,133 @@
+"""Партии импорта CRM (import_batches) — каталог загруженных файлов.
+
+Каждый загруженный файл — партия: строки crm_entries ссылаются на неё
+через индексированный batch_id. Для партии хранятся источник (первой
+строки файла), число строк, время последнего импорта и хэш последней
+загруженной версии. Каталог пересчитывается только для затронутых
+партий при импорте и удалении, поэтому /list_uploaded_sources — один
+запрос, а удаление файла идёт по индексу batch_id, а не перебором
+crm_entries по filename.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .models import CRMEntry, ImportBatch
+
+logger = logging.getLogger(__name__)
+
+# Сколько партий/имён файлов обрабатывать одним запросом
+BATCH_CHUNK = 500
+# По сколько строк удалять файл вне PostgreSQL
+DELETE_CHUNK = int(os.getenv("CRM_DELETE_CHUNK", "5000"))
+
+_table = ImportBatch.__table__
+_entries = CRMEntry.__table__
+
+
+def _ids_by_filename(db: Session, filenames: list[str]) -> dict[str, int]:
+    found = {}
+    for start in range(0, len(filenames), BATCH_CHUNK):
+        chunk = filenames[start:start + BATCH_CHUNK]
+        found.update(db.execute(select(_table.c.filename, _table.c.id).where(_table.c.filename.in_(chunk))).all())
+    return found
+
+
+def batch_ids(db: Session, filenames: Iterable[str | None]) -> dict[str, int]:
+    """id партий по именам файлов; недостающие партии создаются пустыми. Коммит не делается."""
+    names = sorted({name for name in filenames if name})
+    found = _ids_by_filename(db, names)
+    missing = [name for name in names if name not in found]
+    if missing:
+        # Число строк и источник заполнит refresh после записи строк
+        db.execute(insert(_table), [{"filename": name, "row_count": 0, "first_entry_id": 0} for name in missing])
+        found.update(_ids_by_filename(db, missing))
+    return found
+
+
+def batch_id(db: Session, filename: str) -> int | None:
+    return db.execute(select(_table.c.id).where(_table.c.filename == filename)).scalar()
+
+
+def _batch_stats(db: Session, ids: list[int]) -> dict[int, dict]:
+    stats = db.execute(
+        select(
+            CRMEntry.batch_id,
+            func.count(CRMEntry.id).label("row_count"),
+            func.min(CRMEntry.id).label("first_entry_id"),
+        )
+        .where(CRMEntry.batch_id.in_(ids))
+        .group_by(CRMEntry.batch_id)
+    ).all()
+    # Источник первой строки файла
+    sources = dict(db.execute(
+        select(CRMEntry.id, CRMEntry.source).where(CRMEntry.id.in_([row.first_entry_id for row in stats]))
+    ).all())
+    return {
+        row.batch_id: {
+            "row_count": row.row_count,
+            "first_entry_id": row.first_entry_id,
+            "source": sources[row.first_entry_id],
+        }
+        for row in stats
+    }
+
+
+def refresh(db: Session, ids: Iterable[int | None], imported: dict[int, str | None] | None = None) -> int:
+    """Пересчитывает каталог для указанных партий (партии без строк удаляются).
+
+    imported — партии, загруженные сейчас, с хэшем загруженной версии: им
+    обновляются file_hash и imported_at. Коммит не делается.
+    """
+    imported = imported or {}
+    ids = sorted({batch for batch in (*ids, *imported) if batch is not None})
+    now = datetime.now()
+    for start in range(0, len(ids), BATCH_CHUNK):
+        chunk = ids[start:start + BATCH_CHUNK]
+        stats = _batch_stats(db, chunk)
+        empty = [batch for batch in chunk if batch not in stats]
+        if empty:
+            db.execute(delete(_table).where(_table.c.id.in_(empty)))
+        for batch, values in stats.items():
+            if batch in imported:
+                values.update(file_hash=imported[batch], imported_at=now)
+            db.execute(update(_table).where(_table.c.id == batch).values(**values))
+    return len(ids)
+
+
+def delete_entries(db: Session, batch: int) -> int:
+    """Удаляет строки партии по индексу batch_id, возвращает их число. Коммит не делается.
+
+    На PostgreSQL — один DELETE, на остальных БД (SQLite) — кусками по
+    DELETE_CHUNK строк, чтобы один оператор не держал весь файл.
+    """
+    in_batch = _entries.c.batch_id == batch
+    if db.get_bind().dialect.name == "postgresql":
+        return db.execute(delete(_entries).where(in_batch)).rowcount
+    deleted = 0
+    while True:
+        chunk = select(_entries.c.id).where(in_batch).limit(DELETE_CHUNK)
+        count = db.execute(delete(_entries).where(_entries.c.id.in_(chunk))).rowcount
+        deleted += count
+        if count < DELETE_CHUNK:
+            return deleted
+
+
+def clear(db: Session):
+    db.execute(delete(_table))
+
+
+def rebuild(db: Session) -> int:
+    """Пересчитывает число строк и источник всех партий. Коммит не делается."""
+    total = refresh(db, db.execute(select(_table.c.id)).scalars().all())
+    logger.info("Каталог загрузок пересчитан: %s партий", total)
+    return total
+
+
+def list_batches(db: Session) -> list[ImportBatch]:
+    """Файлы в порядке первой загрузки."""
+    return db.query(ImportBatch).order_by(ImportBatch.first_entry_id, ImportBatch.id).all()
@@ -0,0 +1,263 @@
+"""Фоновые задачи импорта Excel с опросом прогресса.
+
+/upload_excel и /upload_excel_2025 с background=true сохраняют файлы во
+временные файлы, регистрируют задачу и сразу возвращают её id. Сама
+обработка идёт asyncio-задачей в процессе, принявшем загрузку (разбор —
+в пуле процессов, запись в БД — в потоках), а /import_jobs/{id} отдаёт
+состояние, число строк по листам, скорость и ошибки.
+
+Состояние задач хранится в таблице import_jobs, поэтому опрос работает
+на любом воркере. Одновременно выполняется не больше
+MAX_CONCURRENT_IMPORT_JOBS задач на всё развёртывание (считается запросом
+к таблице), лишние запросы получают 429. Выполняющаяся задача раз в
+IMPORT_JOB_HEARTBEAT_SEC отмечается в таблице; задача, воркер которой
+перестал её отмечать (упал или перезапущен), через IMPORT_JOB_STALE_SEC
+считается прерванной и место не занимает.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Awaitable, Callable
+
+from fastapi import APIRouter, HTTPException
+from sqlalchemy import delete, func, insert, or_, select, update
+
+from .database import SessionLocal
+from .models import ImportJobRecord
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+MAX_CONCURRENT_IMPORT_JOBS = int(os.getenv("MAX_CONCURRENT_IMPORT_JOBS", "2"))
+# Сколько завершённых задач помнить для опроса
+FINISHED_JOBS_KEPT = 100
+IMPORT_JOB_HEARTBEAT_SEC = float(os.getenv("IMPORT_JOB_HEARTBEAT_SEC", "30"))
+IMPORT_JOB_STALE_SEC = float(os.getenv("IMPORT_JOB_STALE_SEC", "300"))
+STALE_ERROR = "Задача прервана: воркер, выполнявший импорт, перестал отвечать"
+
+ACTIVE_STATES = ("queued", "parsing", "writing")
+
+_table = ImportJobRecord.__table__
+# Состояние задач пишет в БД один поток: колбэки импорта не ждут БД (на SQLite
+# она занята транзакцией самого импорта), а записи идут в порядке изменений
+_saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="import-jobs")
+# Ссылки на asyncio-задачи, чтобы их не собрал сборщик мусора
+_tasks: set = set()
+
+
+class ImportJob:
+    """Состояние одной фоновой загрузки; каждое изменение записывается в import_jobs."""
+
+    def __init__(self, kind: str, filenames: list[str]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filenames = filenames
+        self.state = "queued"
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.sheets: list[dict] = []
+        self.rows_parsed = 0
+        self.rows_written = 0
+        self.counts: dict = {}
+        self.result: dict | None = None
+        self.errors: list[str] = []
+        # Колбэки зовутся и из event loop, и из потоков записи
+        self._lock = threading.Lock()
+        self._save_pending = False
+
+    def _values(self) -> dict:
+        return {
+            "state": self.state,
+            "sheets": list(self.sheets),
+            "rows_parsed": self.rows_parsed,
+            "rows_written": self.rows_written,
+            "counts": dict(self.counts),
+            "result": self.result,
+            "errors": list(self.errors),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "updated_at": time.time(),
+        }
+
+    def _write(self):
+        with self._lock:
+            self._save_pending = False
+            values = self._values()
+        try:
+            with SessionLocal() as db:
+                db.execute(update(_table).where(_table.c.id == self.id).values(**values))
+                db.commit()
+        except Exception:
+            # Прогресс не должен ронять сам импорт
+            logger.exception("Не удалось сохранить состояние импорта %s", self.id)
+
+    def save(self) -> Future:
+        """Ставит запись текущего состояния в очередь; Future завершится после записи."""
+        return _saver.submit(self._write)
+
+    def _changed(self):
+        # Пока запись в очереди, новые изменения попадут в неё же
+        with self._lock:
+            if self._save_pending:
+                return
+            self._save_pending = True
+        self.save()
+
+    # Колбэки для этапов импорта
+    def sheet_parsed(self, filename: str, sheet_name: str, rows: int):
+        with self._lock:
+            self.sheets.append({"filename": filename, "sheet": sheet_name, "rows": rows})
+            self.rows_parsed += rows
+        self._changed()
+
+    def writing(self):
+        self.state = "writing"
+        self._changed()
+
+    def batch_written(self, batch_no: int, counts):
+        with self._lock:
+            if isinstance(counts, dict):
+                self.counts = counts
+                self.rows_written = sum(counts.values())
+            else:
+                self.rows_written = counts
+        self._changed()
+
+
+def _stale_before() -> float:
+    return time.time() - IMPORT_JOB_STALE_SEC
+
+
+def _job_dict(row) -> dict:
+    state, errors, finished_at = row.state, row.errors, row.finished_at
+    if state in ACTIVE_STATES and row.updated_at < _stale_before():
+        # Воркер задачи перестал её отмечать — упал или перезапущен
+        state, errors, finished_at = "error", [*(errors or []), STALE_ERROR], row.updated_at
+    end = finished_at or time.time()
+    elapsed = end - row.started_at if row.started_at else 0
+    return {
+        "id": row.id,
+        "kind": row.kind,
+        "state": state,
+        "files": row.filenames,
+        "sheets": row.sheets,
+        "rows_parsed": row.rows_parsed,
+        "rows_written": row.rows_written,
+        "counts": row.counts,
+        "rows_per_sec": round(row.rows_written / elapsed, 1) if elapsed > 0 else 0,
+        "elapsed_sec": round(elapsed, 3),
+        "created_at": row.created_at,
+        "finished_at": finished_at,
+        "result": row.result,
+        "errors": errors,
+    }
+
+
+def _active_count(db) -> int:
+    """Число выполняющихся задач всех воркеров; прерванные (без отметок) не считаются."""
+    return db.execute(
+        select(func.count()).select_from(_table)
+        .where(_table.c.state.in_(ACTIVE_STATES), _table.c.updated_at >= _stale_before())
+    ).scalar()
+
+
+def _forget_finished(db):
+    # Завершённые и прерванные задачи сверх FINISHED_JOBS_KEPT
+    finished = or_(_table.c.state.notin_(ACTIVE_STATES), _table.c.updated_at < _stale_before())
+    kept = select(_table.c.id).where(finished).order_by(_table.c.created_at.desc()).limit(FINISHED_JOBS_KEPT)
+    db.execute(delete(_table).where(finished, _table.c.id.notin_(kept)))
+
+
+def _too_many():
+    return HTTPException(status_code=429, detail="Слишком много одновременных импортов, повторите позже")
+
+
+def ensure_capacity():
+    """429, если уже выполняется MAX_CONCURRENT_IMPORT_JOBS задач (блокирующий вызов)."""
+    with SessionLocal() as db:
+        active = _active_count(db)
+    if active >= MAX_CONCURRENT_IMPORT_JOBS:
+        raise _too_many()
+
+
+def _register(job: ImportJob):
+    """Записывает задачу в import_jobs, если есть место; иначе 429."""
+    with SessionLocal() as db:
+        if _active_count(db) >= MAX_CONCURRENT_IMPORT_JOBS:
+            raise _too_many()
+        db.execute(insert(_table).values(
+            id=job.id, kind=job.kind, filenames=job.filenames, created_at=job.created_at, **job._values(),
+        ))
+        db.commit()
+        # Другой воркер мог занять место одновременно: проверяем уже со своей записью
+        if _active_count(db) > MAX_CONCURRENT_IMPORT_JOBS:
+            db.execute(delete(_table).where(_table.c.id == job.id))
+            db.commit()
+            raise _too_many()
+        _forget_finished(db)
+        db.commit()
+
+
+async def _heartbeat(job: ImportJob):
+    while True:
+        await asyncio.sleep(IMPORT_JOB_HEARTBEAT_SEC)
+        await asyncio.wrap_future(job.save())
+
+
+async def _run(job: ImportJob, work: Callable[[ImportJob], Awaitable[dict]]):
+    job.state = "parsing"
+    job.started_at = time.time()
+    await asyncio.wrap_future(job.save())
+    heartbeat = asyncio.create_task(_heartbeat(job))
+    try:
+        result = await work(job)
+        job.result = result
+        if result.get("status") == "error":
+            job.errors.append(str(result.get("error")))
+            job.state = "error"
+        else:
+            job.state = "done"
+    except HTTPException as e:
+        job.errors.append(str(e.detail))
+        job.state = "error"
+    except Exception as e:
+        logger.exception("Импорт %s завершился ошибкой", job.id)
+        job.errors.append(str(e))
+        job.state = "error"
+    finally:
+        heartbeat.cancel()
+        job.finished_at = time.time()
+        await asyncio.wrap_future(job.save())
+        logger.info("Импорт %s: %s, %s строк", job.id, job.state, job.rows_written)
+
+
+async def start_import_job(kind: str, filenames: list[str], work: Callable[[ImportJob], Awaitable[dict]]) -> ImportJob:
+    """Регистрирует задачу и запускает work(job) в фоне текущего event loop."""
+    job = ImportJob(kind, filenames)
+    await asyncio.to_thread(_register, job)
+    task = asyncio.get_running_loop().create_task(_run(job, work))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+@router.get("/import_jobs/{job_id}", tags=["Import"])
+def get_import_job(job_id: str):
+    with SessionLocal() as db:
+        row = db.execute(select(_table).where(_table.c.id == job_id)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return _job_dict(row)
+
+
+@router.get("/import_jobs", tags=["Import"])
+def list_import_jobs():
+    with SessionLocal() as db:
+        rows = db.execute(select(_table).order_by(_table.c.created_at.desc())).all()
+    return [_job_dict(row) for row in rows]
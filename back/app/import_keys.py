@@ -0,0 +1,63 @@
+"""Стабильные ключи строк для идемпотентного импорта CRM.
+
+Ключ строки — "Уникальный идентификатор" или "Код платежа", если они есть,
+иначе хэш нормализованного содержимого строки. Хэш-ключ привязан к файлу
+(scope — имя файла): одинаковые по содержимому строки разных файлов —
+разные строки, и импорт одного файла не переносит к себе строки другого.
+Одинаковые строки внутри одного файла нумеруются (#1, #2...), поэтому
+настоящие повторы в выписке не склеиваются, а повторный импорт того же
+файла даёт те же ключи.
+"""
+import hashlib
+import json
+
+# Поля, которые однозначно идентифицируют платёж
+ROW_ID_FIELDS = ("Уникальный идентификатор", "Код платежа")
+HASH_PREFIX = "hash:"
+
+
+def _normalize_id(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def scoped_key(row_key: str, scope: str) -> str:
+    """Хэш-ключ, привязанный к файлу scope; ключи по идентификатору платежа не меняются."""
+    if not row_key.startswith(HASH_PREFIX):
+        return row_key
+    return f"{HASH_PREFIX}{scope}:{row_key[len(HASH_PREFIX):]}"
+
+
+def row_base_key(data: dict, scope: str | None = None) -> str:
+    """Ключ строки без учёта повторов внутри файла; scope — имя файла для хэш-ключа."""
+    for field in ROW_ID_FIELDS:
+        value = _normalize_id(data.get(field))
+        if value is not None:
+            return f"{field}:{value}"
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    key = HASH_PREFIX + hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    return key if scope is None else scoped_key(key, scope)
+
+
+class RowKeyer:
+    """Выдаёт ключи строк одного файла (scope — его имя), нумеруя повторяющиеся строки.
+
+    Без scope хэш-ключи не привязаны к файлу (так они считались до ревизии a3c6e9f1b478).
+    """
+
+    def __init__(self, scope: str | None = None):
+        self._scope = scope
+        self._seen: dict[str, int] = {}
+
+    def __call__(self, data: dict) -> str:
+        base = row_base_key(data, self._scope)
+        occurrence = self._seen.get(base, 0)
+        self._seen[base] = occurrence + 1
+        return base if occurrence == 0 else f"{base}#{occurrence}"
@@ -4,9 +4,12 @@ from fastapi.staticfiles import StaticFiles
 from . import models, database, crm
 from .routes import router
 from .upload_excel import router as upload_excel_router
-from .merge_excel import router as merge_excel_router
+from .merge_excel import router as merge_excel_router, restore_store, close_store
 from .ai import router as ai_router
 from .crm_analyzer import router as crm_analyzer_router
+from .import_jobs import router as import_jobs_router
+from .response_cache import router as response_cache_router
+from .compression import CompressionMiddleware
 import os
 from fastapi.openapi.utils import get_openapi
 from fastapi.security import OAuth2PasswordBearer
@@ -16,6 +19,9 @@ models.Base.metadata.create_all(bind=database.engine)
 
 app = FastAPI()
 
+# gzip/brotli для больших JSON-ответов по Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
 # Разрешаем CORS для фронтенда
 app.add_middleware(
     CORSMiddleware,
@@ -33,6 +39,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Курсор следующей страницы списков CRM
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Подключаем static/ — для фото профиля
@@ -46,6 +54,17 @@ app.include_router(upload_excel_router, prefix="/api")
 app.include_router(merge_excel_router, prefix="/api")
 app.include_router(ai_router, prefix="/api")
 app.include_router(crm_analyzer_router, prefix="/api")
+app.include_router(import_jobs_router, prefix="/api")
+app.include_router(response_cache_router, prefix="/api")
+
+# Данные Excel 2025 переживают перезапуск: снимок + журнал изменений на диске
+@app.on_event("startup")
+def restore_excel_2025():
+    restore_store()
+
+@app.on_event("shutdown")
+def close_excel_2025():
+    close_store()
 
 # Добавляем схему безопасности Bearer для Swagger UI
 @app.on_event("startup")
@@ -1,25 +1,24 @@
-from fastapi import APIRouter, UploadFile, File, Query, Body, Form, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Query, Body, Form, HTTPException
 from typing import List, Optional
 import pandas as pd
-import io
 import numpy as np
 from datetime import datetime
 from collections import defaultdict, Counter
-from fastapi.responses import StreamingResponse
-
-router = APIRouter()
-
-def get_month_from_date_string(date_str):
-    if not date_str or pd.isnull(date_str):
-        return None
-    try:
-        date_str = str(date_str).strip()
-        if date_str.lower() in ['nan', 'nat', 'none', '']:
-            return None
-        parsed_date = pd.to_datetime(date_str, errors='coerce', dayfirst=True)
-        return parsed_date.month if pd.notnull(parsed_date) else None
-    except:
-        return None
+from contextlib import contextmanager
+from .excel_reader import remove_spooled, spool_upload
+from .excel_parallel import ExcelParseError, iter_spooled_records, parse_workbooks
+from .import_jobs import ImportJob, ensure_capacity, start_import_job
+from . import excel_db, excel_journal, response_cache
+from .date_parsing import parse_dotted_date
+from .excel_store import ExcelStore, RowsView
+from .export_formats import FORMAT_PATTERN, collect_schema, export_response
+from .fast_json import FastJSONResponse
+from starlette.concurrency import run_in_threadpool
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
 
 # Словарь синонимов для унификации полей
 FIELD_SYNONYMS = {
@@ -29,100 +28,183 @@ FIELD_SYNONYMS = {
     # Добавь другие пары, если нужно
 }
 
-# Глобальное хранилище для всех загруженных пользователей (на время жизни процесса)
-all_users_data = []
+# Поля, группы по которым хранилище ведёт между запросами (типы донаторов)
+GROUPED_FIELDS = ("ФИО", "E-mail")
+
+# Глобальное хранилище для всех загруженных пользователей (на время жизни процесса),
+# колоночное — см. excel_store. Это опубликованная версия: она не меняется,
+# запрос берёт её один раз (data = store) и работает с ней до конца
+store = ExcelStore()
+# Те же строки как последовательность словарей (crm_analyzer, отладочные эндпоинты)
+all_users_data = RowsView(store)
+# Изменения — по одному: черновик новой версии строится под этой блокировкой
+_write_lock = threading.RLock()
+# Куда сохраняются изменения (подключается при старте): снимок и журнал
+# на диске (EXCEL_STORE_DIR) или таблица excel_users (EXCEL_STORE_BACKEND=db)
+journal: excel_journal.ExcelJournal | excel_db.ExcelDatabase | None = None
+
+
+def restore_store():
+    """Поднимает хранилище: из БД или с диска (снимок + журнал изменений после него)."""
+    global journal
+    with _new_version() as draft:
+        if excel_db.EXCEL_STORE_BACKEND == "db":
+            journal = excel_db.attach(draft)
+        else:
+            journal = excel_journal.open_journal(draft)
+    response_cache.bump(response_cache.EXCEL_2025)
+
+
+def close_store():
+    if isinstance(journal, excel_journal.ExcelJournal):
+        journal.close()
+
+
+def sync_store():
+    """В режиме БД догоняет кэш воркера до версии в БД (перед каждым запросом)."""
+    if not (isinstance(journal, excel_db.ExcelDatabase) and journal.stale()):
+        return
+    with _new_version() as draft:
+        changed = journal.sync(draft)
+    if changed:
+        response_cache.bump(response_cache.EXCEL_2025)
+
+
+def current_rows() -> RowsView:
+    """Строки текущей версии (в режиме БД — после сверки с БД) для других модулей."""
+    sync_store()
+    return all_users_data
+
+
+@contextmanager
+def _new_version():
+    """Черновик следующей версии хранилища; по выходе он становится текущей версией.
+
+    Черновик публикуется и при исключении: изменения, уже записанные в
+    журнал, должны быть видны (в режиме БД после отката кэш перечитывается).
+    """
+    global store, all_users_data
+    with _write_lock:
+        draft = store.copy()
+        try:
+            yield draft
+        finally:
+            store, all_users_data = draft, RowsView(draft)
+
+
+@contextmanager
+def _writing():
+    """Контекст изменения хранилища: черновик версии, в режиме БД — в транзакции под блокировкой версии."""
+    with _new_version() as draft:
+        if isinstance(journal, excel_db.ExcelDatabase):
+            with journal.writing(draft):
+                yield draft
+        else:
+            yield draft
+
+
+router = APIRouter(dependencies=[Depends(sync_store)])
+
+
 
+def _append_entries(entries: list[dict]):
+    with _writing() as draft:
+        # Добавляем уникальный id (после всех когда-либо выданных)
+        next_id = draft.last_id + 1
+        for offset, row_data in enumerate(entries):
+            row_data['id'] = next_id + offset
+        draft.append(entries)
+
+
+async def run_excel_2025_import(uploads, extra_by_file, job: ImportJob | None = None):
+    """Разбирает сохранённые во временные файлы загрузки и добавляет строки в хранилище."""
+    try:
+        # Листы всех файлов разбираются параллельно в пуле процессов
+        parsed = await parse_workbooks(uploads, extra_by_file, on_sheet=job.sheet_parsed if job else None)
+        for sheet in parsed:
+            logger.debug("Лист %s (%s): %s строк", sheet.sheet_name, sheet.filename, sheet.rows)
+        all_entries = await run_in_threadpool(
+            lambda: [row for sheet in parsed for row in iter_spooled_records(sheet)]
+        )
+    except ExcelParseError as e:
+        logger.error("Ошибка обработки файла %s: %s", e.filename, e)
+        raise HTTPException(status_code=400, detail=f"Ошибка обработки файла {e.filename}: {str(e)}")
+    finally:
+        remove_spooled(path for _, path in uploads)
+    if job:
+        job.writing()
+
+    if not all_entries:
+        logger.debug("Нет валидных данных для сохранения")
+        return {"status": "no_valid_data"}
+
+    # Добавляем все записи в глобальное хранилище (кодирование колонок — в потоке)
+    await run_in_threadpool(_append_entries, all_entries)
+    response_cache.bump(response_cache.EXCEL_2025)
+    if job:
+        job.batch_written(1, len(all_entries))
+    logger.debug("Добавлено %s записей в хранилище Excel 2025", len(all_entries))
+    return {"status": "success", "saved": len(all_entries)}
 
 
 @router.post("/upload_excel_2025", tags=["Excel"])
 async def upload_excel_2025(
     files: List[UploadFile] = File(...),
-    sources: str = Form(None)
+    sources: str = Form(None),
+    background: bool = Form(False, description="Вернуть id задачи сразу, прогресс — в /import_jobs/{id}"),
 ):
-    global all_users_data
-    print(f"DEBUG: Получен запрос на загрузку {len(files)} файлов")
-    print(f"DEBUG: Источники: {sources}")
+    logger.debug("Загрузка %s файлов, источники: %s", len(files), sources)
+    if background:
+        # Не принимаем файлы, если очередь задач уже заполнена
+        await run_in_threadpool(ensure_capacity)
+    uploads = []
     try:
-        all_entries = []
-        month_names = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
-                       'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
-        
-        for file in files:
-            print(f"DEBUG: Обрабатываем файл {file.filename}")
-            try:
-                content = await file.read()
-                print(f"DEBUG: Размер файла {file.filename}: {len(content)} байт")
-                excel = pd.ExcelFile(io.BytesIO(content))
-                print(f"DEBUG: Листы в файле {file.filename}: {excel.sheet_names}")
+        extra_by_file = []
+        try:
+            for file in files:
+                path = await spool_upload(file)
+                logger.debug("Файл %s: %s байт", file.filename, os.path.getsize(path))
                 original_filename = file.filename
-                
-                for sheet_name in excel.sheet_names:
-                    print(f"DEBUG: Обрабатываем лист {sheet_name}")
-                    df = pd.read_excel(excel, sheet_name=sheet_name)
-                    print(f"DEBUG: Размер листа {sheet_name}: {len(df)} строк")
-                    
-                    for _, row in df.iterrows():
-                        row_data = row.to_dict()
-                        # Удаляем все варианты ключа 'month' или 'месяц'
-                        for key in list(row_data.keys()):
-                            if key.strip().lower() in ['month', 'месяц']:
-                                del row_data[key]
-                        
-                        # Добавляем определение месяца
-                        if sheet_name in month_names:
-                            row_data['month'] = sheet_name
-                        else:
-                            # Пробуем взять месяц из поля "Дата" или "Дата и время"
-                            date_field = None
-                            for k in row_data:
-                                if k.strip().lower() in ['дата', 'дата и время', 'date', 'datetime']:
-                                    date_field = row_data[k]
-                                    break
-                            month_num = get_month_from_date_string(date_field)
-                            row_data['month'] = month_names[month_num - 1] if month_num and 1 <= month_num <= 12 else None
-
-                        if row_data['month'] is not None:
-                            # Добавляем источник и filename
-                            if sources and sources.strip():
-                                row_data['источник'] = sources
-                            else:
-                                row_data['источник'] = original_filename.replace('.xlsx', '').replace('.xls', '')
-                            row_data['filename'] = original_filename
-                            
-                            # Добавляем уникальный id
-                            next_id = len(all_users_data) + len(all_entries) + 1
-                            row_data['id'] = next_id
-                            
-                            all_entries.append(row_data)
-                            
-            except Exception as e:
-                print(f"ERROR: Ошибка обработки файла {file.filename}: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Ошибка обработки файла {file.filename}: {str(e)}")
-
-        if not all_entries:
-            print("DEBUG: Нет валидных данных для сохранения")
-            return {"status": "no_valid_data"}
-
-        # Добавляем все записи в глобальное хранилище
-        all_users_data.extend(all_entries)
-        print(f"DEBUG: Успешно добавлено {len(all_entries)} записей в all_users_data")
-        return {"status": "success", "saved": len(all_entries)}
-        
+                # Добавляем источник и filename
+                if sources and sources.strip():
+                    entry_source = sources
+                else:
+                    entry_source = original_filename.replace('.xlsx', '').replace('.xls', '')
+                uploads.append((original_filename, path))
+                extra_by_file.append({'источник': entry_source, 'filename': original_filename})
+        except Exception:
+            remove_spooled(path for _, path in uploads)
+            raise
+
+        if background:
+            try:
+                job = await start_import_job(
+                    "excel_2025", [filename for filename, _ in uploads],
+                    lambda job: run_excel_2025_import(uploads, extra_by_file, job),
+                )
+            except Exception:
+                remove_spooled(path for _, path in uploads)
+                raise
+            return {"status": "accepted", "job_id": job.id}
+        return await run_excel_2025_import(uploads, extra_by_file)
+
     except Exception as e:
-        print(f"ERROR: Общая ошибка в upload_excel_2025: {str(e)}")
-        print(f"ERROR: Тип ошибки: {type(e)}")
-        import traceback
-        print(f"ERROR: Traceback: {traceback.format_exc()}")
+        if isinstance(e, HTTPException) and e.status_code == 429:
+            raise
+        logger.exception("Ошибка загрузки файлов в upload_excel_2025")
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки файлов: {str(e)}")
 
 @router.get("/count_users_excel_2025", tags=["Excel"])
 def count_users_excel_2025():
-    return {"all_users": len(all_users_data)}
+    return {"all_users": len(store)}
 
-@router.get("/all_users_excel_2025", tags=["Excel"])
+@router.get("/all_users_excel_2025", tags=["Excel"], response_class=FastJSONResponse)
 def all_users_excel_2025():
+    return response_cache.cached_json(response_cache.EXCEL_2025, "all_users", {}, lambda response: _all_users())
+
+def _all_users():
     result = []
-    for row in all_users_data:
+    for row in store.rows():
         gender = row.get("gender")
         if not gender:
             fio = row.get("ФИО")
@@ -133,7 +215,7 @@ def all_users_excel_2025():
         if not language:
             language = "неизвестно"
         
-        row_with_data = dict(row)
+        row_with_data = row
         row_with_data["gender"] = gender
         row_with_data["язык"] = language
         
@@ -149,79 +231,80 @@ def all_users_excel_2025():
     return result
 
 def parse_date_safe(date_str):
-    """Безопасное парсирование даты из различных форматов"""
-    if not date_str:
-        return None
-    
-    date_str = str(date_str).strip()
-    
-    # Формат DD.MM.YYYY
-    if '.' in date_str and len(date_str.split('.')) == 3:
-        try:
-            return datetime.strptime(date_str, "%d.%m.%Y")
-        except:
-            pass
-    
-    # Формат DD/MM/YYYY
-    if '/' in date_str and len(date_str.split('/')) == 3:
-        try:
-            return datetime.strptime(date_str, "%d/%m/%Y")
-        except:
-            pass
-    
-    # ISO формат (YYYY-MM-DD)
-    if '-' in date_str and len(date_str.split('-')) == 3:
-        try:
-            return datetime.fromisoformat(date_str.split('T')[0])
-        except:
-            pass
-    
-    # Если ничего не подошло, возвращаем None
-    return None
+    """Безопасное парсирование даты из различных форматов (DD.MM.YYYY, DD/MM/YYYY, YYYY-MM-DD)"""
+    return parse_dotted_date(date_str)
 
 @router.get("/filter_users_by_date_excel_2025", tags=["Excel"])
 def filter_users_by_date_excel_2025(
     date_from: str = Query(..., description="Начальная дата в формате DD.MM.YYYY"),
     date_to: str = Query(..., description="Конечная дата в формате DD.MM.YYYY")
 ):
-    filtered = []
     dt_from = parse_date_safe(date_from)
     dt_to = parse_date_safe(date_to)
-    if dt_from and dt_to:
-        for row in all_users_data:
-            date_val = row.get("Дата")
-            if date_val:
-                dt = parse_date_safe(date_val)
-                if dt and dt_from <= dt <= dt_to:
-                    filtered.append(row)
-    return filtered
+    if not (dt_from and dt_to):
+        return []
+    data = store
+    return data.rows(np.flatnonzero(_date_mask(data, None, dt_from, dt_to)))
+
+def _date_mask(data: ExcelStore, positions, dt_from, dt_to):
+    """Маска строк с датой (поле "Дата") в [dt_from, dt_to]; дата разбирается раз на значение."""
+    def in_range(date_val):
+        if not date_val:
+            return False
+        dt = parse_date_safe(date_val)
+        return bool(dt and dt_from <= dt <= dt_to)
+    return data.mask("Дата", positions, in_range)
+
+def _positions_by_type(data: ExcelStore, positions, accepted: set, fields: tuple):
+    """Строки доноров выбранных типов (single/periodic/frequent) по ключу fields.
+
+    Порядок как у прохода по группам: группы — по первому появлению ключа,
+    строки группы — по порядку. Для всех строк (positions=None) группы и
+    их размеры берутся из агрегата хранилища (excel_store.key_groups).
+    """
+    if positions is None:
+        groups = data.key_groups(fields)
+        group_ids, counts = groups.ids, groups.counts
+        order = groups.order()
+        rank = np.zeros(len(counts), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        positions = np.arange(len(data))
+    else:
+        group_ids = data.group_ids(positions, fields)
+        counts = np.bincount(group_ids[group_ids >= 0])
+        rank = np.arange(len(counts))
+    grouped = np.flatnonzero(group_ids >= 0)
+    group_of_row = group_ids[grouped]
+    # 0 — single, 1 — periodic (2-4), 2 — frequent (5+)
+    classes = np.where(counts == 1, 0, np.where(counts <= 4, 1, 2))
+    accepted_classes = np.array([name in accepted for name in ("single", "periodic", "frequent")])
+    selected = accepted_classes[classes[group_of_row]]
+    rows = grouped[selected]
+    return positions[rows[np.argsort(rank[group_of_row[selected]], kind="stable")]]
+
+def _positions_where(data: ExcelStore, field, predicate):
+    return np.flatnonzero(data.mask(field, None, predicate))
 
 @router.get("/filter_users_by_count_excel_2025", tags=["Excel"])
 def filter_users_by_count_excel_2025(
     type: str = Query(..., regex="^(single|periodic|frequent)$", description="single/periodic/frequent"),
     by: str = Query("ФИО", description="Ключ для группировки: 'ФИО' или 'E-mail'")
 ):
-    counter = defaultdict(list)
-    for row in all_users_data:
-        key = row.get(by)
-        if key:
-            counter[key].append(row)
-    if type == "single":
-        result = [rows[0] for rows in counter.values() if len(rows) == 1]
-    elif type == "periodic":
-        result = [row for rows in counter.values() if 2 <= len(rows) <= 4 for row in rows]
-    elif type == "frequent":
-        result = [row for rows in counter.values() if len(rows) >= 5 for row in rows]
-    else:
-        result = []
-    return result
+    # Группы по ФИО и E-mail ведёт хранилище, по остальным полям — считаются по кодам значений
+    if type not in ("single", "periodic", "frequent"):
+        return []
+    data = store
+    positions = None if by in GROUPED_FIELDS else np.arange(len(data))
+    return data.rows(_positions_by_type(data, positions, {type}, (by,)))
 
 @router.get("/user_analytics_excel_2025", tags=["Excel"])
 def user_analytics_excel_2025(
     key: str = Query(..., description="Значение для поиска (ФИО или E-mail)"),
     by: str = Query("ФИО", description="Поле для поиска: 'ФИО' или 'E-mail'")
 ):
-    user_rows = [row for row in all_users_data if row.get(by) == key]
+    # Строки донора — по индексу значений поля (excel_store.positions)
+    data = store
+    user_rows = data.rows(data.positions(by, key))
     if not user_rows:
         return {"error": "User not found"}
 
@@ -300,51 +383,51 @@ def guess_language_by_fio(fio: str) -> str:
 
 @router.get("/users_with_unknown_gender_excel_2025", tags=["Excel"])
 def users_with_unknown_gender_excel_2025():
-    result = []
-    for row in all_users_data:
-        fio = row.get("ФИО")
-        gender = guess_gender_by_fio(fio)
-        if gender == "неизвестно":
-            row_with_gender = dict(row)
-            row_with_gender["gender"] = gender
-            result.append(row_with_gender)
+    data = store
+    unknown = _positions_where(data, "ФИО", lambda fio: guess_gender_by_fio(fio) == "неизвестно")
+    result = data.rows(unknown)
+    for row in result:
+        row["gender"] = "неизвестно"
     return result
 
+def _set_field(id: int, field: str, value) -> dict:
+    with _writing() as draft:
+        positions = draft.positions("id", id)
+        for position in positions:
+            draft.update(position, {field: value})
+    response_cache.bump(response_cache.EXCEL_2025)
+    return {"updated": len(positions)}
+
 @router.post("/set_user_phone_excel_2025", tags=["Excel"])
 def set_user_phone_excel_2025(
     id: int = Body(..., description="ID пользователя"),
     phone: str = Body(..., description="Новый телефон")
 ):
-    updated = 0
-    for row in all_users_data:
-        if row.get("id") == id:
-            row["телефон"] = phone
-            updated += 1
-    return {"updated": updated}
+    return _set_field(id, "телефон", phone)
 
 @router.post("/set_user_language_excel_2025", tags=["Excel"])
 def set_user_language_excel_2025(
     id: int = Body(..., description="ID пользователя"),
     language: str = Body(..., description="Новый язык")
 ):
-    updated = 0
-    for row in all_users_data:
-        if row.get("id") == id:
-            row["язык"] = language
-            updated += 1
-    return {"updated": updated}
+    return _set_field(id, "язык", language)
 
 @router.post("/set_user_gender_excel_2025", tags=["Excel"])
 def set_user_gender_excel_2025(
     id: int = Body(..., description="ID пользователя"),
     gender: str = Body(..., description="Новый пол: 'мужчина', 'женщина', 'неизвестно'")
 ):
-    updated = 0
-    for row in all_users_data:
-        if row.get("id") == id:
-            row["gender"] = gender
-            updated += 1
-    return {"updated": updated}
+    return _set_field(id, "gender", gender)
+
+def _fio_fallback_mask(data: ExcelStore, positions, field, own_value, accepts, guess):
+    """accepts(значение) для строк, где own_value(row[field]), иначе accepts(guess(ФИО))."""
+    if positions is None:
+        positions = np.arange(len(data))
+    own = data.mask(field, positions, own_value)
+    result = np.zeros(len(positions), dtype=bool)
+    result[own] = data.mask(field, positions[own], lambda value: accepts(value.strip().lower()))
+    result[~own] = data.mask("ФИО", positions[~own], lambda fio: accepts(guess(fio)))
+    return result
 
 @router.get("/filter_users_by_gender_excel_2025", tags=["Excel"])
 def filter_users_by_gender_excel_2025(
@@ -361,15 +444,10 @@ def filter_users_by_gender_excel_2025(
         "female": "женщина"
     }
     gender_norm = gender_map.get(gender_norm, gender_norm)
-    result = []
-    for row in all_users_data:
-        g = row.get("gender")
-        if not g:
-            fio = row.get("ФИО")
-            g = guess_gender_by_fio(fio)
-        if g and g.strip().lower() == gender_norm:
-            result.append(row)
-    return result
+    # Пол из поля gender, а если его нет — по ФИО
+    data = store
+    mask = _fio_fallback_mask(data, None, "gender", bool, lambda g: g == gender_norm, guess_gender_by_fio)
+    return data.rows(np.flatnonzero(mask))
 
 @router.get("/filter_users_by_language_excel_2025", tags=["Excel"])
 def filter_users_by_language_excel_2025(
@@ -386,27 +464,68 @@ def filter_users_by_language_excel_2025(
         "other": "другой"
     }
     lang_norm = lang_map.get(lang_norm, lang_norm)
-    result = []
-    for row in all_users_data:
-        l = row.get("язык")
-        if not l or l == "неизвестно":
-            fio = row.get("ФИО")
-            l = guess_language_by_fio(fio)
-        l_norm = l.strip().lower() if l else "неизвестно"
+
+    def accepts(l_norm):
         if lang_norm == "другой":
-            if l_norm not in ("казахский", "русский", "английский"):
-                result.append(row)
-        elif l_norm == lang_norm:
-            result.append(row)
-    return result
+            return l_norm not in ("казахский", "русский", "английский")
+        return l_norm == lang_norm
+
+    # Язык из поля язык, а если он не указан — по ФИО
+    data = store
+    mask = _fio_fallback_mask(
+        data, None, "язык", lambda l: bool(l) and l != "неизвестно", accepts, guess_language_by_fio,
+    )
+    return data.rows(np.flatnonzero(mask))
 
 # --------- Расширенная функция фильтрации -------------------------
 # Теперь параметры type / gender / language / source могут быть списками,
 # чтобы поддерживать выбор нескольких значений одного поля
 # (?type=single&type=frequent).
 
+def _amount_in_range(value, amount_from: float | None, amount_to: float | None) -> bool:
+    try:
+        amount = float(value) if value is not None else None
+        # Проверяем на inf, -inf, NaN
+        if amount is not None and not (amount == amount and -1e308 <= amount <= 1e308):
+            amount = None
+    except Exception:
+        amount = None
+    if amount is None:
+        return False
+    if amount_from is not None and amount < amount_from:
+        return False
+    if amount_to is not None and amount > amount_to:
+        return False
+    return True
+
+def _row_languages(l) -> list[str]:
+    """Языки строки: поле язык может быть списком или строкой через запятую."""
+    if not l:
+        l = "неизвестно"
+    if isinstance(l, list):
+        return [str(lang).strip().lower() if lang else "неизвестно" for lang in l]
+    l_str = str(l).strip().lower() if l else "неизвестно"
+    if "," in l_str:
+        # Разделяем по запятой и убираем пробелы
+        return [lang.strip() for lang in l_str.split(",")]
+    return [l_str]
+
+def _languages_match(l, accepted: set) -> bool:
+    languages = _row_languages(l)
+    # Если выбрано несколько языков — точное совпадение набора
+    # ("русский, английский" и "английский, русский" считаются одинаковыми)
+    if len(accepted) > 1:
+        return sorted(languages) == sorted(accepted)
+    # Если выбран только один язык, проверяем его наличие
+    for l_norm in languages:
+        if "другой" in accepted and l_norm not in ("казахский", "русский", "английский", "неизвестно"):
+            return True
+        if l_norm in accepted:
+            return True
+    return False
+
 def apply_filters(
-    data: list[dict],
+    data: ExcelStore,
     type: list[str] | None = None,
     date_from: str | None = None,
     date_to: str | None = None,
@@ -416,38 +535,26 @@ def apply_filters(
     language: list[str] | None = None,
     source: list[str] | None = None,
 ) -> list[dict]:
-    filtered = data
+    """Строки хранилища под фильтры. Каждый фильтр — маска по кодам значений
+    (условие считается раз на значение), порядок строк как у прежнего
+    последовательного прохода."""
+    positions = np.arange(len(data))
 
     # 2. Фильтр по источнику (можно несколько значений)
     if source:
         source_set = {s.strip().lower() for s in source}
-        filtered = [row for row in filtered if str(row.get("источник", "")).strip().lower() in source_set]
+        positions = positions[data.mask(
+            "источник", positions, lambda value: str(value).strip().lower() in source_set, default="",
+        )]
 
     # 3. Фильтр по типу донаций (single/periodic/frequent) — список значений
     if type:
-        from collections import defaultdict
         accepted = {t.strip().lower() for t in type}
         valid = {"single", "periodic", "frequent"}
         if not accepted <= valid:
             raise HTTPException(status_code=400, detail="Unsupported type value")
-
-        counter = defaultdict(list)
-        for row in filtered:
-            key = row.get("ФИО") or row.get("E-mail")  # группируем по ФИО/Email
-            if key:
-                counter[key].append(row)
-
-        temp = []
-        for rows in counter.values():
-            cnt = len(rows)
-            cls = (
-                "single"   if cnt == 1 else
-                "periodic" if 2 <= cnt <= 4 else
-                "frequent"
-            )
-            if cls in accepted:
-                temp.extend(rows)
-        filtered = temp
+        # Группируем по ФИО/Email; без фильтра по источнику группы ведёт хранилище
+        positions = _positions_by_type(data, None if len(positions) == len(data) else positions, accepted, GROUPED_FIELDS)
 
     # 4. Фильтр по периоду (дата)
     if date_from and date_to:
@@ -455,35 +562,13 @@ def apply_filters(
             dt_from = parse_date_safe(date_from)
             dt_to = parse_date_safe(date_to)
             if dt_from and dt_to:
-                temp = []
-                for row in filtered:
-                    date_val = row.get("Дата")
-                    if date_val:
-                        dt = parse_date_safe(date_val)
-                        if dt and dt_from <= dt <= dt_to:
-                            temp.append(row)
-                filtered = temp
+                positions = positions[_date_mask(data, positions, dt_from, dt_to)]
         except Exception:
             pass
 
     # 5. Фильтр по сумме (Сумма)
     if amount_from is not None or amount_to is not None:
-        temp = []
-        for row in filtered:
-            try:
-                amount = float(row.get("Сумма")) if row.get("Сумма") is not None else None
-                # Проверяем на inf, -inf, NaN
-                if amount is not None and not (amount == amount and -1e308 <= amount <= 1e308):
-                    amount = None
-            except Exception:
-                amount = None
-            if amount is not None:
-                if amount_from is not None and amount < amount_from:
-                    continue
-                if amount_to is not None and amount > amount_to:
-                    continue
-                temp.append(row)
-        filtered = temp
+        positions = positions[data.mask("Сумма", positions, lambda value: _amount_in_range(value, amount_from, amount_to))]
 
     # 6. Фильтр по полу (может быть несколько значений)
     if gender:
@@ -498,16 +583,7 @@ def apply_filters(
             "female": "женщина",
         }
         accepted = {gender_map_single.get(g.strip().lower(), g.strip().lower()) for g in accepted_raw}
-        temp = []
-        for row in filtered:
-            g = row.get("gender")
-            if not g:
-                fio = row.get("ФИО")
-                g = guess_gender_by_fio(fio)
-            g_norm = g.strip().lower() if g else "неизвестно"
-            if g_norm in accepted:
-                temp.append(row)
-        filtered = temp
+        positions = positions[_fio_fallback_mask(data, positions, "gender", bool, lambda g: g in accepted, guess_gender_by_fio)]
 
     # 7. Фильтр по языку (список значений)
     if language:
@@ -531,78 +607,13 @@ def apply_filters(
             }
             accepted_raw = language
             accepted = {lang_map_single.get(l.strip().lower(), l.strip().lower()) for l in accepted_raw}
-            print(f"DEBUG: Принятые языки для фильтрации: {accepted}")
-
-            temp = []
-            for row in filtered:
-                l = row.get("язык")
-                if not l:
-                    l = "неизвестно"
-                
-                # Обработка случая, когда язык может быть списком или строкой
-                if isinstance(l, list):
-                    # Если язык - это список, проверяем каждый элемент
-                    languages = [str(lang).strip().lower() if lang else "неизвестно" for lang in l]
-                else:
-                    # Если язык - это строка, проверяем на наличие запятых (несколько языков)
-                    l_str = str(l).strip().lower() if l else "неизвестно"
-                    if "," in l_str:
-                        # Разделяем по запятой и убираем пробелы
-                        languages = [lang.strip() for lang in l_str.split(",")]
-                    else:
-                        languages = [l_str]
-                
-                # Отладочная информация
-                print(f"DEBUG: Запись {row.get('ФИО', 'Unknown')} - исходный язык: '{l}', обработанные языки: {languages}, принятые: {accepted}")
-                
-                # Отладочная информация для первых нескольких записей
-                if len(temp) < 5:  # Показываем только для первых 5 записей
-                    print(f"DEBUG: Запись {row.get('ФИО', 'Unknown')} - исходный язык: '{l}', обработанные языки: {languages}")
-                
-                # Проверяем, есть ли хотя бы один язык в принятых
-                should_add = False
-                
-                # Если выбраны конкретные языки, проверяем точное совпадение
-                if len(accepted) > 1:
-                    # Сортируем языки для сравнения (чтобы "русский, английский" и "английский, русский" считались одинаковыми)
-                    sorted_languages = sorted(languages)
-                    sorted_accepted = sorted(accepted)
-                    
-                    # Проверяем точное совпадение списков языков
-                    if sorted_languages == sorted_accepted:
-                        should_add = True
-                else:
-                    # Если выбран только один язык, проверяем его наличие
-                    for l_norm in languages:
-                        if "другой" in accepted:
-                            if l_norm not in ("казахский", "русский", "английский", "неизвестно"):
-                                should_add = True
-                                break
-                        if l_norm in accepted:
-                            should_add = True
-                            break
-                
-                if should_add:
-                    temp.append(row)
-            filtered = temp
-
-    # Очищаем числовые значения от inf, -inf, NaN перед возвратом
-    cleaned_filtered = []
-    for row in filtered:
-        cleaned_row = {}
-        for key, value in row.items():
-            if isinstance(value, (int, float)):
-                if value == value and -1e308 <= value <= 1e308:  # Проверяем на inf, -inf, NaN
-                    cleaned_row[key] = value
-                else:
-                    cleaned_row[key] = None
-            else:
-                cleaned_row[key] = value
-        cleaned_filtered.append(cleaned_row)
+            logger.debug("Принятые языки для фильтрации: %s", accepted)
+            positions = positions[data.mask("язык", positions, lambda l: _languages_match(l, accepted))]
 
-    return cleaned_filtered 
+    # inf/NaN не чистим: FastJSONResponse отдаёт их как null, выгрузки — пустыми
+    return data.rows(positions)
 
-@router.get("/filter_users_excel_2025", tags=["Excel"])
+@router.get("/filter_users_excel_2025", tags=["Excel"], response_class=FastJSONResponse)
 def filter_users_excel_2025(
     type: list[str] | None = Query(None, description="Тип(ы) донаций: single/periodic/frequent"),
     date_from: str | None = Query(None, description="Начальная дата DD.MM.YYYY"),
@@ -613,16 +624,14 @@ def filter_users_excel_2025(
     language: list[str] | None = Query(None, description="Язык(и): казахский/русский/английский/другой"),
     source: list[str] | None = Query(None, description="Источник(и)"),
 ):
-    return apply_filters(
-        all_users_data,
-        type,
-        date_from,
-        date_to,
-        amount_from,
-        amount_to,
-        gender,
-        language,
-        source,
+    params = dict(
+        type=type, date_from=date_from, date_to=date_to, amount_from=amount_from, amount_to=amount_to,
+        gender=gender, language=language, source=source,
+    )
+    # Повторные запросы дашбордов отдаются из кэша до следующего изменения данных
+    return response_cache.cached_json(
+        response_cache.EXCEL_2025, "filter_users", params,
+        lambda response: apply_filters(store, **params),
     )
 
 @router.get("/export_users_excel_2025", tags=["Excel"])
@@ -635,9 +644,10 @@ def export_users_excel_2025(
     gender: list[str] | None = Query(None),
     language: list[str] | None = Query(None),
     source: list[str] | None = Query(None),
+    format: str = Query("xlsx", pattern=FORMAT_PATTERN, description="xlsx, csv, parquet или arrow"),
 ):
     rows = apply_filters(
-        all_users_data,
+        store,
         type,
         date_from,
         date_to,
@@ -651,31 +661,22 @@ def export_users_excel_2025(
     if not rows:
         raise HTTPException(404, "Нет данных под выбранные фильтры")
 
-    df = pd.DataFrame(rows)
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
-    buffer.seek(0)
-
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=filtered_users.xlsx"}
-    )
+    # Файл пишется потоком, без промежуточного DataFrame и буфера
+    return export_response(format, collect_schema(rows), rows, "filtered_users")
 
 @router.post("/add_user_excel_2025", tags=["Excel"])
 def add_user_excel_2025(user: dict = Body(...)):
-    global all_users_data
-    # Корректно формируем id
-    next_id = len(all_users_data) + 1 if all_users_data else 1
     user = dict(user)
-    user["id"] = next_id
-    # Добавляем телефон и язык, даже если их нет
-    if "телефон" not in user:
-        user["телефон"] = None
-    if "язык" not in user:
-        user["язык"] = None
-    all_users_data.append(user)
+    with _writing() as draft:
+        # Корректно формируем id (после всех когда-либо выданных)
+        user["id"] = draft.last_id + 1
+        # Добавляем телефон и язык, даже если их нет
+        if "телефон" not in user:
+            user["телефон"] = None
+        if "язык" not in user:
+            user["язык"] = None
+        draft.append([user])
+    response_cache.bump(response_cache.EXCEL_2025)
     return user 
 
 @router.put("/update_user_excel_2025", tags=["Excel"])
@@ -683,46 +684,38 @@ def update_user_excel_2025(
     id: int = Body(..., description="ID пользователя"),
     updates: dict = Body(..., description="Поля для обновления")
 ):
-    for user in all_users_data:
-        if user.get("id") == id:
-            user.update(updates)
-            return {"success": True, "user": user}
-    raise HTTPException(status_code=404, detail="User not found") 
+    with _writing() as draft:
+        positions = draft.positions("id", id)[:1].tolist()
+        for position in positions:
+            draft.update(position, updates)
+            user = draft.row(position)
+    if not positions:
+        raise HTTPException(status_code=404, detail="User not found")
+    response_cache.bump(response_cache.EXCEL_2025)
+    return {"success": True, "user": user}
 
 @router.get("/list_uploaded_istochniks", tags=["Excel"])
 def list_uploaded_istochniks():
-    # Группируем по названию файла
-    filename_counts = {}
-    for row in all_users_data:
-        filename = row.get("filename")
-        if filename:
-            if filename not in filename_counts:
-                filename_counts[filename] = {
-                    "count": 0,
-                    "источник": row.get("источник", "Неизвестно")
-                }
-            filename_counts[filename]["count"] += 1
-    
-    result = []
-    for filename, data in filename_counts.items():
-        result.append({
-            "filename": filename,
-            "источник": data["источник"],
-            "count": data["count"]
-        })
-    return result
+    # Счётчики по файлам ведёт хранилище (excel_store.key_groups); строки собираются только первые в файле
+    data = store
+    groups = data.key_groups(("filename",))
+    order = groups.order()
+    return [
+        {"filename": row["filename"], "источник": row.get("источник", "Неизвестно"), "count": int(count)}
+        for row, count in zip(data.rows(groups.first[order]), groups.counts[order])
+    ]
 
 @router.post("/delete_by_istochnik", tags=["Excel"])
 def delete_by_istochnik(filename: str = Body(..., embed=True)):
-    global all_users_data
-    before = len(all_users_data)
-    all_users_data = [row for row in all_users_data if row.get("filename") != filename]
-    after = len(all_users_data)
-    return {"deleted": before - after}
+    with _writing() as draft:
+        deleted = draft.keep(draft.mask("filename", None, lambda value: value != filename))
+    response_cache.bump(response_cache.EXCEL_2025)
+    return {"deleted": deleted}
 
 @router.post("/reset_all_excel_2025", tags=["Excel"])
 def reset_all_excel_2025():
-    global all_users_data
-    deleted = len(all_users_data)
-    all_users_data = []
-    return {"deleted": deleted} 
\ No newline at end of file
+    with _writing() as draft:
+        deleted = len(draft)
+        draft.clear()
+    response_cache.bump(response_cache.EXCEL_2025)
+    return {"deleted": deleted} 
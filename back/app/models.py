@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, String, JSON, func
 from .database import Base
 
 
@@ -24,18 +24,129 @@ class CRMEntry(Base):
     data = Column(JSON)
     source = Column(String, default="import")
     filename = Column(String, nullable=True)  # Название загруженного файла
+    file_hash = Column(String, nullable=True, index=True)  # SHA-256 загруженного файла
+    row_key = Column(String, nullable=True, index=True, unique=True)  # Стабильный ключ строки для повторного импорта
+    # Загруженный файл (import_batches): удаление файла идёт по этому индексу
+    batch_id = Column(Integer, ForeignKey("import_batches.id"), nullable=True, index=True)
+    # Поля, извлечённые из data при импорте (см. crm_fields.extract_typed_fields)
+    payment_date = Column(DateTime, nullable=True, index=True)
+    year = Column(Integer, nullable=True, index=True)
+    month = Column(Integer, nullable=True, index=True)  # 1-12
+    amount = Column(Float, nullable=True, index=True)
+    iin = Column(String, nullable=True, index=True)
+    normalized_fio = Column(String, nullable=True, index=True)
+    email = Column(String, nullable=True, index=True)
+    phone = Column(String, nullable=True, index=True)  # Только цифры
+    gender = Column(String, nullable=True, index=True)
+    language = Column(String, nullable=True, index=True)
+    donor_key = Column(String, nullable=True, index=True)  # Ключ группировки донора (crm_fields.donor_key)
+
+
+# Фильтр /crm/filter сравнивает источник без учёта регистра и пробелов
+Index("ix_crm_entries_source_norm", func.lower(func.trim(CRMEntry.source)))
+
+
+class DonorKey(Base):
+    """Индекс донора: нормализованные ИИН/ФИО/e-mail/телефон -> строка CRM (см. donor_index)."""
+    __tablename__ = "donor_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entry_id = Column(Integer, ForeignKey("crm_entries.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # candidate, iin, fio, email, phone
+    token = Column(String, nullable=False, index=True)
+
+
+Index("ix_donor_keys_kind_token", DonorKey.kind, DonorKey.token)
+
+
+class DonorSummary(Base):
+    """Сводка по донору (donor_key): число платежей, суммы, даты и тип (см. donor_summary)."""
+    __tablename__ = "donor_summary"
+
+    donor_key = Column(String, primary_key=True)
+    donations = Column(Integer, nullable=False)
+    total_amount = Column(Float, nullable=False, default=0)
+    amount_count = Column(Integer, nullable=False, default=0)  # Платежей с суммой
+    average_amount = Column(Float, nullable=False, default=0)
+    first_date = Column(DateTime, nullable=True)
+    last_date = Column(DateTime, nullable=True)
+    first_entry_id = Column(Integer, nullable=False, index=True)  # Порядок доноров в выдаче
+    donor_type = Column(String, nullable=False, index=True)  # single, periodic, frequent
+    sources = Column(JSON)
+
+
+class ImportBatch(Base):
+    """Загруженный файл CRM: источник, число строк, время и хэш импорта (см. import_batches)."""
+    __tablename__ = "import_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String, nullable=False, unique=True)
+    source = Column(String, nullable=True)  # Источник первой строки файла
+    row_count = Column(Integer, nullable=False, default=0)
+    first_entry_id = Column(Integer, nullable=False, index=True)  # Порядок файлов в списке
+    file_hash = Column(String, nullable=True)  # SHA-256 последней загруженной версии
+    imported_at = Column(DateTime, nullable=True)
 
 
 class ExcelUser(Base):
+    """Строка Excel 2025 в режиме EXCEL_STORE_BACKEND=db (см. excel_db).
+
+    Строка целиком, с произвольными колонками файла, лежит в data; ключевые
+    поля продублированы колонками для индексов.
+    """
     __tablename__ = "excel_users"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)  # Порядок строк
     email = Column(String, index=True)
     month = Column(String)
     date = Column(String)  # Можно заменить на DateTime, если нужно строгое хранение даты
-    fio = Column(String)
-    summa = Column(Integer)
+    fio = Column(String, index=True)
+    summa = Column(Float)
     payment_id = Column(String, nullable=True)
     phone = Column(String, nullable=True)
     language = Column(String, nullable=True)
-    source = Column(String)
+    source = Column(String, index=True)
+    row_id = Column(Integer, nullable=True, index=True)  # Поле "id" строки в API
+    filename = Column(String, nullable=True, index=True)
+    gender = Column(String, nullable=True)
+    data = Column(JSON)
+    version = Column(Integer, nullable=False, default=0, index=True)  # Версия набора, в которой строка записана
+
+
+class ExcelStoreState(Base):
+    """Версия данных Excel 2025 в БД: воркеры сверяют с ней свой кэш (см. excel_db)."""
+    __tablename__ = "excel_store_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # Растёт при каждом изменении
+    epoch = Column(Integer, nullable=False, default=0)  # Растёт при удалении строк: кэш перечитывается целиком
+    last_id = Column(Integer, nullable=False, default=0)  # Последний выданный id строки, не уменьшается
+
+
+class DatasetVersion(Base):
+    """Версия набора данных для кэша ответов, общая для всех воркеров (см. response_cache)."""
+    __tablename__ = "dataset_versions"
+
+    name = Column(String, primary_key=True)  # "crm"
+    version = Column(Integer, nullable=False, default=0)  # Растёт после каждого коммита изменений набора
+
+
+class ImportJobRecord(Base):
+    """Фоновая загрузка Excel: состояние и прогресс, общие для всех воркеров (см. import_jobs)."""
+    __tablename__ = "import_jobs"
+
+    id = Column(String, primary_key=True)  # uuid4().hex
+    kind = Column(String, nullable=False)  # crm, excel_2025
+    state = Column(String, nullable=False, index=True)  # queued, parsing, writing, done, error
+    filenames = Column(JSON)
+    sheets = Column(JSON)  # [{'filename', 'sheet', 'rows'}]
+    rows_parsed = Column(Integer, nullable=False, default=0)
+    rows_written = Column(Integer, nullable=False, default=0)
+    counts = Column(JSON)
+    result = Column(JSON, nullable=True)
+    errors = Column(JSON)
+    # Время — секунды Unix, как в ответе /import_jobs
+    created_at = Column(Float, nullable=False, index=True)
+    started_at = Column(Float, nullable=True)
+    finished_at = Column(Float, nullable=True)
+    updated_at = Column(Float, nullable=False)  # Последний признак жизни задачи
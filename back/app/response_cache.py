@@ -0,0 +1,209 @@
+"""Кэш ответов списков и фильтров с версией набора данных.
+
+Ключ — эндпоинт, нормализованные параметры запроса и текущая версия
+набора данных ("crm" или "excel_2025"). Эндпоинты, меняющие данные,
+вызывают bump(): версия растёт, и ответы прежней версии удаляются. Хранится готовое тело JSON, размер кэша
+ограничен числом записей и суммарным объёмом, вытеснение — LRU.
+
+Кэш свой у каждого воркера uvicorn. Версия CRM (данные в общей БД) лежит
+в таблице dataset_versions: bump() поднимает её после коммита, а перед
+поиском в кэше воркер читает её из БД — так изменение, сделанное одним
+воркером, сбрасывает кэш CRM у всех. Версия Excel 2025 — счётчик в памяти
+процесса: в режиме БД её поднимает merge_excel.sync_store(), когда кэш
+строк воркера догоняет БД. RESPONSE_CACHE_MAX_BYTES=0 выключает кэш.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from fastapi import APIRouter, Response
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .database import SessionLocal
+from .fast_json import FastJSONResponse
+from .models import DatasetVersion
+
+router = APIRouter()
+
+CRM = "crm"
+EXCEL_2025 = "excel_2025"
+# Наборы, версия которых общая для воркеров (dataset_versions)
+SHARED_DATASETS = {CRM}
+_dataset_versions = DatasetVersion.__table__
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+# Заголовки ответа, которые сохраняются вместе с телом (курсор страницы)
+_SKIPPED_HEADERS = {"content-length", "content-type"}
+
+
+class ResponseCache:
+    """LRU по числу записей и байтам тела; счётчики попаданий и промахов."""
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[bytes, dict]] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, dataset: str) -> int:
+        return self._versions.get(dataset, 0)
+
+    def bump(self, dataset: str):
+        with self._lock:
+            self._set_version(dataset, self.version(dataset) + 1)
+
+    def observe(self, dataset: str, version: int):
+        """Версия набора из БД: если её поднял другой воркер, ответы прежней версии удаляются."""
+        with self._lock:
+            if version > self.version(dataset):
+                self._set_version(dataset, version)
+
+    def _set_version(self, dataset: str, version: int):
+        self._versions[dataset] = version
+        # Ответы старой версии уже не найдутся — освобождаем память сразу
+        for key in [key for key in self._entries if key[0] == dataset]:
+            self._drop(key)
+
+    def _drop(self, key: tuple):
+        body, _ = self._entries.pop(key)
+        self.size -= len(body)
+
+    def get(self, key: tuple):
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached
+
+    def put(self, key: tuple, body: bytes, headers: dict):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key[1] != self.version(key[0]):
+                # Данные изменились, пока считался ответ
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (body, headers)
+            self.size += len(body)
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.max_bytes > 0,
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "versions": dict(self._versions),
+            }
+
+
+_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def bump(dataset: str):
+    """Отмечает изменение набора данных (после коммита/изменения в памяти)."""
+    if dataset in SHARED_DATASETS:
+        _cache.observe(dataset, _bump_shared(dataset))
+    else:
+        _cache.bump(dataset)
+
+
+def _shared_version(dataset: str) -> int:
+    with SessionLocal() as db:
+        version = db.execute(
+            select(_dataset_versions.c.version).where(_dataset_versions.c.name == dataset)
+        ).scalar()
+    return version or 0
+
+
+def _bump_shared(dataset: str) -> int:
+    """Поднимает версию набора в dataset_versions и возвращает новую."""
+    with SessionLocal() as db:
+        statement = (
+            update(_dataset_versions).where(_dataset_versions.c.name == dataset)
+            .values(version=_dataset_versions.c.version + 1)
+            .returning(_dataset_versions.c.version)
+        )
+        version = db.execute(statement).scalar()
+        if version is None:
+            try:
+                db.execute(insert(_dataset_versions).values(name=dataset, version=1))
+                version = 1
+            except IntegrityError:
+                # Строку одновременно создал другой воркер
+                db.rollback()
+                version = db.execute(statement).scalar()
+        db.commit()
+    return version
+
+
+def _current_version(dataset: str) -> int:
+    if dataset not in SHARED_DATASETS:
+        return _cache.version(dataset)
+    version = _shared_version(dataset)
+    _cache.observe(dataset, version)
+    return version
+
+
+def _normalize(params: dict) -> tuple:
+    # Порядок параметров и значений в списках на результат фильтров не влияет
+    return tuple(sorted(
+        (name, tuple(sorted(map(str, value))) if isinstance(value, (list, tuple, set)) else value)
+        for name, value in params.items()
+        if value is not None
+    ))
+
+
+def cached_json(dataset: str, endpoint: str, params: dict, compute: Callable[[Response], Any]) -> Response:
+    """JSON-ответ compute(response) из кэша или посчитанный и сохранённый.
+
+    compute может выставлять заголовки в переданный ему response — они
+    сохраняются вместе с телом.
+    """
+    if _cache.max_bytes <= 0:
+        scratch = Response()
+        return _json(compute(scratch), _headers(scratch))
+    key = (dataset, _current_version(dataset), endpoint, _normalize(params))
+    cached = _cache.get(key)
+    if cached is not None:
+        body, headers = cached
+        return Response(content=body, media_type="application/json", headers=headers)
+    scratch = Response()
+    response = _json(compute(scratch), _headers(scratch))
+    _cache.put(key, bytes(response.body), _headers(scratch))
+    return response
+
+
+def _headers(response: Response) -> dict:
+    return {name: value for name, value in response.headers.items() if name not in _SKIPPED_HEADERS}
+
+
+def _json(content, headers: dict) -> FastJSONResponse:
+    return FastJSONResponse(content, headers=headers)
+
+
+@router.get("/cache/stats", tags=["Cache"])
+def cache_stats():
+    """Заполненность кэша ответов, попадания/промахи и версии наборов данных."""
+    return _cache.stats()
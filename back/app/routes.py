@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Response
 from sqlalchemy.orm import Session
-from . import models, schemas, database, auth
+from . import models, schemas, database, auth, response_cache
 from fastapi.responses import JSONResponse
 import os
 import shutil
@@ -10,6 +10,8 @@ import io
 import traceback
 from datetime import datetime
 from .models import ExcelUser
+from .crm_listing import MAX_PAGE_SIZE, SORT_PATTERN, STREAM_PATTERN, list_entries
+from .fast_json import FastJSONResponse
 
 router = APIRouter()
 
@@ -57,10 +59,25 @@ def get_users(db: Session = Depends(database.get_db)):
     return db.query(models.User).all()
 
 
-@router.get("/crm")
-def get_crm(db: Session = Depends(database.get_db)):
-    entries = db.query(models.CRMEntry).all()
-    return [entry.data for entry in entries]
+@router.get("/crm", response_class=FastJSONResponse)
+def get_crm(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None, pattern=SORT_PATTERN),
+    stream: Optional[str] = Query(None, pattern=STREAM_PATTERN),
+    db: Session = Depends(database.get_db),
+):
+    def page(page_response, stream=None):
+        return list_entries(
+            db, page_response, lambda session: session.query(models.CRMEntry), lambda entry: entry.data,
+            limit=limit, after=after, sort=sort, stream=stream,
+        )
+    if stream:
+        return page(response, stream)
+    return response_cache.cached_json(
+        response_cache.CRM, "crm", dict(limit=limit, after=after, sort=sort), page,
+    )
 
 
 # ========================= Профиль пользователя =========================
@@ -9,39 +9,36 @@ import logging
 import datetime
 import math
 from .schemas import ManualCRMEntryCreate
+from .crm_bulk import IMPORT_MODES, import_entries, imported_file_rows, truncate_entries
+from .excel_reader import remove_spooled, spool_upload_hashed
+from .import_keys import RowKeyer
+from .crm_fields import extract_typed_fields
+from . import donor_index, donor_summary, import_batches, response_cache
+from .excel_parallel import iter_spooled_records, parse_workbooks
+from .excel_manifest import cached_sheet_names
+from .import_jobs import ImportJob, ensure_capacity, start_import_job
+from starlette.concurrency import run_in_threadpool
 
 logging.basicConfig(level=logging.INFO)
 
 router = APIRouter()
 
 
-def get_month_from_date_string(date_str):
-    if not date_str or pd.isnull(date_str):
-        return None
-    try:
-        date_str = str(date_str).strip()
-        if date_str.lower() in ['nan', 'nat', 'none', '']:
-            return None
-        parsed_date = pd.to_datetime(date_str, errors='coerce', dayfirst=True)
-        return parsed_date.month if pd.notnull(parsed_date) else None
-    except:
-        return None
-
 
 def extract_months_from_excels(files, month_names):
     """Возвращает множество месяцев (имена листов, совпадающие с месяцами) из списка UploadFile."""
-    import io
-    import pandas as pd
     found_months = set()
     for file in files:
-        if hasattr(file, 'read') and callable(file.read):
-            # FastAPI UploadFile (async)
-            content = file.file.read() if hasattr(file.file, 'read') else file.read()
+        if hasattr(file, 'file'):
+            # FastAPI UploadFile
+            fileobj = file.file
+        elif hasattr(file, 'read') and callable(file.read):
+            fileobj = file
         else:
             # bytes-like
-            content = file
-        excel = pd.ExcelFile(io.BytesIO(content))
-        for sheet_name in excel.sheet_names:
+            fileobj = io.BytesIO(file)
+        # Читаем только манифест книги, данные листов не загружаются
+        for sheet_name in cached_sheet_names(fileobj):
             if sheet_name in month_names:
                 found_months.add(sheet_name)
     return found_months
@@ -64,70 +61,68 @@ def convert_timestamps(obj):
         return obj
 
 
-@router.post("/upload_excel", tags=["CRM"])
-async def upload_excel(
-    files: list[UploadFile] = File(...),
-    source: str = Form(None)
-):
-    all_entries = []
-    month_names = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
-                   'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
-    for file in files:
-        try:
-            content = await file.read()
-            excel = pd.ExcelFile(io.BytesIO(content))
-            # Сохраняем оригинальное название файла
-            original_filename = file.filename
-            
-            for sheet_name in excel.sheet_names:
-                df = pd.read_excel(excel, sheet_name=sheet_name)
-                for _, row in df.iterrows():
-                    row_data = row.to_dict()
-                    # Удаляем все варианты ключа 'month' или 'месяц'
-                    for key in list(row_data.keys()):
-                        if key.strip().lower() in ['month', 'месяц']:
-                            del row_data[key]
-                    # Добавляем определение месяца
-                    if sheet_name in month_names:
-                        row_data['month'] = sheet_name
-                    else:
-                        # Пробуем взять месяц из поля "Дата" или "Дата и время"
-                        date_field = None
-                        for k in row_data:
-                            if k.strip().lower() in ['дата', 'дата и время', 'date', 'datetime']:
-                                date_field = row_data[k]
-                                break
-                        month_num = get_month_from_date_string(date_field)
-                        row_data['month'] = month_names[month_num - 1] if month_num and 1 <= month_num <= 12 else None
-
-                    if row_data['month'] is not None:
-                        row_data = convert_timestamps(row_data)
-                        entry_dict = {'data': row_data}
-                        # Используем пользовательский источник, если указан, иначе название файла
-                        if source and source.strip():
-                            entry_dict['source'] = source
-                        else:
-                            entry_dict['source'] = original_filename.replace('.xlsx', '').replace('.xls', '')
-                        # Сохраняем оригинальное название файла
-                        entry_dict['filename'] = original_filename
-                        all_entries.append(entry_dict)
-        except Exception as e:
-            return {"status": "error", "error": str(e)}
-
-    if not all_entries:
-        return {"status": "no_valid_data"}
+def entry_source_for(filename, source):
+    """Пользовательский источник, если указан, иначе название файла без расширения."""
+    if source and source.strip():
+        return source
+    return filename.replace('.xlsx', '').replace('.xls', '')
+
+
+def iter_crm_entries(parsed_sheets, source, file_hashes):
+    """Поток записей для CRMEntry из разобранных листов (см. excel_parallel).
+
+    Записи читаются из временных файлов кусками, поэтому загрузка целиком
+    в памяти не держится. Каждой строке назначается стабильный row_key.
+    """
+    keyers = {}
+    for sheet in parsed_sheets:
+        original_filename = sheet.filename
+        entry_source = entry_source_for(original_filename, source)
+        # Повторы строк нумеруются в пределах файла, хэш-ключи привязаны к его имени
+        row_key = keyers.setdefault(sheet.file_index, RowKeyer(original_filename))
+
+        for row_data in iter_spooled_records(sheet):
+            yield {
+                'data': row_data,
+                'source': entry_source,
+                # Сохраняем оригинальное название файла
+                'filename': original_filename,
+                'file_hash': file_hashes[sheet.file_index],
+                'row_key': row_key(row_data),
+                # Дата, сумма, ИИН и т.п. разбираются один раз здесь, а не на каждом запросе
+                **extract_typed_fields(row_data),
+            }
+
+
+def find_imported_files(uploads, source):
+    """Индексы файлов, которые уже импортированы целиком, и число их строк."""
+    db: Session = SessionLocal()
+    try:
+        imported = {}
+        for index, (filename, _, file_hash) in enumerate(uploads):
+            rows = imported_file_rows(db, file_hash, entry_source_for(filename, source), filename)
+            if rows:
+                imported[index] = rows
+        return imported
+    finally:
+        db.close()
+
 
+def save_crm_entries(parsed_sheets, source, file_hashes, mode, skipped=0, on_batch=None):
+    """Пишет разобранные листы в crm_entries одной транзакцией (блокирующий вызов)."""
     db: Session = SessionLocal()
     try:
-        for entry in all_entries:
-            db_entry = CRMEntry(
-                data=entry['data'], 
-                source=entry['source'],
-                filename=entry['filename']
-            )
-            db.add(db_entry)
+        # Строки пишутся пачками по мере чтения листов
+        counts = import_entries(
+            db, iter_crm_entries(parsed_sheets, source, file_hashes), mode=mode, on_batch=on_batch
+        )
+        counts["skipped"] += skipped
+        if not any(counts.values()):
+            db.rollback()
+            return {"status": "no_valid_data"}
         db.commit()
-        return {"status": "success", "saved": len(all_entries)}
+        response_cache.bump(response_cache.CRM)
+        return {"status": "success", "saved": counts["inserted"] + counts["updated"], **counts}
     except Exception as e:
         db.rollback()
         return {"status": "error", "error": str(e)}
@@ -135,26 +130,87 @@ async def upload_excel(
         db.close()
 
 
+async def run_crm_import(uploads, source, mode, job: ImportJob | None = None):
+    """Импорт сохранённых во временные файлы загрузок (filename, path, hash) в crm_entries.
+
+    Временные файлы удаляются по завершении. job — фоновая задача, в которую
+    пишется прогресс по листам и пачкам.
+    """
+    parsed = []
+    try:
+        # Файлы, уже загруженные ранее без изменений, не разбираем вовсе
+        imported = await run_in_threadpool(find_imported_files, uploads, source)
+        to_parse = [(filename, path) for index, (filename, path, _) in enumerate(uploads) if index not in imported]
+        file_hashes = [file_hash for index, (_, _, file_hash) in enumerate(uploads) if index not in imported]
+        # Листы разбираются параллельно в пуле процессов, event loop свободен
+        parsed = await parse_workbooks(to_parse, on_sheet=job.sheet_parsed if job else None)
+        if job:
+            job.writing()
+        # Запись в БД блокирующая — выполняем в потоке
+        return await run_in_threadpool(
+            save_crm_entries, parsed, source, file_hashes, mode, sum(imported.values()),
+            job.batch_written if job else None,
+        )
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+    finally:
+        remove_spooled(path for _, path, _ in uploads)
+        remove_spooled(sheet.spool_path for sheet in parsed)
+
+
+@router.post("/upload_excel", tags=["CRM"])
+async def upload_excel(
+    files: list[UploadFile] = File(...),
+    source: str = Form(None),
+    mode: str = Form("upsert", description="Повторный импорт: upsert — обновить изменённые строки, skip — пропустить"),
+    background: bool = Form(False, description="Вернуть id задачи сразу, прогресс — в /import_jobs/{id}"),
+):
+    if mode not in IMPORT_MODES:
+        return {"status": "error", "error": f"Unsupported mode: {mode}"}
+    if background:
+        # Не принимаем файлы, если очередь задач уже заполнена
+        await run_in_threadpool(ensure_capacity)
+    uploads = []
+    try:
+        for file in files:
+            path, file_hash = await spool_upload_hashed(file)
+            uploads.append((file.filename, path, file_hash))
+    except Exception as e:
+        remove_spooled(path for _, path, _ in uploads)
+        return {"status": "error", "error": str(e)}
+
+    if not background:
+        return await run_crm_import(uploads, source, mode)
+    try:
+        job = await start_import_job(
+            "crm", [filename for filename, _, _ in uploads],
+            lambda job: run_crm_import(uploads, source, mode, job),
+        )
+    except Exception:
+        remove_spooled(path for _, path, _ in uploads)
+        raise
+    return {"status": "accepted", "job_id": job.id}
+
+
 @router.post("/get_months_from_excel", tags=["CRM"])
 async def get_months_from_excel(files: list[UploadFile] = File(...)):
     month_names = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
                    'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
-    found_months = set()
-    for file in files:
-        content = await file.read()
-        excel = pd.ExcelFile(io.BytesIO(content))
-        for sheet_name in excel.sheet_names:
-            if sheet_name in month_names:
-                found_months.add(sheet_name)
+    # Только манифест книги (с кэшем по хэшу), в потоке — event loop не блокируется
+    found_months = await run_in_threadpool(extract_months_from_excels, files, month_names)
     return {"months": sorted(found_months, key=lambda m: month_names.index(m))}
 
 
 @router.post("/manual_crm_entry", tags=["CRM"])
 async def manual_crm_entry(entry: ManualCRMEntryCreate, db: Session = Depends(get_db)):
     try:
-        db_entry = CRMEntry(data=entry.data, source=entry.source)
+        db_entry = CRMEntry(data=entry.data, source=entry.source, **extract_typed_fields(entry.data))
         db.add(db_entry)
+        db.flush()
+        donor_index.index_entries(db, [(db_entry.id, db_entry.data)])
+        donor_summary.refresh(db, [db_entry.donor_key])
         db.commit()
+        response_cache.bump(response_cache.CRM)
         db.refresh(db_entry)
         return {"status": "success", "id": db_entry.id}
     except Exception as e:
@@ -166,20 +222,17 @@ async def manual_crm_entry(entry: ManualCRMEntryCreate, db: Session = Depends(ge
 def list_uploaded_sources():
     db = SessionLocal()
     try:
-        # Группируем по названию файла вместо источника
-        filenames = db.query(CRMEntry.filename).distinct().all()
-        result = []
-        for (filename,) in filenames:
-            if filename:  # Пропускаем записи без названия файла
-                count = db.query(CRMEntry).filter(CRMEntry.filename == filename).count()
-                # Получаем источник для этого файла (берем первый попавшийся)
-                source = db.query(CRMEntry.source).filter(CRMEntry.filename == filename).first()
-                result.append({
-                    "filename": filename,
-                    "source": source[0] if source else "Неизвестно",
-                    "count": count
-                })
-        return result
+        # Каталог файлов ведётся при импорте и удалении (import_batches) — один запрос
+        return [
+            {
+                "filename": batch.filename,
+                "source": batch.source or "Неизвестно",
+                "count": batch.row_count,
+                "imported_at": batch.imported_at.isoformat() if batch.imported_at else None,
+                "file_hash": batch.file_hash,
+            }
+            for batch in import_batches.list_batches(db)
+        ]
     finally:
         db.close()
 
@@ -187,8 +240,18 @@ def list_uploaded_sources():
 def delete_by_source(filename: str = Body(..., embed=True)):
     db = SessionLocal()
     try:
-        deleted = db.query(CRMEntry).filter(CRMEntry.filename == filename).delete()
+        batch_id = import_batches.batch_id(db, filename)
+        if batch_id is None:
+            return {"deleted": 0}
+        # Строки файла — его партия: удаление идёт по индексу batch_id
+        in_batch = CRMEntry.batch_id == batch_id
+        donor_index.unindex_where(db, in_batch)
+        donor_keys = donor_summary.keys_where(db, in_batch)
+        deleted = import_batches.delete_entries(db, batch_id)
+        donor_summary.refresh(db, donor_keys)
+        import_batches.refresh(db, [batch_id])
         db.commit()
+        response_cache.bump(response_cache.CRM)
         return {"deleted": deleted}
     finally:
         db.close()
@@ -197,8 +260,10 @@ def delete_by_source(filename: str = Body(..., embed=True)):
 def reset_all_crm():
     db = SessionLocal()
     try:
-        deleted = db.query(CRMEntry).delete()
+        # TRUNCATE на PostgreSQL вместе с индексом, сводкой доноров и каталогом партий
+        deleted = truncate_entries(db)
         db.commit()
+        response_cache.bump(response_cache.CRM)
         return {"deleted": deleted}
     finally:
         db.close()
@@ -0,0 +1,180 @@
+"""Потоковая запись XLSX для экспортов.
+
+Книга из одного листа пишется по строкам прямо в zip-архив, а архив —
+кусками в ответ: в памяти держится только текущий кусок, первые байты
+уходят клиенту сразу. Строки листа — inline-строки (без таблицы общих
+строк), заголовок оформлен как у pandas.DataFrame.to_excel. Лист
+записывается в формате ZIP64, поэтому его размер не ограничен 2 ГиБ.
+"""
+import math
+import numbers
+import re
+import zipfile
+from datetime import date, datetime, time
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Сколько строк листа сжимать перед отправкой очередного куска
+FLUSH_ROWS = 1000
+SHEET_NAME = "Sheet1"
+
+# Стили (cellXfs): 1 — заголовок, 2 — дата и время, 3 — дата
+HEADER_STYLE, DATETIME_STYLE, DATE_STYLE = 1, 2, 3
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+# Управляющие символы недопустимы в XML (openpyxl на них падает) — вырезаем
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2"><numFmt numFmtId="164" formatCode="yyyy\\-mm\\-dd\\ hh:mm:ss"/>'
+    '<numFmt numFmtId="165" formatCode="yyyy\\-mm\\-dd"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="2"><border><left/><right/><top/><bottom/><diagonal/></border>'
+    '<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="top"/></xf>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class _Sink:
+    """Несмещаемый поток для zipfile: копит записанные байты до очередного drain()."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def column_letter(index: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA."""
+    letters = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def _text_cell(ref: str, text: str, style: int = 0) -> str:
+    text = escape(_ILLEGAL_XML.sub("", text))
+    style_attr = f' s="{style}"' if style else ""
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _serial(value: datetime) -> float:
+    return (value.replace(tzinfo=None) - EXCEL_EPOCH).total_seconds() / 86400
+
+
+def _cell(ref: str, value) -> str:
+    """XML ячейки; пустая строка — ячейку не писать (None, NaN, ±Inf, NaT)."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Integral):
+        return f'<c r="{ref}"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if not math.isfinite(value):
+            # NaN/±Inf — пустая ячейка, как null в JSON-ответах
+            return ""
+        return f'<c r="{ref}"><v>{value!r}</v></c>'
+    if isinstance(value, datetime):
+        if value != value:
+            return ""
+        return f'<c r="{ref}" s="{DATETIME_STYLE}"><v>{_serial(value)!r}</v></c>'
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="{DATE_STYLE}"><v>{_serial(datetime.combine(value, time()))!r}</v></c>'
+    return _text_cell(ref, str(value))
+
+
+def _row(row_no: int, cells: Iterable[str]) -> str:
+    return f'<row r="{row_no}">{"".join(cells)}</row>'
+
+
+def stream_xlsx(columns: list[str], rows: Iterable[dict], sheet_name: str = SHEET_NAME) -> Iterator[bytes]:
+    """Куски XLSX-файла: заголовок из columns, затем строки rows (dict)."""
+    letters = [column_letter(i) for i in range(len(columns))]
+    sink = _Sink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as book:
+        book.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        book.writestr("_rels/.rels", _ROOT_RELS)
+        book.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(sheet_name, {'"': "&quot;"})))
+        book.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        book.writestr("xl/styles.xml", _STYLES)
+        # Размер листа заранее неизвестен, а поток не перемотать назад: сразу ZIP64,
+        # иначе лист больше 2 ГиБ оборвал бы уже начатый ответ
+        with book.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as sheet:
+            header = (_text_cell(f"{letter}1", str(column), HEADER_STYLE) for letter, column in zip(letters, columns))
+            sheet.write((_SHEET_HEAD + _row(1, header)).encode("utf-8"))
+            chunk = []
+            for row_no, row in enumerate(rows, start=2):
+                chunk.append(_row(row_no, (
+                    _cell(f"{letter}{row_no}", row.get(column)) for letter, column in zip(letters, columns)
+                )))
+                if len(chunk) >= FLUSH_ROWS:
+                    sheet.write("".join(chunk).encode("utf-8"))
+                    chunk = []
+                    data = sink.drain()
+                    if data:
+                        yield data
+            chunk.append(_SHEET_TAIL)
+            sheet.write("".join(chunk).encode("utf-8"))
+    yield sink.drain()
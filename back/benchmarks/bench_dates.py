@@ -0,0 +1,97 @@
+"""Бенчмарк разбора дат: прежние разборы (dateutil, pd.to_datetime на
+значение, apply в aggregate_trends) против date_parsing.
+
+Запуск из папки back/:
+    python -m benchmarks.bench_dates [кол-во значений]
+"""
+import random
+import sys
+import time
+import warnings
+from datetime import datetime, timedelta
+
+import pandas as pd
+from dateutil.parser import parse as dateutil_parse
+
+from app import date_parsing
+from app.date_parsing import parse_date, parse_dates
+
+
+def make_column(size: int) -> pd.Series:
+    """Колонка дат выписки: пара лет, несколько форматов, пустые и мусорные значения."""
+    start = datetime(2024, 1, 1)
+    formats = ["%d.%m.%Y", "%d.%m.%Y %H:%M", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y"]
+    values = []
+    for _ in range(size):
+        roll = random.random()
+        if roll < 0.01:
+            values.append(None)
+        elif roll < 0.015:
+            values.append("не указано")
+        else:
+            moment = start + timedelta(days=random.randint(0, 730), minutes=15 * random.randint(0, 40))
+            values.append(moment.strftime(random.choice(formats)))
+    return pd.Series(values, dtype=object)
+
+
+def legacy_dateutil(value):
+    """Прежний разбор crm_fields/crm.py: dateutil на каждое значение."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = dateutil_parse(value, dayfirst=True) if "." in value or "/" in value else dateutil_parse(value)
+    except (ValueError, OverflowError):
+        return None
+    return parsed.replace(tzinfo=None)
+
+
+def legacy_trends_parse(date_str):
+    """Прежний parse_date из crm_analyzer.aggregate_trends (через .apply)."""
+    if pd.isna(date_str) or date_str == '':
+        return pd.NaT
+    try:
+        return pd.to_datetime(date_str)
+    except Exception:
+        try:
+            return pd.to_datetime(date_str, dayfirst=True)
+        except Exception:
+            return pd.NaT
+
+
+def rate(func, values) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = func(values)
+    return len(values) / (time.perf_counter() - started), result
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    random.seed(1)
+    column = make_column(size)
+    # Прежние разборы слишком медленные для полного прогона — меряем на срезе
+    sample = column.head(min(size, 20_000))
+
+    old_dateutil, expected = rate(lambda values: [legacy_dateutil(v) for v in values], sample)
+    with warnings.catch_warnings():
+        # pd.to_datetime без формата предупреждает на каждом значении
+        warnings.simplefilter("ignore")
+        old_apply, _ = rate(lambda values: values.apply(legacy_trends_parse), sample.head(5_000))
+
+    date_parsing._parse_string.cache_clear()
+    new_scalar, scalar = rate(lambda values: [parse_date(v) for v in values], column)
+    date_parsing._parse_string.cache_clear()
+    new_column, parsed = rate(parse_dates, column)
+
+    assert scalar[:len(expected)] == expected, "результаты не совпадают с dateutil"
+    assert [None if pd.isna(v) else v.to_pydatetime() for v in parsed[:len(expected)]] == expected
+
+    print(f"значений: {size}, уникальных: {column.nunique()}")
+    print(f"dateutil на значение:      {old_dateutil:>12,.0f} знач/сек")
+    print(f"apply(pd.to_datetime):     {old_apply:>12,.0f} знач/сек")
+    print(f"parse_date (кэш):          {new_scalar:>12,.0f} знач/сек (x{new_scalar / old_dateutil:.1f} к dateutil)")
+    print(f"parse_dates (колонка):     {new_column:>12,.0f} знач/сек (x{new_column / old_apply:.1f} к apply)")
+    print(f"кэш: {date_parsing.cache_info()['parse_date']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Бенчмарк фильтров Excel 2025: прежний apply_filters по списку словарей
+против колоночного ExcelStore (маски по кодам значений), память строк и
+точечный поиск строк по id/ФИО/E-mail: проход по списку против индекса,
+фильтр по типу после записи: пересчёт групп доноров против групп, которые
+ведёт хранилище.
+
+Запуск из папки back/:
+    python -m benchmarks.bench_excel_store [кол-во строк]
+"""
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+from fastapi import HTTPException
+
+from app.excel_store import ExcelStore
+from app.merge_excel import GROUPED_FIELDS, apply_filters, guess_gender_by_fio, parse_date_safe
+
+MALE = ["Иван", "Ерлан", "Дмитрий", "Асхат", "Сергей", "Нурлан"]
+FEMALE = ["Анна", "Айгерим", "Мария", "Дина", "Ольга", "Сауле"]
+SURNAMES = ["Иванов", "Ахметов", "Петров", "Садыков", "Ким", "Нурланов", "Смирнов", "Омаров"]
+SOURCES = ["Kaspi", "Halyk", "Сайт", "Наличные", "CloudPayments"]
+LANGUAGES = ["русский", "казахский", "английский", "казахский, русский", "", None, "немецкий"]
+# Ключей на один вид точечного поиска
+LOOKUPS = 20
+# Записей (по строке) перед фильтром по типу
+WRITES = 5
+
+
+def make_rows(size: int) -> list[dict]:
+    """Строки выписок: ~size/4 доноров, часть без пола/языка/E-mail."""
+    start = date(2025, 1, 1)
+    donors = []
+    for number in range(max(1, size // 4)):
+        female = random.random() < 0.5
+        surname = random.choice(SURNAMES) + ("а" if female else "")
+        first = random.choice(FEMALE if female else MALE)
+        donors.append((f"{surname} {first} {number}", f"donor{number}@mail.kz" if random.random() < 0.7 else None))
+    rows = []
+    for index in range(size):
+        fio, email = random.choice(donors)
+        day = start + timedelta(days=random.randint(0, 364))
+        source = random.choice(SOURCES)
+        rows.append({
+            "ФИО": fio,
+            "E-mail": email,
+            "Сумма": random.choice([500, 1000, 2000, 5000, 10000, None]),
+            "Дата": day.strftime("%d.%m.%Y"),
+            "Месяц": day.strftime("%Y-%m"),
+            "источник": source,
+            "filename": f"{source.lower()}_{day.month:02d}.xlsx",
+            "gender": random.choice(["мужчина", "женщина", None, None]),
+            "язык": random.choice(LANGUAGES),
+            "телефон": None,
+            "id": index + 1,
+        })
+    return rows
+
+
+def legacy_apply_filters(data, type=None, date_from=None, date_to=None, amount_from=None, amount_to=None,
+                         gender=None, language=None, source=None):
+    """Прежний apply_filters (проход по списку словарей), без отладочной печати на строку."""
+    filtered = data
+    if source:
+        source_set = {s.strip().lower() for s in source}
+        filtered = [row for row in filtered if str(row.get("источник", "")).strip().lower() in source_set]
+    if type:
+        accepted = {t.strip().lower() for t in type}
+        if not accepted <= {"single", "periodic", "frequent"}:
+            raise HTTPException(status_code=400, detail="Unsupported type value")
+        counter = defaultdict(list)
+        for row in filtered:
+            key = row.get("ФИО") or row.get("E-mail")
+            if key:
+                counter[key].append(row)
+        temp = []
+        for rows in counter.values():
+            cnt = len(rows)
+            cls = "single" if cnt == 1 else "periodic" if 2 <= cnt <= 4 else "frequent"
+            if cls in accepted:
+                temp.extend(rows)
+        filtered = temp
+    if date_from and date_to:
+        dt_from = parse_date_safe(date_from)
+        dt_to = parse_date_safe(date_to)
+        if dt_from and dt_to:
+            temp = []
+            for row in filtered:
+                date_val = row.get("Дата")
+                if date_val:
+                    dt = parse_date_safe(date_val)
+                    if dt and dt_from <= dt <= dt_to:
+                        temp.append(row)
+            filtered = temp
+    if amount_from is not None or amount_to is not None:
+        temp = []
+        for row in filtered:
+            try:
+                amount = float(row.get("Сумма")) if row.get("Сумма") is not None else None
+                if amount is not None and not (amount == amount and -1e308 <= amount <= 1e308):
+                    amount = None
+            except Exception:
+                amount = None
+            if amount is not None:
+                if amount_from is not None and amount < amount_from:
+                    continue
+                if amount_to is not None and amount > amount_to:
+                    continue
+                temp.append(row)
+        filtered = temp
+    if gender:
+        gender_map = {"муж": "мужчина", "жен": "женщина", "male": "мужчина", "female": "женщина"}
+        accepted = {gender_map.get(g.strip().lower(), g.strip().lower()) for g in gender}
+        temp = []
+        for row in filtered:
+            g = row.get("gender")
+            if not g:
+                g = guess_gender_by_fio(row.get("ФИО"))
+            if (g.strip().lower() if g else "неизвестно") in accepted:
+                temp.append(row)
+        filtered = temp
+    if language and not any(lang.strip() == "" for lang in language):
+        lang_map = {"английский язык": "английский", "english": "английский", "other": "другой"}
+        accepted = {lang_map.get(l.strip().lower(), l.strip().lower()) for l in language}
+        temp = []
+        for row in filtered:
+            l = row.get("язык") or "неизвестно"
+            if isinstance(l, list):
+                languages = [str(lang).strip().lower() if lang else "неизвестно" for lang in l]
+            else:
+                l_str = str(l).strip().lower()
+                languages = [lang.strip() for lang in l_str.split(",")] if "," in l_str else [l_str]
+            if len(accepted) > 1:
+                should_add = sorted(languages) == sorted(accepted)
+            else:
+                should_add = any(
+                    ("другой" in accepted and l_norm not in ("казахский", "русский", "английский", "неизвестно"))
+                    or l_norm in accepted
+                    for l_norm in languages
+                )
+            if should_add:
+                temp.append(row)
+        filtered = temp
+    return [
+        {
+            key: (value if not isinstance(value, (int, float)) or (value == value and -1e308 <= value <= 1e308) else None)
+            for key, value in row.items()
+        }
+        for row in filtered
+    ]
+
+
+CASES = {
+    "источник": dict(source=["kaspi", "halyk"]),
+    "тип frequent": dict(type=["frequent"]),
+    "период": dict(date_from="01.03.2025", date_to="30.06.2025"),
+    "сумма": dict(amount_from=1000, amount_to=5000),
+    "пол": dict(gender=["жен"]),
+    "язык": dict(language=["русский"]),
+    "всё вместе": dict(
+        source=["kaspi", "сайт"], type=["periodic", "frequent"], date_from="01.02.2025", date_to="31.10.2025",
+        amount_from=1000, gender=["мужчина"], language=["казахский"],
+    ),
+}
+
+
+def timed(func) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def allocated(build) -> tuple[int, object]:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, result
+
+
+def _filled_store(rows: list[dict]) -> ExcelStore:
+    store = ExcelStore()
+    store.append(rows)
+    return store
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    # Строки создаются внутри замера — так видна память самих словарей и значений;
+    # хранилище строится из своей копии строк, после загрузки они освобождаются
+    random.seed(1)
+    list_bytes, rows = allocated(lambda: make_rows(size))
+    random.seed(1)
+    store_bytes, store = allocated(lambda: _filled_store(make_rows(size)))
+    load_seconds, _ = timed(lambda: _filled_store(rows))
+
+    print(f"строк: {size}")
+    print(f"память: список словарей {list_bytes / 2**20:,.0f} МБ, ExcelStore {store_bytes / 2**20:,.0f} МБ "
+          f"(x{list_bytes / store_bytes:.1f} меньше); загрузка в хранилище {load_seconds:.2f} с")
+    print(f"{'фильтр':<14}{'строк':>10}{'список, с':>12}{'хранилище, с':>15}{'ускорение':>11}")
+    for name, params in CASES.items():
+        old_seconds, expected = timed(lambda: legacy_apply_filters(rows, **params))
+        new_seconds, result = timed(lambda: apply_filters(store, **params))
+        assert result == expected, f"результаты не совпадают: {name}"
+        print(f"{name:<14}{len(result):>10,}{old_seconds:>12.3f}{new_seconds:>15.3f}{old_seconds / new_seconds:>10.1f}x")
+
+    # Первый поиск по полю строит индекс; дальше — поиск с изменениями строк между ними
+    print(f"{'поиск':<14}{'построение, с':>15}{'список, мс':>12}{'индекс, мс':>12}")
+    for field in ("id", "ФИО", "E-mail"):
+        keys = [row[field] for row in random.sample(rows, LOOKUPS) if row[field] is not None]
+        build_seconds, _ = timed(lambda: store.positions(field, keys[0]))
+        old_seconds, expected = timed(lambda: [[i for i, row in enumerate(rows) if row.get(field) == key] for key in keys])
+
+        def lookups():
+            found = []
+            for key in keys:
+                positions = store.positions(field, key)
+                found.append(positions.tolist())
+                store.update(int(positions[0]), {"телефон": "+7"})
+            return found
+
+        new_seconds, result = timed(lookups)
+        assert result == expected, f"результаты не совпадают: {field}"
+        print(f"{field:<14}{build_seconds:>15.3f}{old_seconds / len(keys) * 1000:>12.2f}"
+              f"{new_seconds / len(keys) * 1000:>12.3f}")
+
+    # Раньше после каждой записи группы по ФИО/E-mail считались заново по всем строкам
+    print(f"{'группы после записи':<21}{'пересчёт, мс':>14}{'хранилище, мс':>15}")
+    store.key_groups(GROUPED_FIELDS)
+
+    def write(regroup):
+        for row in make_rows(WRITES):
+            store.append([row])
+            regroup()
+
+    old_seconds, _ = timed(lambda: write(lambda: store.group_ids(np.arange(len(store)), GROUPED_FIELDS)))
+    new_seconds, _ = timed(lambda: write(lambda: store.key_groups(GROUPED_FIELDS)))
+    print(f"{'':<21}{old_seconds / WRITES * 1000:>14.1f}{new_seconds / WRITES * 1000:>15.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Бенчмарк нормализации листа: старый построчный цикл против normalize_sheet.
+
+Запуск из папки back/:
+    python -m benchmarks.bench_normalize [кол-во строк]
+"""
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.excel_normalize import MONTH_NAMES, TARGET_ROWS_PER_SEC, normalize_sheet
+
+
+def make_sheet(rows: int) -> pd.DataFrame:
+    """Синтетическая банковская выписка: даты строками, суммы с NaN/Inf."""
+    start = datetime(2024, 1, 1)
+    dates = [(start + timedelta(days=random.randint(0, 365))).strftime("%d.%m.%Y") for _ in range(rows)]
+    amounts = np.random.uniform(100, 50000, rows).round(2)
+    amounts[::97] = np.nan
+    amounts[::991] = np.inf
+    return pd.DataFrame({
+        "Дата": dates,
+        "Сумма": amounts,
+        "ФИО": [f"Донор {i % 5000}" for i in range(rows)],
+        "Месяц": "x",
+        "Дата создания": pd.Timestamp("2024-02-01"),
+    })
+
+
+def legacy_normalize(df: pd.DataFrame, sheet_name) -> list[dict]:
+    """Старый алгоритм из upload_excel (iterrows + pd.to_datetime на строку)."""
+    def get_month(date_str):
+        if not date_str or pd.isnull(date_str):
+            return None
+        date_str = str(date_str).strip()
+        if date_str.lower() in ['nan', 'nat', 'none', '']:
+            return None
+        parsed = pd.to_datetime(date_str, errors='coerce', dayfirst=True)
+        return parsed.month if pd.notnull(parsed) else None
+
+    def convert(obj):
+        if isinstance(obj, dict):
+            return {k: convert(v) for k, v in obj.items()}
+        if hasattr(obj, 'isoformat') and callable(obj.isoformat):
+            return obj.isoformat()
+        if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
+            return None
+        return obj
+
+    result = []
+    for _, row in df.iterrows():
+        row_data = row.to_dict()
+        for key in list(row_data.keys()):
+            if key.strip().lower() in ['month', 'месяц']:
+                del row_data[key]
+        date_field = None
+        for k in row_data:
+            if k.strip().lower() in ['дата', 'дата и время', 'date', 'datetime']:
+                date_field = row_data[k]
+                break
+        month_num = get_month(date_field)
+        row_data['month'] = MONTH_NAMES[month_num - 1] if month_num and 1 <= month_num <= 12 else None
+        if row_data['month'] is not None:
+            result.append(convert(row_data))
+    return result
+
+
+def measure(func, df) -> tuple[float, list[dict]]:
+    started = time.perf_counter()
+    records = func(df, "Выписка")
+    return len(df) / (time.perf_counter() - started), records
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    df = make_sheet(rows)
+    new_rate, new_records = measure(normalize_sheet, df)
+    # Старый алгоритм слишком медленный для полного прогона — меряем на срезе
+    sample = df.head(min(rows, 20_000))
+    old_rate, old_records = measure(legacy_normalize, sample)
+    assert new_records[:len(old_records)] == old_records, "результаты не совпадают"
+    print(f"строк: {rows}")
+    print(f"старый цикл:     {old_rate:>12,.0f} строк/сек")
+    print(f"normalize_sheet: {new_rate:>12,.0f} строк/сек (x{new_rate / old_rate:.1f})")
+    print(f"цель:            {TARGET_ROWS_PER_SEC:>12,} строк/сек -> {'OK' if new_rate >= TARGET_ROWS_PER_SEC else 'НЕ ДОСТИГНУТА'}")
+
+
+if __name__ == "__main__":
+    main()
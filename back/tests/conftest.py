@@ -0,0 +1,24 @@
+"""Общие фикстуры тестов: база — временный файл SQLite, а не DATABASE_URL окружения."""
+import os
+import tempfile
+
+import pytest
+
+# database.py читает DATABASE_URL при импорте, поэтому задаём его до импорта app
+_db_dir = tempfile.mkdtemp(prefix="crm_tests_")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_db_dir, "test.db")
+
+from app import models  # noqa: E402,F401 — регистрирует таблицы в Base.metadata
+from app.database import Base, SessionLocal, engine  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Сессия на пустой схеме; таблицы пересоздаются для каждого теста."""
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
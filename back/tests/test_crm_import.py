@@ -0,0 +1,83 @@
+"""Повторный импорт CRM (crm_bulk.import_entries + import_keys.RowKeyer)."""
+from app.crm_bulk import import_entries
+from app.crm_fields import extract_typed_fields
+from app.import_keys import RowKeyer
+from app.models import CRMEntry
+
+ROWS = [
+    {"ФИО": "Иванов Иван", "Сумма": 1000, "Дата": "01.02.2025"},
+    {"ФИО": "Петров Пётр", "Сумма": 500, "Дата": "03.02.2025"},
+]
+
+
+def _entries(filename: str, rows: list[dict]) -> list[dict]:
+    """Строки файла так, как их готовит upload_excel.iter_crm_entries."""
+    keyer = RowKeyer(filename)
+    return [
+        {
+            "data": row,
+            "source": filename,
+            "filename": filename,
+            "file_hash": f"sha-{filename}",
+            "row_key": keyer(row),
+            **extract_typed_fields(row),
+        }
+        for row in rows
+    ]
+
+
+def _count(db, filename: str | None = None) -> int:
+    query = db.query(CRMEntry)
+    if filename is not None:
+        query = query.filter(CRMEntry.filename == filename)
+    return query.count()
+
+
+def test_reimport_of_same_file_adds_nothing(db):
+    assert import_entries(db, _entries("a.xlsx", ROWS)) == {"inserted": 2, "updated": 0, "skipped": 0}
+    db.commit()
+    assert import_entries(db, _entries("a.xlsx", ROWS)) == {"inserted": 0, "updated": 0, "skipped": 2}
+    db.commit()
+    assert _count(db) == 2
+
+
+def test_repeated_rows_inside_file_are_kept(db):
+    counts = import_entries(db, _entries("a.xlsx", [ROWS[0], ROWS[0], ROWS[1]]))
+    db.commit()
+    assert counts["inserted"] == 3
+    assert import_entries(db, _entries("a.xlsx", [ROWS[0], ROWS[0], ROWS[1]]))["skipped"] == 3
+
+
+def test_same_content_in_other_file_is_separate_rows(db):
+    import_entries(db, _entries("a.xlsx", ROWS))
+    counts = import_entries(db, _entries("b.xlsx", ROWS))
+    db.commit()
+    assert counts == {"inserted": 2, "updated": 0, "skipped": 0}
+    assert _count(db, "a.xlsx") == 2
+    assert _count(db, "b.xlsx") == 2
+
+
+def test_upsert_updates_changed_payment_and_skip_keeps_it(db):
+    payment = {"Код платежа": "P-1", "ФИО": "Иванов Иван", "Сумма": 1000}
+    import_entries(db, _entries("a.xlsx", [payment]))
+    db.commit()
+
+    changed = {**payment, "Сумма": 1500}
+    assert import_entries(db, _entries("a.xlsx", [changed]), mode="skip") == {"inserted": 0, "updated": 0, "skipped": 1}
+    db.commit()
+    assert db.query(CRMEntry.amount).scalar() == 1000
+
+    assert import_entries(db, _entries("a.xlsx", [changed])) == {"inserted": 0, "updated": 1, "skipped": 0}
+    db.commit()
+    assert db.query(CRMEntry.amount).scalar() == 1500
+    assert _count(db) == 1
+
+
+def test_payment_repeated_in_one_batch(db):
+    first = {"Код платежа": "P-1", "ФИО": "Иванов Иван"}
+    second = {"Код платежа": "P-1", "ФИО": "Иванов И."}
+    batch = _entries("a.xlsx", [first]) + _entries("b.xlsx", [second])
+
+    assert import_entries(db, batch, mode="skip") == {"inserted": 1, "updated": 0, "skipped": 1}
+    db.commit()
+    assert db.query(CRMEntry.data).scalar() == first
@@ -0,0 +1,81 @@
+"""Keyset-пагинация списков CRM (crm_listing)."""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+from app.crm_listing import NEXT_CURSOR_HEADER, list_entries
+from app.models import CRMEntry
+
+AMOUNTS = [300, None, 100, 200, 100, None, 300, 50, 100, 200, None]
+
+
+@pytest.fixture
+def entries(db):
+    for i, amount in enumerate(AMOUNTS):
+        db.add(CRMEntry(data={"n": i}, amount=amount, payment_date=datetime(2025, 1 + i % 3, 1), source=f"s{i % 4}"))
+    db.commit()
+    return db.query(CRMEntry).order_by(CRMEntry.id).all()
+
+
+def _page(db, **params) -> tuple[list[int], str | None]:
+    """id строк страницы и курсор следующей."""
+    response = Response()
+    ids = list_entries(db, response, lambda session: session.query(CRMEntry), lambda entry: entry.id, **params)
+    return ids, response.headers.get(NEXT_CURSOR_HEADER)
+
+
+def _pages(db, sort: str | None, limit: int) -> list[int]:
+    """id всех строк, прочитанных страницами по limit с переходом по курсору."""
+    ids, after = [], None
+    while True:
+        page, after = _page(db, limit=limit, after=after, sort=sort)
+        assert len(page) <= limit
+        ids.extend(page)
+        if after is None:
+            return ids
+
+
+def _expected(entries, column: str, desc: bool) -> list[int]:
+    # NULL в конце в обоих направлениях, при равных значениях — по id
+    def key(entry):
+        value = getattr(entry, column)
+        order_id = -entry.id if desc else entry.id
+        if value is None:
+            return (1, 0, order_id)
+        return (0, -value if desc else value, order_id)
+    return [entry.id for entry in sorted(entries, key=key)]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 100])
+@pytest.mark.parametrize("sort", ["id", "-id", "amount", "-amount"])
+def test_pages_cover_all_rows_in_sort_order(db, entries, sort, limit):
+    assert _pages(db, sort, limit) == _expected(entries, sort.lstrip("-"), sort.startswith("-"))
+
+
+def test_payment_date_pages_match_full_sort(db, entries):
+    full, _ = _page(db, sort="payment_date")
+    assert _pages(db, "payment_date", 4) == full
+
+
+def test_last_page_has_no_cursor(db, entries):
+    page, after = _page(db, limit=len(entries))
+    assert len(page) == len(entries)
+    assert after is None
+
+
+def test_rows_added_between_pages_do_not_shift_them(db, entries):
+    first, after = _page(db, limit=4)
+    db.add(CRMEntry(data={"n": "new"}))
+    db.commit()
+    rest, _ = _page(db, limit=100, after=after)
+    ids = first + rest
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(entries) + 1
+
+
+def test_cursor_from_other_sort_is_rejected(db, entries):
+    _, after = _page(db, limit=2, sort="amount")
+    with pytest.raises(HTTPException) as error:
+        _page(db, limit=2, after=after, sort="-amount")
+    assert error.value.status_code == 400
@@ -0,0 +1,91 @@
+"""Снимок + журнал хранилища Excel 2025 (excel_journal): данные переживают перезапуск."""
+import os
+
+import pytest
+
+from app.excel_journal import ExcelJournal
+from app.excel_store import ExcelStore
+
+ROWS = [
+    {"id": 1, "ФИО": "Иванов Иван", "Сумма": 1000, "filename": "a.xlsx"},
+    {"id": 2, "ФИО": "Петров Пётр", "Сумма": 2.5, "язык": ["ru", "kz"], "filename": "a.xlsx"},
+    {"id": 3, "ФИО": None, "Сумма": "нет", "filename": "b.xlsx"},
+]
+
+
+def _restored(directory) -> ExcelStore:
+    store = ExcelStore()
+    journal = ExcelJournal(str(directory))
+    journal.restore(store)
+    journal.close()
+    return store
+
+
+def _assert_same(restored: ExcelStore, expected: list[dict]):
+    rows = restored.rows()
+    assert rows == expected
+    # Типы значений тоже сохраняются (1000 не становится 1000.0, список — списком)
+    assert [[type(v) for v in row.values()] for row in rows] == [[type(v) for v in row.values()] for row in expected]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ExcelStore()
+    journal = ExcelJournal(str(tmp_path), compact_bytes=1 << 30, fsync=False)
+    journal.restore(store)
+    yield store
+    journal.close()
+
+
+def test_changes_survive_restart(store, tmp_path):
+    store.append(ROWS)
+    store.append([{"id": 4, "ФИО": "Сидорова Анна", "filename": "b.xlsx"}])
+    store.update(0, {"Сумма": 1500, "комментарий": "новое поле"})
+    store.keep(store.mask("filename", None, lambda name: name != "b.xlsx"))
+    expected = store.rows()
+    store.journal.close()
+
+    _assert_same(_restored(tmp_path), expected)
+
+
+def test_snapshot_and_log_after_it(store, tmp_path):
+    store.append(ROWS)
+    store.journal.compact(store)
+    generation = store.journal.generation
+    store.update(1, {"ФИО": "Петров П."})
+    expected = store.rows()
+    store.journal.close()
+
+    assert os.path.exists(tmp_path / f"snapshot-{generation}.pkl")
+    _assert_same(_restored(tmp_path), expected)
+
+
+def test_clear_survives_restart(store, tmp_path):
+    store.append(ROWS)
+    store.clear()
+    store.append([{"id": 10, "ФИО": "После сброса"}])
+    expected = store.rows()
+    store.journal.close()
+
+    _assert_same(_restored(tmp_path), expected)
+
+
+def test_torn_last_record_is_dropped(store, tmp_path):
+    store.append(ROWS)
+    store.journal.compact(store)
+    store.update(0, {"ФИО": "Записано"})
+    expected = store.rows()
+    store.update(1, {"ФИО": "Оборвано"})
+    store.journal.close()
+    log = tmp_path / f"log-{store.journal.generation}.pkl"
+    os.truncate(log, os.path.getsize(log) - 3)
+
+    restored = _restored(tmp_path)
+    _assert_same(restored, expected)
+
+    # Журнал обрезан по целой записи: следующие изменения дописываются и читаются
+    journal = ExcelJournal(str(tmp_path), fsync=False)
+    journal.restore(restored)
+    restored.append([{"id": 5}])
+    journal.close()
+    _assert_same(_restored(tmp_path), expected + [{"id": 5}])